@@ -2,30 +2,46 @@ import tkinter as tk
 from tkinter import ttk, messagebox
 import sqlite3
 import traceback
-from tkcalendar import DateEntry
 from datetime import datetime, timedelta
-import gspread
-from google.oauth2.service_account import Credentials
 import os
 import json
 import sys
-import updater
-from docx import Document
-from docx.shared import Pt, Cm
-from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
-from docx.oxml.ns import qn
-from docx.oxml import OxmlElement
+from sheets_sync import SheetPusher
+from client_keys import identity_key, sort_key, russian_collation, normalize_name, split_fio
+from dedupe import find_duplicate_candidates, merge_clients
+from change_watcher import ChangeWatcher
+from startup import StartupPipeline
+from warm_start import ClientSnapshot
+import migrations
+from chat_outbox import ChatOutbox
+from presence import HEARTBEAT_INTERVAL
 from tkinter import simpledialog
 import time
-import requests
+import random
 import threading
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left, insort
 from datetime import datetime
+from lazy_import import LazyModule
+
+# Тяжёлые модули, нужные не при каждом запуске, загружаются при первом
+# обращении (python-docx и gspread импортируются прямо в функциях экспорта
+# и синхронизации). При сборке exe они перечислены в --hidden-import
+tkcalendar = LazyModule("tkcalendar")
+http_client = LazyModule("http_client")
+updater = LazyModule("updater")
 
 # ================== Пути ==================
 APP_DIR = os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp")
 os.makedirs(APP_DIR, exist_ok=True)
 
 DB_NAME = os.path.join(APP_DIR, "clients.db")
+# Время этапов каждого запуска (python startup.py — отчёт по последним запускам)
+STARTUP_LOG = os.path.join(APP_DIR, "startup_times.jsonl")
+# Первая страница таблицы на момент выхода — показывается при запуске до чтения базы
+CLIENT_SNAPSHOT = ClientSnapshot(os.path.join(APP_DIR, "client_snapshot.json"))
 SHEET_ID = "1_DfTT8yzCjP0VH0PZu1Fz6FYMm1eRr7c0TmZU2DrH_w"
 
 # ================== ИМПОРТ МЕНЕДЖЕРА АУТЕНТИФИКАЦИИ ==================
@@ -113,22 +129,27 @@ def show_notifications():
 
 def show_statistics():
     """Показать статистику по клиентам"""
-    clients = get_all_clients(limit=10000)
+    clients = list(iter_all_clients())
     total = len(clients)
     
     today = datetime.today().date()
     active = 0
     expired = 0
     soon = 0
-    groups = {}
+    
+    # Группы в русском алфавитном порядке (без учёта регистра и «ё»)
+    with connect_db() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT COALESCE(NULLIF(group_name, ''), 'Без группы') AS grp, COUNT(*)
+            FROM clients
+            GROUP BY grp
+            ORDER BY grp COLLATE RU
+        """)
+        groups = cur.fetchall()
     
     for client in clients:
         ippcu_end = client[8]
-        group = client[9] or "Без группы"
-        
-        if group not in groups:
-            groups[group] = 0
-        groups[group] += 1
         
         if ippcu_end:
             try:
@@ -151,15 +172,15 @@ def show_statistics():
 
 📂 РАСПРЕДЕЛЕНИЕ ПО ГРУППАМ:"""
     
-    for group, count in sorted(groups.items()):
+    for group, count in groups:
         percentage = (count / total) * 100 if total > 0 else 0
         stats_text += f"\n├─ {group}: {count} чел. ({percentage:.1f}%)"
     
     messagebox.showinfo("📊 Статистика", stats_text)
 
-def check_expiring_ippcu():
-    """Проверка истекающих ИППСУ при запуске"""
-    clients = get_all_clients(limit=10000)
+def collect_ippcu_warnings():
+    """Строки предупреждения об истекающих и просроченных ИППСУ (без окон, можно из потока)"""
+    clients = list(iter_all_clients())
     today = datetime.today().date()
     
     expiring = []
@@ -190,7 +211,9 @@ def check_expiring_ippcu():
         messages.append(f"⚠️ ИСТЕКАЮТ {len(expiring)} ИППСУ в течение недели!")
         for client, days in expiring[:3]:
             messages.append(f"   {client[1]} {client[2]} - осталось {days} дн.")
-    
+    return messages
+
+def show_ippcu_warnings(messages):
     if messages:
         messagebox.showwarning("Внимание!", "\n".join(messages))
 
@@ -213,6 +236,10 @@ def export_selected_to_word():
     if not date_range:
         return
 
+    from docx import Document
+    from docx.shared import Pt, Cm
+    from docx.enum.text import WD_PARAGRAPH_ALIGNMENT
+
     doc = Document()
 
     # Убираем автоматические разрывы страниц
@@ -289,6 +316,7 @@ def export_selected_to_word():
         if values[0] == "X":
             values[0] = " "
             tree.item(row_id, values=values)
+    forget_sort_order("✓")
     
     if hasattr(root, 'update_word_count'):
         root.update_word_count()
@@ -311,6 +339,7 @@ def add_to_word_list(item):
     values = list(tree.item(item, "values"))
     values[0] = "X" if values[0].strip() == "" else " "
     tree.item(item, values=values)
+    forget_sort_order("✓")
     
     action = "добавлен в" if values[0] == "X" else "удален из"
     show_status_message(f"Клиент {action} списка для Word")
@@ -470,6 +499,8 @@ def show_login_window():
     button_frame.pack(fill='x', pady=10)
     
     def attempt_login():
+        if str(login_btn['state']) == 'disabled':
+            return  # предыдущая проверка ещё идёт
         username = login_var.get().strip()
         password = password_var.get()
         
@@ -479,8 +510,29 @@ def show_login_window():
             messagebox.showerror("Ошибка", "Введите логин и пароль")
             return
         
+        # Проверка пароля намеренно медленная — выполняем её в фоне,
+        # чтобы окно не замирало
+        login_btn.config(state='disabled', text="Проверка...")
+        remember = remember_var.get()
+        
+        def worker():
+            try:
+                result = auth_manager.login(username, password, remember)
+            except Exception as e:
+                result = e
+            root.after(0, finish_login, result)
+        
+        threading.Thread(target=worker, daemon=True).start()
+    
+    def finish_login(result):
+        """Результат проверки из фонового потока, в потоке Tk"""
+        if not login_window.winfo_exists():
+            return
+        login_btn.config(state='normal', text="Войти")
         try:
-            success, message = auth_manager.login(username, password, remember_var.get())
+            if isinstance(result, Exception):
+                raise result
+            success, message = result
             
             if success:
                 print("DEBUG: Login successful!")  # ДЕБАГ
@@ -1206,19 +1258,6 @@ def setup_modern_style():
 # ----------------------
 # --- Утилиты ФИО ------
 # ----------------------
-def split_fio(fio: str):
-    if not fio:
-        return "", "", ""
-    parts = fio.strip().split()
-    if len(parts) == 1:
-        return parts[0], "", ""
-    if len(parts) == 2:
-        return parts[0], parts[1], ""
-    last = parts[0]
-    first = parts[1]
-    middle = " ".join(parts[2:])
-    return last, first, middle
-
 def join_fio(last, first, middle):
     parts = [p for p in (last or "", first or "", middle or "") if p and p.strip()]
     return " ".join(parts)
@@ -1231,20 +1270,9 @@ def init_db():
     print(f"🔄 Инициализация базы данных: {DB_NAME}")
     
     try:
-        # Удаляем все возможные файлы блокировок
-        lock_files = [
-            DB_NAME + "-shm", 
-            DB_NAME + "-wal",
-            DB_NAME + "-journal"
-        ]
-        
-        for lock_file in lock_files:
-            if os.path.exists(lock_file):
-                try:
-                    os.remove(lock_file)
-                    print(f"🗑️ Удален файл блокировки: {lock_file}")
-                except Exception as e:
-                    print(f"⚠️ Не удалось удалить {lock_file}: {e}")
+        # Файлы -journal и -wal рядом с базой не удаляются: горячий журнал
+        # после сбоя нужен SQLite, чтобы откатить незавершённую транзакцию
+        # (в том числе шаг миграции), а в -wal лежат подтверждённые записи
         
         # Подключаемся к базе с настройками, исключающими блокировки
         conn = sqlite3.connect(DB_NAME, timeout=30.0, check_same_thread=False)
@@ -1255,108 +1283,18 @@ def init_db():
         conn.execute("PRAGMA synchronous=NORMAL")
         conn.execute("PRAGMA cache_size=10000")
         
-        cur = conn.cursor()
-        
-        # Проверяем существование таблицы clients
-        cur.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name='clients'
-        """)
-        table_exists = cur.fetchone() is not None
-        
-        if not table_exists:
-            print("📦 Создаем таблицу clients...")
-            cur.execute("""
-                CREATE TABLE clients (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    last_name TEXT NOT NULL,
-                    first_name TEXT NOT NULL,
-                    middle_name TEXT,
-                    dob TEXT NOT NULL,
-                    phone TEXT,
-                    contract_number TEXT,
-                    ippcu_start TEXT,
-                    ippcu_end TEXT,
-                    group_name TEXT,
-                    UNIQUE(last_name, first_name, middle_name, dob)
-                )
-            """)
-            conn.commit()
-            print("✅ Таблица clients создана успешно")
-            conn.close()
-            return True
-
-        # Проверяем структуру существующей таблицы
-        cur.execute("PRAGMA table_info(clients)")
-        cols = [r[1] for r in cur.fetchall()]
-
-        # Если есть старая схема с полем fio - мигрируем
-        if "fio" in cols and "last_name" not in cols:
-            print("🔄 Мигрируем старую схему...")
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS clients_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    last_name TEXT NOT NULL,
-                    first_name TEXT NOT NULL,
-                    middle_name TEXT,
-                    dob TEXT NOT NULL,
-                    phone TEXT,
-                    contract_number TEXT,
-                    ippcu_start TEXT,
-                    ippcu_end TEXT,
-                    group_name TEXT,
-                    UNIQUE(last_name, first_name, middle_name, dob)
-                )
-            """)
-            
-            # Переносим данные
-            cur.execute("SELECT id, fio, dob, phone, contract_number, ippcu_start, ippcu_end, group_name FROM clients")
-            rows = cur.fetchall()
-            
-            migrated_count = 0
-            for row in rows:
-                try:
-                    cid, fio, dob, phone, contract, ippcu_start, ippcu_end, group_name = row
-                    last, first, middle = split_fio(fio or "")
-                    cur.execute("""
-                        INSERT OR IGNORE INTO clients_new
-                        (id, last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    """, (cid, last, first, middle, dob or "", phone, contract, ippcu_start, ippcu_end, group_name))
-                    migrated_count += 1
-                except Exception as e:
-                    print(f"⚠️ Ошибка миграции записи: {e}")
-                    continue
-            
-            cur.execute("DROP TABLE clients")
-            cur.execute("ALTER TABLE clients_new RENAME TO clients")
-            conn.commit()
-            print(f"✅ Миграция завершена. Перенесено записей: {migrated_count}")
-
-        # Добавляем отсутствующие колонки
-        missing_columns = []
-        if "last_name" not in cols:
-            missing_columns.append("last_name TEXT DEFAULT ''")
-        if "first_name" not in cols:
-            missing_columns.append("first_name TEXT DEFAULT ''") 
-        if "middle_name" not in cols:
-            missing_columns.append("middle_name TEXT DEFAULT ''")
-        
-        for col_def in missing_columns:
-            try:
-                col_name = col_def.split()[0]
-                cur.execute(f"ALTER TABLE clients ADD COLUMN {col_def}")
-                print(f"✅ Добавлена колонка: {col_name}")
-            except Exception as e:
-                print(f"⚠️ Не удалось добавить колонку {col_def}: {e}")
-        
-        if missing_columns:
-            conn.commit()
-        
+        # Схема доводится до последней версии; в актуальной базе это одно
+        # чтение PRAGMA user_version
+        migrations.migrate(conn)
         conn.close()
         print("✅ База данных инициализирована успешно")
         return True
-            
+    
+    except migrations.MigrationError:
+        # Шаг миграции откачен, база цела — её нельзя пересоздавать
+        # аварийным восстановлением, иначе пропадут клиенты
+        conn.close()
+        raise
     except Exception as e:
         print(f"❌ Ошибка инициализации БД: {e}")
         # Пробуем аварийное восстановление
@@ -1402,23 +1340,7 @@ def emergency_db_recovery():
         conn.execute("PRAGMA journal_mode=DELETE")
         conn.execute("PRAGMA locking_mode=NORMAL")
         
-        cur = conn.cursor()
-        cur.execute("""
-            CREATE TABLE clients (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                last_name TEXT NOT NULL,
-                first_name TEXT NOT NULL,
-                middle_name TEXT,
-                dob TEXT NOT NULL,
-                phone TEXT,
-                contract_number TEXT,
-                ippcu_start TEXT,
-                ippcu_end TEXT,
-                group_name TEXT,
-                UNIQUE(last_name, first_name, middle_name, dob)
-            )
-        """)
-        conn.commit()
+        migrations.migrate(conn)
         conn.close()
         
         print("✅ Аварийное восстановление завершено успешно")
@@ -1456,84 +1378,193 @@ def create_minimal_db():
         print(f"❌ Не удалось создать минимальную базу: {e}")
         return False
 
+def connect_db():
+    """Подключение к базе клиентов с русским правилом сравнения COLLATE RU"""
+    conn = sqlite3.connect(DB_NAME)
+    conn.create_collation("RU", russian_collation)
+    return conn
+
+def now_stamp():
+    """Отметка времени изменения записи (сортируется как строка)"""
+    return datetime.now().isoformat(timespec="microseconds")
+
+def find_duplicate(last_name, first_name, middle_name, dob, exclude_id=None, cur=None):
+    """ID клиента с тем же ключом идентичности (поиск по уникальному индексу)"""
+    key = identity_key(last_name, first_name, middle_name, dob)
+    if cur is None:
+        with sqlite3.connect(DB_NAME) as conn:
+            return find_duplicate(last_name, first_name, middle_name, dob, exclude_id, conn.cursor())
+
+    cur.execute("SELECT id FROM clients WHERE identity_key = ?", (key,))
+    row = cur.fetchone()
+    if row and (exclude_id is None or str(row[0]) != str(exclude_id)):
+        return row[0]
+    return None
+
 def add_client(last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group):
-    """Добавление с проверкой дублей (по ФИО+дата рождения, без учёта регистра)."""
+    """Добавление с проверкой дублей (по ФИО+дата рождения, без учёта регистра и «ё»)."""
     with sqlite3.connect(DB_NAME) as conn:
         cur = conn.cursor()
         middle_name = middle_name or ""
         dob_val = dob or ""
+        duplicate_error = ValueError(
+            f"Клиент '{join_fio(last_name, first_name, middle_name)}' с датой рождения {dob_val} уже есть в базе.")
 
-        cur.execute(
-            """
-            SELECT id FROM clients
-            WHERE lower(last_name)=lower(?) AND lower(first_name)=lower(?) AND lower(COALESCE(middle_name,''))=lower(?) AND dob=?
-            """,
-            (last_name, first_name, middle_name, dob_val)
-        )
-        if cur.fetchone():
-            raise ValueError(f"Клиент '{join_fio(last_name, first_name, middle_name)}' с датой рождения {dob_val} уже есть в базе.")
+        if find_duplicate(last_name, first_name, middle_name, dob_val, cur=cur):
+            raise duplicate_error
 
-        cur.execute(
-            """
-            INSERT INTO clients (last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """,
-            (last_name, first_name, middle_name, dob_val, phone, contract_number, ippcu_start, ippcu_end, group),
-        )
+        try:
+            cur.execute(
+                """
+                INSERT INTO clients (last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name,
+                                     updated_at, identity_key, sort_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (last_name, first_name, middle_name, dob_val, phone, contract_number, ippcu_start, ippcu_end, group,
+                 now_stamp(), identity_key(last_name, first_name, middle_name, dob_val),
+                 sort_key(last_name, first_name, middle_name)),
+            )
+        except sqlite3.IntegrityError:
+            raise duplicate_error
         conn.commit()
 
-def get_all_clients(limit=200):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        cur.execute(
-            """
-            SELECT id, last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name
-            FROM clients
-            ORDER BY lower(last_name), lower(first_name)
-            LIMIT ?
-            """,
-            (limit,),
-        )
-        return cur.fetchall()
-
-def search_clients(query="", date_from=None, date_to=None, limit=200):
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        q = (query or "").strip().lower()
+CLIENT_COLUMNS = "id, last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name"
+CLIENT_FIELDS = tuple(CLIENT_COLUMNS.split(", "))
+PAGE_SIZE = 200
+
+# Поля, по которым таблицу можно отсортировать запросом к индексу
+# Индексы для этих колонок создаются миграцией migrations.create_client_indexes
+ORDERABLE_FIELDS = {
+    "Имя": "first_name",
+    "Отчество": "middle_name",
+    "Дата рождения": "dob",
+    "Телефон": "phone",
+    "Номер договора": "contract_number",
+    "Дата начала ИППСУ": "ippcu_start",
+    "Дата окончания ИППСУ": "ippcu_end",
+    "Группа": "group_name",
+}
+DEFAULT_ORDER = ("Фамилия", False)
+
+def order_expression(column):
+    """SQL-выражение сортировки для колонки таблицы (совпадает с выражением индекса)"""
+    if column == "ID":
+        return "id"
+    if column in ORDERABLE_FIELDS:
+        return f"COALESCE({ORDERABLE_FIELDS[column]}, '')"
+    return "sort_key"
+
+def client_filter_sql(query="", date_from=None, date_to=None):
+    """Условие WHERE и параметры для поиска клиентов"""
+    conditions = []
+    params = []
+
+    q = (query or "").strip().lower()
+    if q:
         like = f"%{q}%"
-
-        sql = """
-            SELECT id, last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name
-            FROM clients
-            WHERE ( lower(last_name) LIKE ? OR lower(first_name) LIKE ? OR lower(COALESCE(middle_name,'')) LIKE ?
-                   OR lower(contract_number) LIKE ? OR lower(phone) LIKE ? OR lower(COALESCE(group_name,'')) LIKE ? )
-        """
-        params = [like, like, like, like, like, like]
-
-        if date_from:
-            sql += " AND DATE(ippcu_end) >= DATE(?) "
-            params.append(date_from)
-        if date_to:
-            sql += " AND DATE(ippcu_end) <= DATE(?) "
-            params.append(date_to)
-
-        sql += " ORDER BY lower(last_name), lower(first_name) LIMIT ?"
-        params.append(limit)
-
+        # sort_key хранит ФИО в нормализованном виде, поэтому поиск по нему
+        # не зависит от регистра кириллицы и «ё»
+        name_like = "%" + normalize_name(query).replace(" ", "\x1f") + "%"
+        conditions.append("""(
+            sort_key LIKE ?
+            OR lower(last_name) LIKE ?
+            OR lower(first_name) LIKE ?
+            OR lower(COALESCE(middle_name,'')) LIKE ?
+            OR lower(last_name || ' ' || first_name || ' ' || COALESCE(middle_name,'')) LIKE ?
+            OR lower(contract_number) LIKE ?
+            OR lower(phone) LIKE ?
+            OR lower(COALESCE(group_name,'')) LIKE ?
+        )""")
+        params += [name_like, like, like, like, like, like, like, like]
+
+    if date_from:
+        conditions.append("DATE(ippcu_end) >= DATE(?)")
+        params.append(date_from)
+    if date_to:
+        conditions.append("DATE(ippcu_end) <= DATE(?)")
+        params.append(date_to)
+
+    return conditions, params
+
+def fetch_clients_page(query="", date_from=None, date_to=None, after=None, limit=PAGE_SIZE, order=DEFAULT_ORDER):
+    """Страница клиентов в заданном порядке, начиная после курсора.
+
+    По умолчанию порядок (sort_key, id). Курсор — пара (значение сортировки, id)
+    последней показанной записи, поэтому каждая страница читается диапазоном
+    индекса и стоит одинаково на любой глубине. order — (колонка, по убыванию).
+    Возвращает (строки, курсор следующей страницы или None).
+    """
+    column, descending = order
+    expr = order_expression(column)
+    conditions, params = client_filter_sql(query, date_from, date_to)
+    if after is not None:
+        # Форма «expr >= ? AND (expr > ? OR id > ?)» даёт поиск по диапазону
+        # и для индексов по выражению, в отличие от сравнения пар (expr, id) > (?, ?)
+        cmp, cmp_eq = ("<", "<=") if descending else (">", ">=")
+        conditions.append(f"{expr} {cmp_eq} ? AND ({expr} {cmp} ? OR id {cmp} ?)")
+        params += [after[0], after[0], after[1]]
+
+    direction = " DESC" if descending else ""
+    sql = f"SELECT {CLIENT_COLUMNS}, {expr} FROM clients"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {expr}{direction}, id{direction} LIMIT ?"
+    params.append(limit + 1)
+
+    with connect_db() as conn:
+        cur = conn.cursor()
         cur.execute(sql, params)
-        return cur.fetchall()
+        rows = cur.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = (rows[-1][10], rows[-1][0])
+    return [row[:10] for row in rows], next_cursor
+
+def iter_all_clients(query="", date_from=None, date_to=None):
+    """Все клиенты постранично (для статистики и проверок)"""
+    cursor = None
+    while True:
+        rows, cursor = fetch_clients_page(query, date_from, date_to, after=cursor, limit=1000)
+        yield from rows
+        if cursor is None:
+            break
+
+def get_all_clients(limit=PAGE_SIZE, after=None):
+    return fetch_clients_page(after=after, limit=limit)[0]
+
+def search_clients(query="", date_from=None, date_to=None, limit=PAGE_SIZE, after=None):
+    return fetch_clients_page(query, date_from, date_to, after=after, limit=limit)[0]
+
+def get_client(cid):
+    """Строка клиента (CLIENT_COLUMNS) по ID или None"""
+    with sqlite3.connect(DB_NAME) as conn:
+        return conn.execute(f"SELECT {CLIENT_COLUMNS} FROM clients WHERE id = ?", (cid,)).fetchone()
 
 def update_client(cid, last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group):
     with sqlite3.connect(DB_NAME) as conn:
         cur = conn.cursor()
-        cur.execute(
-            """
-            UPDATE clients
-            SET last_name=?, first_name=?, middle_name=?, dob=?, phone=?, contract_number=?, ippcu_start=?, ippcu_end=?, group_name=?
-            WHERE id=?
-            """,
-            (last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group, cid),
-        )
+        duplicate_error = ValueError(
+            f"Клиент '{join_fio(last_name, first_name, middle_name)}' с датой рождения {dob} уже есть в базе.")
+
+        if find_duplicate(last_name, first_name, middle_name, dob, exclude_id=cid, cur=cur):
+            raise duplicate_error
+
+        try:
+            cur.execute(
+                """
+                UPDATE clients
+                SET last_name=?, first_name=?, middle_name=?, dob=?, phone=?, contract_number=?, ippcu_start=?, ippcu_end=?, group_name=?,
+                    updated_at=?, identity_key=?, sort_key=?
+                WHERE id=?
+                """,
+                (last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group,
+                 now_stamp(), identity_key(last_name, first_name, middle_name, dob),
+                 sort_key(last_name, first_name, middle_name), cid),
+            )
+        except sqlite3.IntegrityError:
+            raise duplicate_error
         conn.commit()
 
 def delete_client(cid):
@@ -1543,8 +1574,11 @@ def delete_client(cid):
         conn.commit()
 
 # ================== Google Sheets ==================
-def get_gsheet(sheet_id, sheet_name="Лист1"):
-    scopes = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+def get_gsheet(sheet_id, sheet_name="Лист1", readonly=True):
+    if readonly:
+        scopes = ["https://www.googleapis.com/auth/spreadsheets.readonly"]
+    else:
+        scopes = ["https://www.googleapis.com/auth/spreadsheets"]
     creds_json = os.getenv("GOOGLE_CREDENTIALS")
 
     if not creds_json:
@@ -1558,6 +1592,9 @@ def get_gsheet(sheet_id, sheet_name="Лист1"):
         with open(creds_path, "r", encoding="utf-8") as f:
             creds_json = f.read()
 
+    import gspread
+    from google.oauth2.service_account import Credentials
+
     creds = Credentials.from_service_account_info(json.loads(creds_json), scopes=scopes)
     client = gspread.authorize(creds)
     sheet = client.open_by_key(sheet_id).worksheet(sheet_name)
@@ -1589,77 +1626,595 @@ def import_from_gsheet():
         traceback.print_exc()
         messagebox.showerror("Ошибка", f"Не удалось импортировать:\n{e}")
 
+def export_to_gsheet():
+    """Выгрузка изменённых клиентов обратно в Google Sheets (в фоне)"""
+    if getattr(root, 'gsheet_push_running', False):
+        show_status_message("Выгрузка в Google Sheets уже выполняется")
+        return
+    root.gsheet_push_running = True
+    show_status_message("Выгрузка в Google Sheets...", duration=60000)
+
+    def report_progress(updated, added):
+        root.after(0, lambda: show_status_message(
+            f"Выгрузка: обновлено {updated}, добавлено {added}...", duration=60000))
+
+    def worker():
+        try:
+            sheet = get_gsheet(SHEET_ID, readonly=False)
+            pusher = SheetPusher(DB_NAME, sheet, sheet_key=f"{SHEET_ID}/Лист1")
+            updated, added, removed = pusher.push(progress=report_progress)
+
+            def done():
+                root.gsheet_push_running = False
+                show_status_message("Выгрузка в Google Sheets завершена")
+                messagebox.showinfo("Успех", f"Выгрузка в Google Sheets завершена!\n"
+                                             f"Обновлено строк: {updated}\nДобавлено строк: {added}\n"
+                                             f"Убрано строк удалённых клиентов: {removed}")
+            root.after(0, done)
+        except Exception as e:
+            traceback.print_exc()
+
+            def failed(error=e):
+                root.gsheet_push_running = False
+                messagebox.showerror("Ошибка", f"Не удалось выгрузить (продолжится с того же места):\n{error}")
+            root.after(0, failed)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+# ================== ПОИСК ДУБЛЕЙ ==================
+def find_duplicates_job():
+    """Фоновый поиск похожих клиентов по всей базе"""
+    if getattr(root, 'dedupe_running', False):
+        show_status_message("Поиск дублей уже выполняется")
+        return
+    root.dedupe_running = True
+    show_status_message("Поиск дублей...", duration=600000)
+
+    def worker():
+        try:
+            started = time.time()
+            candidates = find_duplicate_candidates(
+                DB_NAME, progress=lambda text: root.after(0, lambda: show_status_message(text, duration=600000)))
+            elapsed = time.time() - started
+            print(f"👥 Поиск дублей: {len(candidates)} кандидатов за {elapsed:.1f} с")
+
+            def done():
+                root.dedupe_running = False
+                show_status_message(f"Найдено возможных дублей: {len(candidates)}")
+                show_duplicates_window(candidates)
+            root.after(0, done)
+        except Exception as e:
+            traceback.print_exc()
+
+            def failed(error=e):
+                root.dedupe_running = False
+                messagebox.showerror("Ошибка", f"Не удалось выполнить поиск дублей:\n{error}")
+            root.after(0, failed)
+
+    threading.Thread(target=worker, daemon=True).start()
+
+def show_duplicates_window(candidates):
+    """Окно со списком кандидатов на объединение"""
+    if not candidates:
+        messagebox.showinfo("Поиск дублей", "Похожих клиентов не найдено")
+        return
+
+    with sqlite3.connect(DB_NAME) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id, last_name, first_name, middle_name, dob FROM clients")
+        clients = {row[0]: row[1:] for row in cur.fetchall()}
+
+    def describe(cid):
+        last, first, middle, dob = clients.get(cid, ("?", "", "", ""))
+        return f"{join_fio(last, first, middle)} ({dob}) [ID {cid}]"
+
+    win = tk.Toplevel(root)
+    win.title("👥 Возможные дубли")
+    win.geometry("1000x500")
+    win.configure(bg=ModernStyle.COLORS['background'])
+
+    columns = ("Сходство", "Клиент 1", "Клиент 2", "Отличия")
+    frame = tk.Frame(win, bg=ModernStyle.COLORS['background'])
+    frame.pack(fill='both', expand=True, padx=10, pady=10)
+    scrollbar = ttk.Scrollbar(frame)
+    scrollbar.pack(side='right', fill='y')
+    dup_tree = ttk.Treeview(frame, columns=columns, show="headings",
+                            style='Modern.Treeview', yscrollcommand=scrollbar.set)
+    dup_tree.pack(side='left', fill='both', expand=True)
+    scrollbar.config(command=dup_tree.yview)
+    for col, width in zip(columns, (80, 330, 330, 240)):
+        dup_tree.heading(col, text=col)
+        dup_tree.column(col, width=width)
+
+    pairs = {}
+    for score, a, b, reasons in candidates:
+        item = dup_tree.insert("", "end", values=(f"{score * 100:.0f}%", describe(a), describe(b), reasons))
+        pairs[item] = (a, b)
+
+    def merge(keep_first):
+        selected = dup_tree.selection()
+        if not selected:
+            messagebox.showwarning("Ошибка", "Выберите пару для объединения", parent=win)
+            return
+        if auth_manager and not auth_manager.has_permission('delete'):
+            messagebox.showerror("Ошибка", "Недостаточно прав для объединения", parent=win)
+            return
+        a, b = pairs[selected[0]]
+        keep_id, drop_id = (a, b) if keep_first else (b, a)
+        if not messagebox.askyesno("Объединить",
+                                   f"Оставить:\n{describe(keep_id)}\n\nУдалить:\n{describe(drop_id)}",
+                                   parent=win):
+            return
+        try:
+            merge_clients(DB_NAME, keep_id, drop_id)
+        except ValueError as ve:
+            messagebox.showwarning("Объединение", str(ve), parent=win)
+            return
+        # Убираем все пары, где участвовала удалённая карточка
+        for item, (x, y) in list(pairs.items()):
+            if drop_id in (x, y):
+                dup_tree.delete(item)
+                del pairs[item]
+        refresh_tree()
+        show_status_message("Карточки клиентов объединены")
+
+    button_frame = tk.Frame(win, bg=ModernStyle.COLORS['background'])
+    button_frame.pack(fill='x', padx=10, pady=(0, 10))
+    ttk.Button(button_frame, text="Оставить клиента 1", style='Primary.TButton',
+               command=lambda: merge(True)).pack(side='left', padx=(0, 10))
+    ttk.Button(button_frame, text="Оставить клиента 2", style='Secondary.TButton',
+               command=lambda: merge(False)).pack(side='left')
+    ttk.Button(button_frame, text="Закрыть", style='Secondary.TButton',
+               command=win.destroy).pack(side='right')
+
 # ================== СИСТЕМА ЧАТА ==================
+class MessageCache:
+    """Кольцевой буфер последних сообщений чата по id сервера.
+    
+    Хранит не больше capacity сообщений; при переполнении вытесняются самые
+    старые. Сообщения приходят по курсору без пропусков, поэтому буфер —
+    непрерывный хвост истории и страницы из него можно отдавать как есть.
+    """
+    def __init__(self, capacity=500):
+        self.capacity = capacity
+        self.ids = []
+        self.by_id = {}
+        self.lock = threading.Lock()
+        
+    def add(self, messages):
+        """Добавить сообщения; возвращает только те, которых ещё не было"""
+        added = []
+        with self.lock:
+            for msg in messages:
+                message_id = msg.get('id')
+                if message_id is None or message_id in self.by_id:
+                    continue
+                insort(self.ids, message_id)
+                self.by_id[message_id] = msg
+                added.append(msg)
+            excess = len(self.ids) - self.capacity
+            if excess > 0:
+                for message_id in self.ids[:excess]:
+                    del self.by_id[message_id]
+                del self.ids[:excess]
+        return added
+        
+    def before(self, before_id, limit):
+        """Страница перед before_id из буфера или None, если её там нет целиком"""
+        with self.lock:
+            end = bisect_left(self.ids, before_id)
+            if end < limit:
+                return None
+            return [self.by_id[i] for i in self.ids[end - limit:end]]
+        
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+            self.by_id.clear()
+
 class ChatManager:
+    # Сервер держит длинный запрос до появления сообщений, но не дольше этого
+    LONG_POLL_WAIT = 25
+    # Интервал обычного опроса, если сервер не поддерживает длинный опрос
+    POLL_INTERVAL = 5
+    # Как часто в режиме опроса снова пробовать длинный опрос
+    PUSH_RETRY_INTERVAL = 300
+    MAX_BACKOFF = 60
+    # Сколько страниц догружать подряд, если сервер отдал не всё после курсора
+    MAX_BACKFILL_PAGES = 20
+    # Сколько сообщений из очереди уходит одним запросом и сколько ждать,
+    # пока соберётся пачка (например, серия автоматических напоминаний)
+    SEND_BATCH = 50
+    SEND_LINGER = 0.2
+
     def __init__(self):
         self.server_url = settings_manager.get('chat_server_url', 'http://localhost:5000')
         self.current_user = None
-        self.messages = []
+        self.messages = MessageCache()
         self.last_update = datetime.now()
+        # Курсор, выданный сервером: id последнего полученного сообщения.
+        # None — сервер старый и не выдаёт id, тогда работаем по времени.
+        self.last_id = None
+        self.push_supported = False
+        self._cursor_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._listener = None
+        # Исходящие сообщения сначала сохраняются локально, затем уходят в фоне
+        self.outbox = ChatOutbox(DB_NAME)
+        self._send_event = threading.Event()
+        self._sender = None
+        self._presence = None
+        # Разовые запросы окна чата (первая загрузка, обновление, старые
+        # сообщения) — в одном фоновом потоке по очереди, не в потоке Tk
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-fetch")
         
     def set_current_user(self, user_info):
         """Установить текущего пользователя для чата"""
         self.current_user = user_info
         
     def send_message(self, message_text):
-        """Отправить сообщение в чат"""
+        """Поставить сообщение в очередь отправки.
+        
+        Сеть здесь не используется: сообщение записывается в локальную
+        очередь, а доставляет его фоновый поток. Возвращает (True, запись
+        очереди) для показа сообщения как ожидающего.
+        """
         if not self.current_user:
             return False, "Пользователь не авторизован"
             
         try:
-            response = requests.post(f"{self.server_url}/send_message", json={
-                'user': self.current_user['full_name'],
-                'message': message_text,
-                'timestamp': datetime.now().isoformat()
-            }, timeout=5)
+            entry = self.outbox.enqueue(self.current_user['full_name'], message_text)
+        except sqlite3.Error as e:
+            return False, f"Не удалось сохранить сообщение: {e}"
+        self._send_event.set()
+        return True, entry
+        
+    def start_sending(self, on_delivered, on_rejected=None):
+        """Запустить фоновую отправку очереди.
+        
+        on_delivered получает подтверждённые сервером сообщения,
+        on_rejected — записи очереди, которые сервер не принял.
+        Оба вызываются из фонового потока.
+        """
+        if self._sender and self._sender.is_alive():
+            return
+        self._stop_event.clear()
+        self._sender = threading.Thread(target=self._send_loop,
+                                        args=(on_delivered, on_rejected), daemon=True)
+        self._sender.start()
+        
+    def _send_loop(self, on_delivered, on_rejected):
+        """Цикл отправки: пачки из очереди, повтор по расписанию очереди"""
+        while not self._stop_event.is_set():
+            try:
+                batch = self.outbox.due(self.SEND_BATCH)
+                if not batch:
+                    self._send_event.wait(self.outbox.next_due_in())
+                    self._send_event.clear()
+                    # Даём серии сообщений собраться, чтобы уйти одним запросом
+                    self._stop_event.wait(self.SEND_LINGER)
+                    continue
+                delivered, rejected = self._flush(batch)
+            except sqlite3.Error as e:
+                print(f"Ошибка очереди отправки чата: {e}")
+                self._stop_event.wait(self.POLL_INTERVAL)
+                continue
             
+            for callback, items in ((on_delivered, delivered), (on_rejected, rejected)):
+                if callback and items:
+                    try:
+                        callback(items)
+                    except Exception as e:
+                        print(f"Ошибка обработки отправленных сообщений: {e}")
+                        
+    def _flush(self, batch):
+        """Отправить пачку из очереди одним запросом.
+        
+        Возвращает (подтверждённые сообщения сервера, отклонённые записи).
+        При ошибке сети или сервера вся пачка откладывается на повтор.
+        """
+        keys = [entry['client_key'] for entry in batch]
+        payload = [{'user': e['user'], 'message': e['message'], 'client_key': e['client_key']}
+                   for e in batch]
+        try:
+            response = http_client.post('chat_send', f"{self.server_url}/send_messages",
+                                        json={'messages': payload})
+        except http_client.RequestException as e:
+            print(f"⚠️ Сообщения чата не отправлены ({len(batch)}), повтор позже: {e}")
+            self.outbox.mark_retry(keys, e)
+            return [], []
+        
+        if response.status_code in (404, 405):
+            # Сервер без пакетной отправки
+            return self._flush_one_by_one(batch)
+        if response.status_code == 400:
+            if len(batch) > 1:
+                # Пачка отклонена из-за одного сообщения — выясняем, какого
+                return self._flush_one_by_one(batch)
+            self.outbox.mark_rejected(keys, response.text)
+            return [], batch
+        if response.status_code != 200:
+            self.outbox.mark_retry(keys, f"Ошибка сервера: {response.status_code}")
+            return [], []
+        
+        confirmed = response.json().get('messages', [])
+        self.outbox.mark_delivered([(m['client_key'], m.get('id')) for m in confirmed
+                                    if 'client_key' in m])
+        return confirmed, []
+        
+    def _flush_one_by_one(self, batch):
+        """Отправка по одному сообщению через /send_message"""
+        delivered, rejected = [], []
+        for index, entry in enumerate(batch):
+            try:
+                response = http_client.post('chat_send', f"{self.server_url}/send_message", json={
+                    'user': entry['user'],
+                    'message': entry['message'],
+                    'timestamp': entry['timestamp'],
+                    'client_key': entry['client_key']
+                })
+            except http_client.RequestException as e:
+                self.outbox.mark_retry([item['client_key'] for item in batch[index:]], e)
+                break
             if response.status_code == 200:
-                return True, "Сообщение отправлено"
+                message = dict(entry)
+                message_id = response.json().get('id')
+                if message_id is not None:
+                    message['id'] = message_id
+                self.outbox.mark_delivered([(entry['client_key'], message_id)])
+                delivered.append(message)
+            elif response.status_code == 400:
+                self.outbox.mark_rejected([entry['client_key']], response.text)
+                rejected.append(entry)
             else:
-                return False, f"Ошибка сервера: {response.status_code}"
-                
-        except requests.exceptions.RequestException as e:
-            return False, f"Не удалось подключиться к серверу чата: {e}"
+                self.outbox.mark_retry([item['client_key'] for item in batch[index:]],
+                                       f"Ошибка сервера: {response.status_code}")
+                break
+        return delivered, rejected
+            
+    def _track(self, response, messages):
+        """Сдвинуть курсор по ответу сервера.
+        
+        Курсор — наибольший полученный id. Сервер с поддержкой id присылает
+        заголовок X-Last-Id даже при пустом ответе; по его наличию
+        определяется, доступен ли длинный опрос. Возвращает id последнего
+        сообщения на сервере (или None у старого сервера).
+        """
+        header = response.headers.get('X-Last-Id')
+        server_last = int(header) if header is not None else None
+        with self._cursor_lock:
+            self.push_supported = server_last is not None
+            ids = [m['id'] for m in messages if 'id' in m]
+            if ids:
+                self.last_id = max(ids + [self.last_id or 0])
+            elif self.last_id is None and server_last is not None and not messages:
+                # Пустой ответ на первый запрос: начинаем с текущего конца ленты
+                self.last_id = server_last
+            if messages:
+                self.last_update = datetime.fromisoformat(messages[-1]['timestamp'])
+        self.messages.add(messages)
+        return server_last
+            
+    def _fetch_new(self, wait=0):
+        """Запрос новых сообщений после курсора; ошибки сети пробрасываются.
+        
+        Если сервер сообщает более новый id, чем пришёл в ответе (ответ
+        обрезан по limit или курсор отстал после обрыва связи), пропуск
+        догружается сразу, страницами после курсора.
+        """
+        collected = []
+        for _ in range(self.MAX_BACKFILL_PAGES):
+            with self._cursor_lock:
+                if self.last_id is not None:
+                    params = {'after_id': self.last_id}
+                else:
+                    params = {'since': self.last_update.isoformat()}
+            if wait and not collected:
+                params['wait'] = wait
+            if 'wait' in params:
+                response = http_client.get('chat_poll', f"{self.server_url}/get_messages",
+                                           params=params, timeout=(3, params['wait'] + 10))
+            else:
+                response = http_client.get('chat', f"{self.server_url}/get_messages",
+                                           params=params)
+            if response.status_code != 200:
+                break
+            messages = response.json()
+            server_last = self._track(response, messages)
+            collected.extend(messages)
+            if not messages or server_last is None or server_last <= self.last_id:
+                break
+        return collected
             
     def get_messages(self):
         """Получить новые сообщения"""
         try:
-            response = requests.get(f"{self.server_url}/get_messages", 
-                                  params={'since': self.last_update.isoformat()},
-                                  timeout=5)
+            return self._fetch_new()
+        except http_client.RequestException:
+            return []
             
+    def get_recent_messages(self, limit=100):
+        """Получить последние limit сообщений (для первого открытия чата)"""
+        try:
+            response = http_client.get('chat', f"{self.server_url}/get_messages",
+                                       params={'limit': limit})
             if response.status_code == 200:
-                new_messages = response.json()
-                if new_messages:
-                    self.messages.extend(new_messages)
-                    self.last_update = datetime.now()
-                return new_messages
+                # Сервер может не поддерживать limit, поэтому обрезаем и здесь
+                messages = response.json()[-limit:]
+                self.messages.clear()
+                with self._cursor_lock:
+                    self.last_id = None
+                self._track(response, messages)
+                return messages
             else:
                 return []
-                
-        except requests.exceptions.RequestException:
+        except http_client.RequestException:
             return []
             
-    def get_all_messages(self):
-        """Получить все сообщения"""
+    def get_older_messages(self, before, limit=100):
+        """Получить до limit сообщений, идущих раньше сообщения before.
+        
+        Страница берётся из буфера последних сообщений, если она там есть;
+        более старая история запрашивается у сервера и в памяти не хранится.
+        """
+        if 'id' in before:
+            cached = self.messages.before(before['id'], limit)
+            if cached is not None:
+                return cached
+            params = {'before_id': before['id'], 'limit': limit}
+        else:
+            params = {'before': before['timestamp'], 'limit': limit}
         try:
-            response = requests.get(f"{self.server_url}/get_messages", timeout=5)
+            response = http_client.get('chat', f"{self.server_url}/get_messages",
+                                       params=params)
             if response.status_code == 200:
-                self.messages = response.json()
-                if self.messages:
-                    self.last_update = datetime.fromisoformat(self.messages[-1]['timestamp'])
-                return self.messages
+                if 'id' in before:
+                    older = [m for m in response.json() if m.get('id', 0) < before['id']]
+                else:
+                    older = [m for m in response.json() if m['timestamp'] < before['timestamp']]
+                return older[-limit:]
             else:
                 return []
-        except requests.exceptions.RequestException:
+        except http_client.RequestException:
             return []
+            
+    def start_listening(self, on_messages):
+        """Запустить фоновое получение сообщений.
+        
+        on_messages вызывается из фонового потока со списком новых сообщений.
+        """
+        if self._listener and self._listener.is_alive():
+            return
+        self._stop_event.clear()
+        self._listener = threading.Thread(target=self._listen, args=(on_messages,),
+                                          daemon=True)
+        self._listener.start()
+        
+    def start_presence(self, on_change):
+        """Запустить сигналы присутствия и ожидание изменений списка в сети.
+        
+        Список хранится на сервере в памяти и истекает без сигналов, поэтому
+        аварийно закрытое рабочее место само пропадает из списка.
+        on_change(users) вызывается из фонового потока только при изменении.
+        """
+        if not self.current_user or (self._presence and self._presence.is_alive()):
+            return
+        self._presence = threading.Thread(target=self._presence_loop, args=(on_change,),
+                                          daemon=True)
+        self._presence.start()
+        
+    def _heartbeat(self, status=None, **kwargs):
+        payload = {'user': self.current_user['full_name'],
+                   'info': {'role': self.current_user.get('role', '')}}
+        if status:
+            payload['status'] = status
+        return http_client.post('chat', f"{self.server_url}/presence", json=payload, **kwargs)
+        
+    def _presence_loop(self, on_change):
+        """Сигнал раз в HEARTBEAT_INTERVAL, между сигналами — длинный опрос версии"""
+        version = None
+        next_beat = 0
+        backoff = 1
+        while not self._stop_event.is_set():
+            try:
+                if time.monotonic() >= next_beat:
+                    response = self._heartbeat()
+                    next_beat = time.monotonic() + HEARTBEAT_INTERVAL
+                else:
+                    wait = max(1, round(next_beat - time.monotonic()))
+                    response = http_client.get('chat_poll', f"{self.server_url}/presence",
+                                               params={'version': version, 'wait': wait},
+                                               timeout=(3, wait + 10))
+            except http_client.RequestException:
+                pause = min(backoff, self.MAX_BACKOFF)
+                self._stop_event.wait(pause + random.uniform(0, pause / 2))
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+                next_beat = 0
+                continue
+            backoff = 1
+            
+            if response.status_code == 404:
+                print("ℹ️ Сервер чата не поддерживает список пользователей в сети")
+                self._stop_event.wait(self.PUSH_RETRY_INTERVAL)
+                next_beat = 0
+                continue
+            if response.status_code != 200:
+                self._stop_event.wait(self.POLL_INTERVAL)
+                continue
+            
+            snapshot = response.json()
+            if snapshot['version'] != version:
+                version = snapshot['version']
+                try:
+                    on_change(snapshot['users'])
+                except Exception as e:
+                    print(f"Ошибка обновления списка в сети: {e}")
+        
+    def stop_listening(self):
+        """Остановить фоновое получение и отправку сообщений"""
+        self._stop_event.set()
+        self._send_event.set()
+        if self._presence:
+            # Сообщаем о выходе сразу; если сервер недоступен, запись истечёт сама
+            try:
+                self._heartbeat('offline', timeout=(1, 2))
+            except http_client.RequestException:
+                pass
+        
+    def _listen(self, on_messages):
+        """Цикл доставки: длинный опрос, при недоступности — обычный опрос.
+        
+        При обрыве связи переподключается с экспоненциальной паузой и
+        случайным разбросом, чтобы рабочие места не стучались одновременно.
+        """
+        backoff = 1
+        push_retry_at = 0
+        while not self._stop_event.is_set():
+            use_push = time.monotonic() >= push_retry_at
+            started = time.monotonic()
+            try:
+                messages = self._fetch_new(wait=self.LONG_POLL_WAIT if use_push else 0)
+            except http_client.RequestException as e:
+                pause = min(backoff, self.MAX_BACKOFF)
+                print(f"⚠️ Нет связи с сервером чата, повтор через {pause} с: {e}")
+                self._stop_event.wait(pause + random.uniform(0, pause / 2))
+                backoff = min(backoff * 2, self.MAX_BACKOFF)
+                continue
+            backoff = 1
+            
+            if messages:
+                try:
+                    on_messages(messages)
+                except Exception as e:
+                    print(f"Ошибка обработки сообщений чата: {e}")
+            
+            if use_push and not self.push_supported:
+                print("ℹ️ Сервер чата не поддерживает длинный опрос, переход на опрос")
+                push_retry_at = time.monotonic() + self.PUSH_RETRY_INTERVAL
+            
+            if not use_push or not self.push_supported:
+                self._stop_event.wait(self.POLL_INTERVAL)
+            elif not messages and time.monotonic() - started < 1:
+                # Сервер ответил сразу и пусто — не даём циклу крутиться вхолостую
+                self._stop_event.wait(1)
 
 class ChatUI:
+    # Сколько сообщений держать в окне, пока пользователь внизу ленты
+    MAX_RENDERED_MESSAGES = 300
+    # Размер порции при первой загрузке и при подгрузке старых сообщений
+    PAGE_SIZE = 100
+
     def __init__(self, parent, chat_manager, colors, fonts):
         self.chat_manager = chat_manager
         self.colors = colors
         self.fonts = fonts
         self.unread_count = 0
+        # (ключ, сообщение, число строк) для каждого показанного сообщения
+        self.rendered = deque()
+        self.rendered_keys = set()
+        self.has_older = False
+        # client_key -> тег текста ещё не доставленного сообщения
+        self.pending = {}
         
         # Создаем фрейм для чата
         self.frame = tk.Frame(parent, bg=colors['background'])
@@ -1669,6 +2224,11 @@ class ChatUI:
         header_frame.pack(fill='x', padx=0, pady=0)
         header_frame.pack_propagate(False)
         
+        # Кто в сети: обновляется только при изменении списка на сервере
+        self.online_label = tk.Label(header_frame, text="", bg=colors['primary'],
+                                   fg='white', font=fonts['small'])
+        self.online_label.pack(side='right', padx=10)
+        
         self.title_label = tk.Label(header_frame, text="💬 Чат сотрудников", 
                                   bg=colors['primary'], fg='white', font=fonts['h3'])
         self.title_label.pack(pady=8)
@@ -1677,6 +2237,11 @@ class ChatUI:
         messages_frame = tk.Frame(self.frame, bg=colors['background'])
         messages_frame.pack(fill='both', expand=True, padx=10, pady=10)
         
+        # Подгрузка старых сообщений порциями
+        self.load_older_btn = ttk.Button(messages_frame, text="⬆ Загрузить более ранние",
+                                       style='Secondary.TButton',
+                                       command=self.load_older)
+        
         # Прокрутка для сообщений
         scrollbar = ttk.Scrollbar(messages_frame)
         scrollbar.pack(side='right', fill='y')
@@ -1688,6 +2253,7 @@ class ChatUI:
                                    padx=10, pady=10)
         self.messages_text.pack(side='left', fill='both', expand=True)
         scrollbar.config(command=self.messages_text.yview)
+        self.messages_text.tag_config('pending', foreground=colors['text_secondary'])
         
         # Поле ввода сообщения
         input_frame = tk.Frame(self.frame, bg=colors['background'], padx=10, pady=10)
@@ -1708,12 +2274,33 @@ class ChatUI:
                                command=self.refresh_chat)
         refresh_btn.pack(side='right', padx=(0, 10))
         
-        # Загружаем сообщения при инициализации
-        self.refresh_chat()
+        # Загружаем последние сообщения при инициализации; недоставленные
+        # в прошлый раз показываем ожидающими, уже доставленные снимутся сами.
+        # Очередь отправки читается тоже в фоне: база может быть занята
+        self.fetch(self.show_pending, self.chat_manager.outbox.pending)
+        self.fetch(self.show_recent, self.chat_manager.get_recent_messages, self.PAGE_SIZE)
         
     def get_widget(self):
         return self.frame
         
+    def fetch(self, then, func, *args):
+        """Запрос func(*args) в фоновом потоке чата; then(результат) — в потоке Tk"""
+        def work():
+            try:
+                result = func(*args)
+            except Exception as e:
+                print(f"Ошибка запроса чата: {e}")
+                result = []
+            try:
+                self.frame.after(0, then, result)
+            except (RuntimeError, tk.TclError):
+                pass  # окно уже закрыто
+        self.chat_manager.executor.submit(work)
+        
+    def show_recent(self, recent):
+        self.append_messages(recent)
+        self.set_has_older(len(recent) >= self.PAGE_SIZE)
+        
     def send_message(self, event=None):
         """Отправить сообщение"""
         message_text = self.message_entry.get().strip()
@@ -1723,30 +2310,165 @@ class ChatUI:
         success, result = self.chat_manager.send_message(message_text)
         if success:
             self.message_entry.delete(0, tk.END)
-            self.refresh_chat()
+            self.show_pending([result])
         else:
             messagebox.showerror("Ошибка", result)
             
-    def refresh_chat(self):
-        """Обновить сообщения в чате"""
-        messages = self.chat_manager.get_all_messages()
+    def show_pending(self, entries):
+        """Показать сообщения из очереди отправки серым внизу ленты"""
+        at_bottom = self.is_at_bottom()
         self.messages_text.config(state='normal')
-        self.messages_text.delete(1.0, tk.END)
+        for entry in entries:
+            key = entry['client_key']
+            if key in self.pending:
+                continue
+            self.pending[key] = f"pending_{key}"
+            self.messages_text.insert(tk.END, "⏳ " + self.format_message(entry),
+                                      ('pending', self.pending[key]))
+        if at_bottom:
+            self.messages_text.see(tk.END)
+        self.messages_text.config(state='disabled')
         
-        for msg in messages:
-            timestamp = datetime.fromisoformat(msg['timestamp']).strftime("%H:%M")
-            user = msg['user']
-            message = msg['message']
-            
-            # Форматируем сообщение
-            formatted_msg = f"[{timestamp}] {user}: {message}\n\n"
-            self.messages_text.insert(tk.END, formatted_msg)
+    def drop_pending(self, client_key):
+        """Убрать ожидающее сообщение из ленты (доставлено или отклонено)"""
+        tag = self.pending.pop(client_key, None)
+        if tag is None:
+            return
+        ranges = self.messages_text.tag_ranges(tag)
+        if ranges:
+            self.messages_text.delete(ranges[0], ranges[1])
             
-        self.messages_text.see(tk.END)
+    def reject_pending(self, entries):
+        """Сервер не принял сообщения из очереди"""
+        self.messages_text.config(state='normal')
+        for entry in entries:
+            self.drop_pending(entry['client_key'])
         self.messages_text.config(state='disabled')
+        messagebox.showwarning("Чат", "Сервер не принял сообщение:\n\n" +
+                               "\n".join(entry['message'] for entry in entries))
+            
+    def insert_index(self):
+        """Куда вставлять новые сообщения: перед ожидающими отправки"""
+        ranges = self.messages_text.tag_ranges('pending')
+        return ranges[0] if ranges else tk.END
+            
+    def refresh_chat(self):
+        """Запросить новые сообщения и дописать их в конец"""
+        self.fetch(self.show_refreshed, self.chat_manager.get_messages)
+        
+    def show_refreshed(self, messages):
+        self.append_messages(messages)
         self.unread_count = 0
         self.update_unread_count()
         
+    @staticmethod
+    def message_key(msg):
+        if 'id' in msg:
+            return msg['id']
+        return (msg['timestamp'], msg['user'], msg['message'])
+        
+    @staticmethod
+    def format_message(msg):
+        """Текст сообщения для окна; время разбирается один раз при вставке"""
+        timestamp = datetime.fromisoformat(msg['timestamp']).strftime("%H:%M")
+        return f"[{timestamp}] {msg['user']}: {msg['message']}\n\n"
+        
+    def is_at_bottom(self):
+        return self.messages_text.yview()[1] >= 0.999
+        
+    def append_messages(self, messages):
+        """Дописать в конец только ещё не показанные сообщения.
+        
+        Если пользователь листает историю, позиция прокрутки не меняется;
+        если он внизу, лента прокручивается к новому сообщению, а самые
+        старые строки сверх MAX_RENDERED_MESSAGES удаляются из окна.
+        Ожидающие отправки сообщения остаются внизу; пришедшее с сервера
+        своё сообщение заменяет ожидающее с тем же client_key.
+        Возвращает число добавленных сообщений.
+        """
+        added = 0
+        at_bottom = self.is_at_bottom()
+        self.messages_text.config(state='normal')
+        for msg in messages:
+            if 'client_key' in msg:
+                self.drop_pending(msg['client_key'])
+            key = self.message_key(msg)
+            if key in self.rendered_keys:
+                continue
+            text = self.format_message(msg)
+            self.messages_text.insert(self.insert_index(), text)
+            self.rendered.append((key, msg, text.count('\n')))
+            self.rendered_keys.add(key)
+            added += 1
+        
+        if at_bottom:
+            self.trim_top()
+            self.messages_text.see(tk.END)
+        self.messages_text.config(state='disabled')
+        return added
+        
+    def trim_top(self):
+        """Удалить из окна самые старые сообщения сверх лимита"""
+        excess = len(self.rendered) - self.MAX_RENDERED_MESSAGES
+        if excess <= 0:
+            return
+        lines = 0
+        for _ in range(excess):
+            key, _, count = self.rendered.popleft()
+            self.rendered_keys.discard(key)
+            lines += count
+        self.messages_text.delete("1.0", f"{lines + 1}.0")
+        self.set_has_older(True)
+        
+    def load_older(self):
+        """Подгрузить порцию сообщений перед самым старым показанным"""
+        if not self.rendered:
+            self.set_has_older(False)
+            return
+        self.load_older_btn.state(['disabled'])
+        self.fetch(self.show_older, self.chat_manager.get_older_messages,
+                   self.rendered[0][1], self.PAGE_SIZE)
+        
+    def show_older(self, older):
+        self.load_older_btn.state(['!disabled'])
+        older = [m for m in older if self.message_key(m) not in self.rendered_keys]
+        if older:
+            # Запоминаем верхнюю видимую строку, чтобы после вставки остаться на ней
+            top_line = int(self.messages_text.index("@0,0").split('.')[0])
+            texts = [self.format_message(m) for m in older]
+            self.messages_text.config(state='normal')
+            self.messages_text.insert("1.0", "".join(texts))
+            self.messages_text.config(state='disabled')
+            
+            inserted = 0
+            for msg, text in reversed(list(zip(older, texts))):
+                key = self.message_key(msg)
+                self.rendered.appendleft((key, msg, text.count('\n')))
+                self.rendered_keys.add(key)
+                inserted += text.count('\n')
+            self.messages_text.yview(f"{top_line + inserted}.0")
+        self.set_has_older(len(older) >= self.PAGE_SIZE)
+        
+    def set_has_older(self, has_older):
+        """Показать или скрыть кнопку подгрузки старых сообщений"""
+        self.has_older = has_older
+        if has_older:
+            self.load_older_btn.pack(side='top', fill='x', pady=(0, 5),
+                                     before=self.messages_text)
+        else:
+            self.load_older_btn.pack_forget()
+        
+    def show_online(self, users):
+        """Показать, кто сейчас в сети"""
+        names = [user['user'] for user in users]
+        if not names:
+            self.online_label.config(text="")
+            return
+        shown = ", ".join(names[:3])
+        if len(names) > 3:
+            shown += f" и ещё {len(names) - 3}"
+        self.online_label.config(text=f"🟢 В сети ({len(names)}): {shown}")
+        
     def update_unread_count(self):
         """Обновить счетчик непрочитанных сообщений"""
         if hasattr(self, 'title_label'):
@@ -1773,27 +2495,33 @@ def initialize_chat_system(notebook):
         root.chat_manager = chat_manager
         root.chat_ui = chat_ui
         
-        # Функция периодического обновления чата
-        def update_chat_periodically():
-            if hasattr(root, 'chat_ui') and root.chat_ui:
-                try:
-                    # Получаем новые сообщения
-                    new_messages = root.chat_manager.get_messages()
-                    if new_messages:
-                        # Если есть новые сообщения и чат не в фокусе, увеличиваем счетчик
-                        current_tab = notebook.index(notebook.select())
-                        chat_tab_index = notebook.index("end") - 1  # Предполагаем, что чат последний
-                        if current_tab != chat_tab_index:
-                            root.chat_ui.unread_count += len(new_messages)
-                            root.chat_ui.update_unread_count()
-                        
-                        # Обновляем отображение
-                        root.chat_ui.refresh_chat()
-                except Exception as e:
-                    print(f"Ошибка обновления чата: {e}")
-            root.after(5000, update_chat_periodically)  # Обновлять каждые 5 секунд
-        
-        root.after(3000, update_chat_periodically)
+        def deliver(new_messages):
+            """Показ сообщений, пришедших из фонового потока доставки"""
+            try:
+                added = root.chat_ui.append_messages(new_messages)
+                # Если чат не в фокусе, увеличиваем счетчик непрочитанных
+                if added and notebook.select() != str(chat_frame):
+                    root.chat_ui.unread_count += added
+                    root.chat_ui.update_unread_count()
+            except Exception as e:
+                print(f"Ошибка обновления чата: {e}")
+        
+        def on_tab_changed(event):
+            # Открыли вкладку чата — сообщения считаются прочитанными
+            if notebook.select() == str(chat_frame):
+                root.chat_ui.unread_count = 0
+                root.chat_ui.update_unread_count()
+        
+        notebook.bind('<<NotebookTabChanged>>', on_tab_changed, add='+')
+        # Сообщения приходят из фонового потока, показываем их в потоке Tk.
+        # Доставка запускается в очереди запросов окна — после первой
+        # загрузки, чтобы новые сообщения не оказались выше последних
+        chat_manager.executor.submit(chat_manager.start_listening,
+                                     lambda msgs: root.after(0, deliver, msgs))
+        chat_manager.start_sending(
+            lambda msgs: root.after(0, root.chat_ui.append_messages, msgs),
+            lambda entries: root.after(0, root.chat_ui.reject_pending, entries))
+        chat_manager.start_presence(lambda users: root.after(0, root.chat_ui.show_online, users))
         print("✅ Модуль чата инициализирован")
         return True
         
@@ -1821,6 +2549,20 @@ def create_modern_table(parent):
     table_container = tk.Frame(parent, bg=ModernStyle.COLORS['background'])
     table_container.pack(fill='both', expand=True, padx=20, pady=10)
     
+    # Подвал: количество строк и подгрузка следующей страницы
+    footer = tk.Frame(table_container, bg=ModernStyle.COLORS['background'])
+    footer.pack(side='bottom', fill='x', pady=(5, 0))
+    
+    root.rows_count_label = tk.Label(footer, text="Показано: 0",
+                                     bg=ModernStyle.COLORS['background'],
+                                     fg=ModernStyle.COLORS['text_secondary'],
+                                     font=ModernStyle.FONTS['small'])
+    root.rows_count_label.pack(side='left')
+    
+    root.load_more_btn = ttk.Button(footer, text="⬇️ Загрузить ещё", style='Secondary.TButton',
+                                    command=load_more_clients, state='disabled')
+    root.load_more_btn.pack(side='right')
+    
     # Прокрутка
     scrollbar = ttk.Scrollbar(table_container)
     scrollbar.pack(side='right', fill='y')
@@ -1831,14 +2573,15 @@ def create_modern_table(parent):
                "Дата окончания ИППСУ", "Группа")
     
     tree = ttk.Treeview(table_container, columns=columns, show="headings", 
-                       style='Modern.Treeview', yscrollcommand=scrollbar.set,
+                       style='Modern.Treeview', yscrollcommand=on_tree_scroll,
                        height=20)
     tree.pack(side='left', fill='both', expand=True)
     scrollbar.config(command=tree.yview)
+    root.tree_scrollbar = scrollbar
     
-    # Заголовки колонок
+    # Заголовки колонок (щелчок сортирует таблицу)
     for col in columns:
-        tree.heading(col, text=col)
+        tree.heading(col, text=col, command=lambda c=col: sort_by_column(c))
     
     return tree, table_container
     
@@ -1899,7 +2642,7 @@ def create_search_panel(root):
              fg=ModernStyle.COLORS['text_secondary'],
              font=ModernStyle.FONTS['small']).pack(side='left', padx=(0, 5))
     
-    date_from_entry = DateEntry(filters_frame, width=10, date_pattern="dd.mm.yyyy",
+    date_from_entry = tkcalendar.DateEntry(filters_frame, width=10, date_pattern="dd.mm.yyyy",
                                font=ModernStyle.FONTS['small'], background=ModernStyle.COLORS['primary'],
                                foreground='white', borderwidth=0)
     date_from_entry.pack(side='left', padx=(0, 10))
@@ -1909,7 +2652,7 @@ def create_search_panel(root):
              fg=ModernStyle.COLORS['text_secondary'],
              font=ModernStyle.FONTS['small']).pack(side='left', padx=(0, 10))
     
-    date_to_entry = DateEntry(filters_frame, width=10, date_pattern="dd.mm.yyyy",
+    date_to_entry = tkcalendar.DateEntry(filters_frame, width=10, date_pattern="dd.mm.yyyy",
                              font=ModernStyle.FONTS['small'], background=ModernStyle.COLORS['primary'],
                              foreground='white', borderwidth=0)
     date_to_entry.pack(side='left', padx=(0, 10))
@@ -1931,8 +2674,10 @@ def create_toolbar(root):
         ("🗑️ Удалить", delete_selected, 'Secondary.TButton', "Delete"),
         ("👁️ Просмотр", lambda: quick_view_wrapper(), 'Secondary.TButton', "Ctrl+Q"),
         ("📥 Импорт", import_from_gsheet, 'Secondary.TButton', "Ctrl+I"),
+        ("📤 Выгрузка", export_to_gsheet, 'Secondary.TButton', "Ctrl+U"),
         ("📄 Экспорт в Word", export_selected_to_word, 'Secondary.TButton', "Ctrl+W"),
         ("📊 Статистика", show_statistics, 'Secondary.TButton', ""),
+        ("👥 Дубли", find_duplicates_job, 'Secondary.TButton', ""),
         ("🔔 Уведомления", show_notifications, 'Secondary.TButton', "F2"),
         ("⚙️ Настройки", settings_window, 'Secondary.TButton', "")
     ]
@@ -2164,6 +2909,7 @@ def setup_keyboard_shortcuts():
     root.bind('<Control-q>', lambda e: quick_view_wrapper())
     root.bind('<Control-e>', lambda e: edit_client())
     root.bind('<Control-i>', lambda e: import_from_gsheet())
+    root.bind('<Control-u>', lambda e: export_to_gsheet())
     root.bind('<Control-w>', lambda e: export_selected_to_word())
     
     # Уведомления
@@ -2197,6 +2943,7 @@ F5 - Обновить список
 Ctrl+Q - Быстрый просмотр
 Ctrl+E - Редактировать
 Ctrl+I - Импорт из Google Sheets  
+Ctrl+U - Выгрузка изменений в Google Sheets
 Ctrl+W - Экспорт в Word
 
 Уведомления:
@@ -2206,6 +2953,7 @@ F2 - Показать уведомления
 F1 - Показать эту справку
 
 Управление таблицей:
+Щелчок по заголовку - Сортировка (повторный - обратный порядок)
 ←/→ - Изменить ширину колонки
 Double Click - Автоподбор колонки
 Правый клик - Контекстное меню
@@ -2272,7 +3020,7 @@ def auto_resize_columns(tree, max_width=400):
             if cell_width > content_width:
                 content_width = cell_width
         
-        priority = column_priority.get(header_text, 1)
+        priority = column_priority.get(col, 1)
         if priority == 0:
             final_width = min(content_width, 80)
         elif priority == 2:
@@ -2382,99 +3130,481 @@ def show_context_menu(event):
 
 # ================== UI ФУНКЦИИ ==================
 def refresh_tree(results=None):
-    # очищаем таблицу
-    for row in tree.get_children():
-        tree.delete(row)
+    """Перерисовать таблицу.
 
-    # если нет результатов — берём все записи
+    Без аргументов показывает первую страницу всех клиентов (сбрасывая поиск),
+    остальные страницы подгружаются по прокрутке или кнопкой «Загрузить ещё».
+    """
     if results is None:
-        results = get_all_clients(limit=200)
+        load_clients()
+        return
+
+    clear_client_rows()
+    insert_client_rows(results)
+
+def load_clients(query="", date_from=None, date_to=None):
+    """Первая страница списка с заданным фильтром"""
+    root.client_filter = (query, date_from, date_to)
+    order = getattr(root, 'client_order', DEFAULT_ORDER)
+    rows, root.client_cursor = fetch_clients_page(query, date_from, date_to, order=order)
+
+    clear_client_rows()
+    insert_client_rows(rows)
+    update_load_more_state()
+    root.local_order = None
+    update_sort_headings()
+
+def load_more_clients():
+    """Подгрузка следующей страницы после курсора"""
+    cursor = getattr(root, 'client_cursor', None)
+    if cursor is None or getattr(root, 'loading_more', False):
+        return
+    root.loading_more = True
+    try:
+        query, date_from, date_to = getattr(root, 'client_filter', ("", None, None))
+        order = getattr(root, 'client_order', DEFAULT_ORDER)
+        rows, root.client_cursor = fetch_clients_page(query, date_from, date_to, after=cursor, order=order)
+        insert_client_rows(rows, resize=False)
+        update_load_more_state()
+    finally:
+        root.loading_more = False
+
+def update_load_more_state():
+    """Состояние кнопки «Загрузить ещё» и счётчик строк"""
+    has_more = getattr(root, 'client_cursor', None) is not None
+    if hasattr(root, 'load_more_btn'):
+        root.load_more_btn['state'] = 'normal' if has_more else 'disabled'
+    if hasattr(root, 'rows_count_label'):
+        shown = len(tree.get_children())
+        root.rows_count_label.config(text=f"Показано: {shown}" + (" (есть ещё)" if has_more else ""))
+
+def on_tree_scroll(first, last):
+    """Прокрутка таблицы: у нижнего края подгружаем следующую страницу"""
+    root.tree_scrollbar.set(first, last)
+    if float(last) >= 0.98 and getattr(root, 'client_cursor', None) is not None:
+        root.after_idle(load_more_clients)
+
+def client_order_value(column, row):
+    """Значение order_expression(column) для строки клиента (как в CLIENT_COLUMNS)"""
+    if column == "ID":
+        return row[0]
+    if column in ORDERABLE_FIELDS:
+        return row[CLIENT_FIELDS.index(ORDERABLE_FIELDS[column])] or ""
+    return sort_key(row[1], row[2], row[3])
+
+def client_order_key(column, row):
+    """Ключ, в порядке которого fetch_clients_page отдаёт строки.
+
+    Запрос сортирует ORDER BY expr, id (оба по убыванию, если descending)
+    по двоичным индексам; строки Python сравниваются по кодам символов,
+    как и UTF-8 побайтно, поэтому порядок совпадает и для равных значений.
+    """
+    return client_order_value(column, row), row[0]
+
+def sorted_client_rows(rows, column, descending):
+    """Строки в том же порядке, что отдаёт fetch_clients_page"""
+    return sorted(rows, key=lambda row: client_order_key(column, row), reverse=descending)
+
+def sort_loaded_rows(column, descending):
+    """Пересортировка загруженных строк перемещением элементов таблицы.
+
+    Порядок тот же, что у запроса страницы (sorted_client_rows), поэтому
+    щелчок на заголовке даёт одинаковый результат, загружена ли одна
+    страница или несколько. Колонка отметок есть только в таблице: отмеченные
+    идут первыми, внутри — по ID в том же направлении. Перестановка для
+    каждой колонки и направления кэшируется до изменения набора строк.
+    """
+    permutations = getattr(root, 'sort_permutations', {})
+    order = permutations.get((column, descending))
+    if order is None:
+        rows = getattr(root, 'client_rows', {})
+        items = tree.get_children()
+        if column == "✓":
+            marks = {item: tree.set(item, "✓") == "X" for item in items}
+            order = sorted(items, key=lambda item: (not marks[item], rows[item][0]),
+                           reverse=descending)
+        else:
+            order = sorted(items, key=lambda item: client_order_key(column, rows[item]),
+                           reverse=descending)
+        permutations[(column, descending)] = order
+        root.sort_permutations = permutations
+    for index, item in enumerate(order):
+        tree.move(item, "", index)
+
+def forget_sort_order(column):
+    """Сбросить кэшированные перестановки колонки (её значения изменились)"""
+    permutations = getattr(root, 'sort_permutations', {})
+    for descending in (False, True):
+        permutations.pop((column, descending), None)
+
+def sort_by_column(column):
+    """Сортировка по щелчку на заголовке; повторный щелчок меняет направление"""
+    current, descending = getattr(root, 'local_order', None) or getattr(root, 'client_order', DEFAULT_ORDER)
+    descending = not descending if column == current else False
+
+    if column == "✓":
+        # Отметки существуют только в таблице — сортируем загруженные строки
+        root.local_order = (column, descending)
+        sort_loaded_rows(column, descending)
+    else:
+        root.local_order = None
+        root.client_order = (column, descending)
+        if getattr(root, 'client_cursor', None) is None:
+            # Всё уже загружено — достаточно переставить строки
+            sort_loaded_rows(column, descending)
+        else:
+            query, date_from, date_to = getattr(root, 'client_filter', ("", None, None))
+            load_clients(query, date_from, date_to)
+    update_sort_headings()
+
+def update_sort_headings():
+    """Стрелка направления сортировки в заголовке колонки"""
+    column, descending = getattr(root, 'local_order', None) or getattr(root, 'client_order', DEFAULT_ORDER)
+    for col in tree["columns"]:
+        arrow = (" ▼" if descending else " ▲") if col == column else ""
+        tree.heading(col, text=f"{col}{arrow}")
 
+def client_row_tag(ippcu_end, today):
+    """Тег цвета строки по сроку окончания ИППСУ"""
+    try:
+        if ippcu_end:
+            end_date = datetime.strptime(ippcu_end, "%Y-%m-%d").date()
+            if end_date < today:
+                return "expired"   # срок истёк
+            elif end_date <= today + timedelta(days=30):
+                return "soon"      # истекает скоро
+            else:
+                return "active"    # ещё действует
+    except Exception:
+        pass
+    return ""
+
+def clear_client_rows():
+    """Очистить таблицу клиентов"""
+    tree.delete(*tree.get_children())
+    root.client_rows = {}
+
+def insert_client_rows(results, resize=True):
+    # Набор строк изменился — кэшированные перестановки больше не годятся
+    root.sort_permutations = {}
     today = datetime.today().date()
-    soon = today + timedelta(days=30)
 
+    # Исходные строки базы по элементам таблицы: значения ячеек Tk
+    # возвращает преобразованными, а сортировке нужны значения как в базе
+    rows = getattr(root, 'client_rows', None)
+    if rows is None:
+        rows = root.client_rows = {}
     for row in results:
-        cid, last, first, middle, dob, phone, contract, ippcu_start, ippcu_end, group = row
-        tag = ""
-        try:
-            if ippcu_end:
-                end_date = datetime.strptime(ippcu_end, "%Y-%m-%d").date()
-                if end_date < today:
-                    tag = "expired"   # срок истёк
-                elif end_date <= soon:
-                    tag = "soon"      # истекает скоро
-                else:
-                    tag = "active"    # ещё действует
-        except Exception:
-            tag = ""
-
-        tree.insert(
+        row = tuple(row)
+        item = tree.insert(
             "",
             "end",
-            values=(" ", cid, last, first, middle, dob, phone, contract, ippcu_start, ippcu_end, group),
-            tags=(tag,)
+            values=(" ",) + row,
+            tags=(client_row_tag(row[8], today),)
         )
+        rows[item] = row
 
     # оформление цветом
     tree.tag_configure("expired", background="#F8D7DA")   # красный (просрочен)
     tree.tag_configure("soon", background="#FFF3CD")      # жёлтый (скоро истечёт)
     tree.tag_configure("active", background="#D4EDDA")    # зелёный (активный)
 
-    
-    root.after(100, lambda: auto_resize_columns(tree))
+    if resize:
+        root.after(100, lambda: auto_resize_columns(tree))
 
-def add_window():
-    win = tk.Toplevel()
-    win.title("Добавить обслуживаемого")
-    win.configure(bg=ModernStyle.COLORS['background'])
+# Метка изменений таблицы клиентов: счётчик client_changes.version, который
+# триггеры увеличивают при любом добавлении, правке и удалении. Он не зависит
+# от часов рабочих мест, в отличие от updated_at
+CLIENT_CHANGE_MARK = "SELECT version FROM client_changes WHERE id = 1"
 
-    fields = [
-        ("Фамилия", 0), ("Имя", 1), ("Отчество", 2),
-        ("Дата рождения", 3), ("Телефон", 4), ("Номер договора", 5),
-        ("Дата начала ИППСУ", 6), ("Дата окончания ИППСУ", 7), ("Группа", 8)
-    ]
+def reload_loaded_clients():
+    """Перечитать уже загруженные строки тем же запросом страницы.
+    
+    Читается столько строк, сколько показано (не меньше страницы), с текущим
+    поиском и порядком, поэтому переименованный клиент встаёт на своё место,
+    переставший подходить под поиск исчезает, а попавший в показанный
+    диапазон появляется. Отметки, выделение и прокрутка сохраняются.
+    """
+    query, date_from, date_to = getattr(root, 'client_filter', ("", None, None))
+    order = getattr(root, 'client_order', DEFAULT_ORDER)
+    limit = max(len(tree.get_children()), PAGE_SIZE)
+    rows, cursor = fetch_clients_page(query, date_from, date_to, limit=limit, order=order)
+    
+    marked = {str(tree.set(item, "ID")) for item in tree.get_children()
+              if tree.set(item, "✓") == "X"}
+    selection = selected_client_ids()
+    top = tree.yview()[0]
+    clear_client_rows()
+    insert_client_rows(rows, resize=False)
+    for item in tree.get_children():
+        if str(tree.set(item, "ID")) in marked:
+            tree.set(item, "✓", "X")
+    root.client_cursor = cursor
+    local_order = getattr(root, 'local_order', None)
+    if local_order:
+        sort_loaded_rows(*local_order)
+    select_clients(selection)
+    tree.yview_moveto(top)
+    update_load_more_state()
+
+def on_clients_changed(conn, old_mark, new_mark):
+    """Клиенты изменены другим соединением или программой: счётчик сдвинулся.
+    
+    Правка может поменять место строки в порядке сортировки и её попадание
+    под поиск, поэтому показанные строки перечитываются запросом страницы.
+    """
+    reload_loaded_clients()
+
+def selected_client_ids():
+    return [str(tree.set(item, "ID")) for item in tree.selection()]
+
+def select_clients(client_ids):
+    """Выделить строки с указанными ID, если они показаны"""
+    wanted = set(client_ids)
+    items = [item for item in tree.get_children() if str(tree.set(item, "ID")) in wanted]
+    if items:
+        tree.selection_set(items)
+        tree.see(items[0])
+
+def show_client_snapshot():
+    """Показать снимок первой страницы, сохранённый при выходе; None, если его нет"""
+    snapshot = CLIENT_SNAPSHOT.load()
+    if snapshot is None:
+        return None
+    root.client_filter = ("", None, None)
+    root.client_order = snapshot["order"]
+    root.client_cursor = snapshot["cursor"]
+    root.local_order = None
+    for column, width in snapshot["widths"].items():
+        if column in tree["columns"]:
+            tree.column(column, width=width)
+    insert_client_rows(snapshot["rows"], resize=False)
+    select_clients(snapshot["selection"])
+    update_load_more_state()
+    update_sort_headings()
+    return snapshot
+
+def reconcile_client_snapshot(snapshot, changes):
+    """Сверить показанный снимок с базой по счётчику изменений клиентов.
+    
+    Счётчик совпал — строки на экране актуальны, запрос страницы не нужен.
+    Иначе страница перечитывается с сохранением выделения. Возвращает True,
+    если снимок подошёл.
+    """
+    if CLIENT_SNAPSHOT.matches(snapshot, changes):
+        return True
+    selection = selected_client_ids()
+    load_clients()
+    select_clients(selection)
+    return False
 
-    entries = {}
-    for field, row in fields:
-        tk.Label(win, text=field, bg=ModernStyle.COLORS['background'],
-                fg=ModernStyle.COLORS['text_primary'], font=ModernStyle.FONTS['body']).grid(row=row, column=0, padx=10, pady=5, sticky="w")
+def save_client_snapshot():
+    """Сохранить первую страницу в текущем порядке, ширины колонок и выделение.
+    
+    Страница читается заново без фильтра поиска — именно её покажет следующий
+    запуск; счётчик изменений читается до строк, так что при гонке снимок окажется
+    устаревшим и будет перечитан, а не наоборот.
+    """
+    order = getattr(root, 'client_order', DEFAULT_ORDER)
+    with connect_db() as conn:
+        mark = conn.execute(CLIENT_CHANGE_MARK).fetchone()
+    rows, cursor = fetch_clients_page(order=order)
+    widths = {column: tree.column(column, "width") for column in tree["columns"]}
+    CLIENT_SNAPSHOT.save(mark[0], order, rows, cursor, widths, selected_client_ids())
+
+# Поля формы клиента: (подпись, обязательное, дата)
+CLIENT_FORM_FIELDS = [
+    ("Фамилия", True, False), ("Имя", True, False), ("Отчество", False, False),
+    ("Дата рождения", True, True), ("Телефон", False, False), ("Номер договора", False, False),
+    ("Дата начала ИППСУ", False, True), ("Дата окончания ИППСУ", False, True), ("Группа", False, False),
+]
+
+class ClientDialog:
+    """Окно добавления и редактирования клиента.
+    
+    Виджеты (в том числе четыре медленных DateEntry) строятся один раз при
+    первом открытии; закрытие только прячет окно, а следующее открытие
+    заполняет те же поля данными нового клиента. Даты в обоих режимах
+    вводятся одинаково и проверяются при сохранении; пустая необязательная
+    дата остаётся пустой.
+    """
+    DATE_FORMAT = "%d.%m.%Y"
+    
+    def __init__(self, parent):
+        self.parent = parent
+        self.win = None
+        self.entries = {}
+        self.client_id = None
+        self.pending_check = None
+    
+    def build(self):
+        if self.win is not None:
+            return
+        started = time.perf_counter()
+        win = tk.Toplevel(self.parent)
+        win.withdraw()
+        win.transient(self.parent)
+        win.configure(bg=ModernStyle.COLORS['background'])
+        win.protocol("WM_DELETE_WINDOW", self.hide)
+        win.bind("<Escape>", lambda e: self.hide())
+        
+        for row, (field, required, is_date) in enumerate(CLIENT_FORM_FIELDS):
+            label = f"{field} *" if required else field
+            tk.Label(win, text=label, bg=ModernStyle.COLORS['background'],
+                    fg=ModernStyle.COLORS['text_primary'], font=ModernStyle.FONTS['body']).grid(row=row, column=0, padx=10, pady=5, sticky="w")
+            
+            if is_date:
+                entry = tkcalendar.DateEntry(win, width=27, date_pattern="dd.mm.yyyy",
+                                font=ModernStyle.FONTS['body'])
+                # Проверка при сохранении вместо подстановки даты при потере фокуса:
+                # иначе пустая необязательная дата молча заменялась бы сегодняшней
+                entry.configure(validate="none")
+                entry.bind("<<DateEntrySelected>>", self.schedule_duplicate_check, add="+")
+            else:
+                entry = tk.Entry(win, width=30, font=ModernStyle.FONTS['body'])
+            
+            entry.grid(row=row, column=1, padx=10, pady=5)
+            self.entries[field] = entry
+        
+        # Предупреждение о дубле прямо во время ввода
+        self.duplicate_label = tk.Label(win, text="", bg=ModernStyle.COLORS['background'],
+                                        fg=ModernStyle.COLORS['error'], font=ModernStyle.FONTS['small'])
+        self.duplicate_label.grid(row=10, column=0, columnspan=2, padx=10, sticky="w")
+        
+        for field in ("Фамилия", "Имя", "Отчество", "Дата рождения"):
+            self.entries[field].bind("<KeyRelease>", self.schedule_duplicate_check, add="+")
+        
+        save_btn = ttk.Button(win, text="Сохранить", style='Primary.TButton', command=self.save)
+        save_btn.grid(row=9, column=0, columnspan=2, pady=10)
+        win.bind("<Return>", lambda e: self.save())
+        
+        self.win = win
+        print(f"🪟 Окно клиента построено за {(time.perf_counter() - started) * 1000:.0f} мс")
+    
+    def open(self, client=None):
+        """Показать окно: client=None — новый клиент, иначе строка CLIENT_COLUMNS"""
+        if self.win is None:
+            self.build()
+        
+        if self.pending_check:
+            self.win.after_cancel(self.pending_check)
+            self.pending_check = None
+        self.duplicate_label.config(text="")
+        
+        if client is None:
+            self.client_id = None
+            self.win.title("Добавить обслуживаемого")
+            today = datetime.today().strftime(self.DATE_FORMAT)
+            values = ["", "", "", today, "", "", today, today, ""]
+        else:
+            self.client_id = client[0]
+            self.win.title("Редактировать клиента")
+            values = [self.display_value(field, value)
+                      for (field, _, _), value in zip(CLIENT_FORM_FIELDS, client[1:])]
+        
+        for (field, _, _), value in zip(CLIENT_FORM_FIELDS, values):
+            entry = self.entries[field]
+            entry.delete(0, tk.END)
+            entry.insert(0, value)
         
-        if "Дата" in field:
-            entry = DateEntry(win, width=27, date_pattern="dd.mm.yyyy",
-                            font=ModernStyle.FONTS['body'])
+        self.win.deiconify()
+        self.win.lift()
+        self.entries["Фамилия"].focus_set()
+    
+    def hide(self):
+        if self.pending_check:
+            self.win.after_cancel(self.pending_check)
+            self.pending_check = None
+        self.win.withdraw()
+    
+    def display_value(self, field, value):
+        """Значение из базы в виде для поля формы (даты — ДД.ММ.ГГГГ)"""
+        if value is None:
+            return ""
+        if field in self.date_fields():
+            try:
+                return datetime.strptime(value, "%Y-%m-%d").strftime(self.DATE_FORMAT)
+            except ValueError:
+                return value  # нестандартное значение покажем как есть — проверка при сохранении
+        return str(value)
+    
+    @staticmethod
+    def date_fields():
+        return [field for field, _, is_date in CLIENT_FORM_FIELDS if is_date]
+    
+    def read_date(self, field):
+        """Дата поля в формате базы; '' для пустого поля, ValueError для неверной даты"""
+        text = self.entries[field].get().strip()
+        if not text:
+            return ""
+        try:
+            return datetime.strptime(text, self.DATE_FORMAT).strftime("%Y-%m-%d")
+        except ValueError:
+            raise ValueError(f"Поле '{field}': неверная дата '{text}', нужен формат ДД.ММ.ГГГГ")
+    
+    def read_form(self):
+        """Значения полей в порядке CLIENT_FORM_FIELDS; ValueError с текстом ошибки"""
+        values = []
+        for field, required, is_date in CLIENT_FORM_FIELDS:
+            value = self.read_date(field) if is_date else self.entries[field].get().strip()
+            if required and not value:
+                raise ValueError("Поля 'Фамилия', 'Имя' и 'Дата рождения' обязательны!")
+            values.append(value)
+        return values
+    
+    def check_duplicate(self):
+        self.pending_check = None
+        last = self.entries["Фамилия"].get().strip()
+        first = self.entries["Имя"].get().strip()
+        if not last or not first:
+            self.duplicate_label.config(text="")
+            return
+        try:
+            dob = self.read_date("Дата рождения")
+            dup_id = find_duplicate(last, first, self.entries["Отчество"].get().strip(), dob,
+                                    exclude_id=self.client_id)
+        except Exception:
+            return
+        if dup_id:
+            self.duplicate_label.config(text=f"⚠️ Такой клиент уже есть в базе (ID {dup_id})")
         else:
-            entry = tk.Entry(win, width=30, font=ModernStyle.FONTS['body'])
-        
-        entry.grid(row=row, column=1, padx=10, pady=5)
-        entries[field] = entry
-
-    def save_client():
-        last = entries["Фамилия"].get().strip()
-        first = entries["Имя"].get().strip()
-        middle = entries["Отчество"].get().strip()
-        dob = entries["Дата рождения"].get_date().strftime("%Y-%m-%d")
-        phone = entries["Телефон"].get().strip()
-        contract_number = entries["Номер договора"].get().strip()
-        ippcu_start = entries["Дата начала ИППСУ"].get_date().strftime("%Y-%m-%d")
-        ippcu_end = entries["Дата окончания ИППСУ"].get_date().strftime("%Y-%m-%d")
-        group = entries["Группа"].get().strip()
-
-        if not last or not first or not dob:
-            messagebox.showerror("Ошибка", "Поля 'Фамилия', 'Имя' и 'Дата рождения' обязательны!")
+            self.duplicate_label.config(text="")
+    
+    def schedule_duplicate_check(self, event=None):
+        if self.pending_check:
+            self.win.after_cancel(self.pending_check)
+        self.pending_check = self.win.after(300, self.check_duplicate)
+    
+    def save(self):
+        try:
+            values = self.read_form()
+        except ValueError as e:
+            messagebox.showerror("Ошибка", str(e), parent=self.win)
             return
-
+        
         try:
-            add_client(last, first, middle, dob, phone, contract_number, ippcu_start, ippcu_end, group)
-            refresh_tree()
-            win.destroy()
+            if self.client_id is None:
+                add_client(*values)
+            else:
+                update_client(self.client_id, *values)
         except ValueError as ve:
-            messagebox.showwarning("Дубликат", str(ve))
+            messagebox.showwarning("Дубликат", str(ve), parent=self.win)
+            return
         except Exception as e:
             traceback.print_exc()
-            messagebox.showerror("Ошибка", f"Не удалось добавить:\n{e}")
+            messagebox.showerror("Ошибка", f"Не удалось сохранить:\n{e}", parent=self.win)
+            return
+        self.hide()
+        refresh_tree()
 
-    save_btn = ttk.Button(win, text="Сохранить", style='Primary.TButton', command=save_client)
-    save_btn.grid(row=9, column=0, columnspan=2, pady=10)
+def get_client_dialog():
+    """Общее окно клиента (строится при первом открытии)"""
+    if not hasattr(root, 'client_dialog'):
+        root.client_dialog = ClientDialog(root)
+    return root.client_dialog
+
+def add_window():
+    get_client_dialog().open()
 
 def edit_client():
     """Окно редактирования клиента"""
@@ -2483,48 +3613,12 @@ def edit_client():
         messagebox.showwarning("Ошибка", "Выберите клиента для редактирования")
         return
 
-    values = tree.item(selected[0], "values")
-    cid = values[1]
-
-    last, first, middle = values[2], values[3], values[4]
-    dob, phone, contract = values[5], values[6], values[7]
-    ippcu_start, ippcu_end, group = values[8], values[9], values[10]
-
-    win = tk.Toplevel(root)
-    win.title("Редактировать клиента")
-    win.configure(bg=ModernStyle.COLORS['background'])
-
-    fields = [
-        ("Фамилия", last, 0), ("Имя", first, 1), ("Отчество", middle, 2),
-        ("Дата рождения", dob, 3), ("Телефон", phone, 4), ("Номер договора", contract, 5),
-        ("Дата начала ИППСУ", ippcu_start, 6), ("Дата окончания ИППСУ", ippcu_end, 7), ("Группа", group, 8)
-    ]
-
-    entries = {}
-    for field, value, row in fields:
-        tk.Label(win, text=field, bg=ModernStyle.COLORS['background'],
-                fg=ModernStyle.COLORS['text_primary'], font=ModernStyle.FONTS['body']).grid(row=row, column=0, padx=10, pady=5, sticky="w")
-        
-        if "Дата" in field:
-            entry = tk.Entry(win, width=30, font=ModernStyle.FONTS['body'])
-            entry.insert(0, value)
-        else:
-            entry = tk.Entry(win, width=30, font=ModernStyle.FONTS['body'])
-            entry.insert(0, value)
-        
-        entry.grid(row=row, column=1, padx=10, pady=5)
-        entries[field] = entry
-
-    def save_changes():
-        update_client(cid,
-                      entries["Фамилия"].get(), entries["Имя"].get(), entries["Отчество"].get(),
-                      entries["Дата рождения"].get(), entries["Телефон"].get(), entries["Номер договора"].get(),
-                      entries["Дата начала ИППСУ"].get(), entries["Дата окончания ИППСУ"].get(), entries["Группа"].get())
+    client = get_client(tree.set(selected[0], "ID"))
+    if client is None:
+        messagebox.showwarning("Ошибка", "Клиент не найден — возможно, он уже удалён")
         refresh_tree()
-        win.destroy()
-
-    save_btn = ttk.Button(win, text="Сохранить", style='Primary.TButton', command=save_changes)
-    save_btn.grid(row=9, column=0, columnspan=2, pady=10)
+        return
+    get_client_dialog().open(client)
 
 def delete_selected():
     selected = tree.selection()
@@ -2542,40 +3636,7 @@ def do_search():
     date_from = root.date_from_entry.get_date().strftime("%Y-%m-%d") if root.date_from_entry.get() else None
     date_to = root.date_to_entry.get_date().strftime("%Y-%m-%d") if root.date_to_entry.get() else None
 
-    with sqlite3.connect(DB_NAME) as conn:
-        cur = conn.cursor()
-        q = (query or "").strip().lower()
-        like = f"%{q}%"
-
-        sql = """
-            SELECT id, last_name, first_name, middle_name, dob, phone, contract_number, ippcu_start, ippcu_end, group_name
-            FROM clients
-            WHERE (
-                lower(last_name) LIKE ?
-                OR lower(first_name) LIKE ?
-                OR lower(COALESCE(middle_name,'')) LIKE ?
-                OR lower(last_name || ' ' || first_name || ' ' || COALESCE(middle_name,'')) LIKE ?
-                OR lower(contract_number) LIKE ?
-                OR lower(phone) LIKE ?
-                OR lower(COALESCE(group_name,'')) LIKE ?
-            )
-        """
-        params = [like, like, like, like, like, like, like]
-
-        if date_from:
-            sql += " AND DATE(ippcu_end) >= DATE(?) "
-            params.append(date_from)
-        if date_to:
-            sql += " AND DATE(ippcu_end) <= DATE(?) "
-            params.append(date_to)
-
-        sql += " ORDER BY lower(last_name), lower(first_name) LIMIT ?"
-        params.append(200)
-
-        cur.execute(sql, params)
-        results = cur.fetchall()
-
-    refresh_tree(results)
+    load_clients(query, date_from, date_to)
 
 def toggle_check(event):
     region = tree.identify("region", event.x, event.y)
@@ -2593,6 +3654,7 @@ def toggle_check(event):
     current = values[0]
     values[0] = "X" if current.strip() == "" else " "
     tree.item(row_id, values=values)
+    forget_sort_order("✓")
     if hasattr(root, 'update_word_count'):
         root.update_word_count()
 
@@ -2635,6 +3697,13 @@ def main():
             
         root.mainloop()
         
+    except migrations.MigrationError as e:
+        print(f"💥 {e}")
+        messagebox.showerror("Ошибка базы данных",
+                           f"Не удалось обновить базу данных:\n{e}\n\n"
+                           "Изменения отменены, данные не тронуты. "
+                           "Программа будет закрыта.")
+        root.destroy()
     except Exception as e:
         print(f"💥 Критическая ошибка запуска: {e}")
         # Пробуем запустить в демо-режиме
@@ -2650,6 +3719,7 @@ def main():
 def initialize_main_application():
     """Инициализация основного приложения после авторизации"""
     print("🔧 Инициализация основного приложения...")
+    started = time.perf_counter()
     
     try:
         # Обновляем заголовок окна
@@ -2706,14 +3776,45 @@ def initialize_main_application():
         tree.bind("<Button-3>", show_context_menu)
         tree.bind("<Button-1>", toggle_check)
         
-        # Загрузка данных
-        print("📥 Загрузка данных клиентов...")
-        refresh_tree()
+        # Снимок прошлого сеанса: таблица заполнена ещё до обращения к базе
+        snapshot = show_client_snapshot()
+        root.update_idletasks()
+        first_screen = time.perf_counter() - started
         
         print("✅ Основной интерфейс создан")
         
-        # === ВКЛАДКА ЧАТА ===
-        def initialize_chat():
+        # === СТАТУС ЗАПУСКА ===
+        def show_startup_status(results):
+            """Показать статус запуска в статусной строке"""
+            if hasattr(root, 'status_label'):
+                root.status_label.config(text="Приложение готово к работе")
+            print("🎉 Приложение успешно запущено и готово к работе")
+        
+        # === ЭТАПЫ ЗАПУСКА ===
+        # Каждый этап стартует, как только готовы его зависимости; этапы без
+        # виджетов (база, сеть) идут в фоне параллельно с построением вкладок
+        pipeline = StartupPipeline(root, STARTUP_LOG, on_finished=show_startup_status)
+        pipeline.mark_done("ui", time.perf_counter() - started)
+        if snapshot is not None:
+            pipeline.milestone("first_screen", first_screen)
+        
+        def show_clients(results):
+            # Изменения из других окон и рабочих мест: в простое — один PRAGMA раз в 2 с
+            root.client_watcher = ChangeWatcher(DB_NAME)
+            root.client_watcher.watch("clients", CLIENT_CHANGE_MARK, on_clients_changed)
+            if snapshot is None:
+                print("📥 Загрузка данных клиентов...")
+                refresh_tree()
+            elif reconcile_client_snapshot(snapshot, root.client_watcher.mark("clients")[0]):
+                print("📥 Снимок таблицы актуален")
+            else:
+                print("📥 Снимок таблицы устарел, данные перечитаны")
+            root.client_watcher.start(root)
+            data_ready = time.perf_counter() - started
+            pipeline.milestone("first_screen", data_ready)
+            pipeline.milestone("data_ready", data_ready)
+        
+        def initialize_chat(results):
             print("💬 Инициализация системы чата...")
             if not initialize_chat_system(notebook):
                 create_chat_stub(notebook)
@@ -2721,51 +3822,34 @@ def initialize_main_application():
             else:
                 print("✅ Чат: модуль инициализирован")
         
-        # Инициализируем чат с задержкой
-        root.after(1000, initialize_chat)
-        
-        # === ОТЛОЖЕННЫЕ ОПЕРАЦИИ ===
-        
-        def load_application_data():
-            """Загрузка данных приложения"""
-            try:
-                print("🔄 Обновление данных таблицы...")
-                refresh_tree()
-                
-                # Проверка обновлений
-                if settings_manager.get('auto_check_updates', True):
-                    print("🔍 Проверка обновлений...")
-                    updater.auto_update()
+        def initialize_notifications(results):
+            """Проверки уведомлений читают только базу — выполняются в фоне"""
+            if notification_system.initialize():
+                unread_count = notification_system.get_unread_count()
+                if unread_count > 0:
+                    print(f"🔔 Уведомления: {unread_count} непрочитанных")
                 else:
-                    print("⏸️ Проверка обновлений отключена")
-                    
-            except Exception as e:
-                print(f"❌ Ошибка загрузки данных приложения: {e}")
-                # Не показываем сообщение пользователю для некритичных ошибок
+                    print("🔔 Уведомления: система активна")
+            else:
+                print("⚠️ Уведомления: система отключена")
         
-        def initialize_notifications():
-            """Инициализация системы уведомлений"""
-            try:
-                if notification_system.initialize():
-                    unread_count = notification_system.get_unread_count()
-                    if unread_count > 0:
-                        print(f"🔔 Уведомления: {unread_count} непрочитанных")
-                    else:
-                        print("🔔 Уведомления: система активна")
-                else:
-                    print("⚠️ Уведомления: система отключена")
-            except Exception as e:
-                print(f"❌ Ошибка инициализации уведомлений: {e}")
+        def scan_ippcu(results):
+            print("🔒 Проверка ИППСУ...")
+            return collect_ippcu_warnings()
         
-        def initialize_security_checks():
-            """Инициализация проверок безопасности"""
-            try:
-                print("🔒 Проверка ИППСУ...")
-                check_expiring_ippcu()
-            except Exception as e:
-                print(f"❌ Ошибка проверки ИППСУ: {e}")
+        def check_updates(results):
+            """Сетевой запрос версии — в фоне, окно не ждёт ответа сервера"""
+            if not settings_manager.get('auto_check_updates', True):
+                print("⏸️ Проверка обновлений отключена")
+                return None
+            print("🔍 Проверка обновлений...")
+            return updater.check_for_update()
+        
+        def install_update(results):
+            if results["update_check"]:
+                updater.download_and_replace(results["update_check"])
         
-        def show_welcome_message():
+        def show_welcome_message(results):
             """Показать приветственное сообщение"""
             if AUTH_AVAILABLE and auth_manager.remember_me:
                 welcome_msg = f"Автоматический вход: {auth_manager.get_user_display_name()}"
@@ -2777,11 +3861,19 @@ def initialize_main_application():
             show_status_message(welcome_msg)
             print(f"👋 {welcome_msg}")
         
-        # Планируем отложенные операции с правильным порядком
-        root.after(500, load_application_data)        # Загрузка данных
-        root.after(1000, initialize_notifications)    # Уведомления
-        root.after(1500, initialize_security_checks)  # Проверки безопасности
-        root.after(2000, show_welcome_message)        # Приветственное сообщение
+        # Предупреждения и окно обновления — только после того, как таблица на экране
+        pipeline.add("clients", show_clients, deps=["ui"])
+        pipeline.add("notifications", initialize_notifications, tk=False)
+        pipeline.add("ippcu_scan", scan_ippcu, tk=False)
+        pipeline.add("update_check", check_updates, tk=False)
+        pipeline.add("welcome", show_welcome_message, deps=["clients"])
+        pipeline.add("chat", initialize_chat, deps=["clients"])
+        pipeline.add("ippcu_warning", lambda results: show_ippcu_warnings(results["ippcu_scan"]),
+                     deps=["ippcu_scan", "clients"])
+        pipeline.add("update_install", install_update, deps=["update_check", "ippcu_warning"])
+        # Окно клиента строится заранее, когда основной экран уже готов, — Ctrl+N без задержки
+        pipeline.add("client_dialog", lambda results: get_client_dialog().build(),
+                     deps=["welcome", "chat"])
         
         # === ОБРАБОТКА ЗАКРЫТИЯ ПРИЛОЖЕНИЯ ===
         def on_closing():
@@ -2792,10 +3884,18 @@ def initialize_main_application():
                 settings_manager.save_settings()
                 print("✅ Настройки сохранены")
                 
+                # Останавливаем получение сообщений чата
+                if hasattr(root, 'chat_manager'):
+                    root.chat_manager.stop_listening()
+                http_client.log_metrics()
+                
                 # Очищаем старые уведомления
                 if notification_system.is_initialized:
                     notification_system.clear_old_notifications()
                     print("✅ Уведомления очищены")
+                
+                save_client_snapshot()
+                print("✅ Снимок таблицы сохранён")
                     
             except Exception as e:
                 print(f"⚠️ Ошибка при завершении работы: {e}")
@@ -2805,14 +3905,7 @@ def initialize_main_application():
         
         root.protocol("WM_DELETE_WINDOW", on_closing)
         
-        # === СТАТУС ЗАПУСКА ===
-        def show_startup_status():
-            """Показать статус запуска в статусной строке"""
-            if hasattr(root, 'status_label'):
-                root.status_label.config(text="Приложение готово к работе")
-            print("🎉 Приложение успешно запущено и готово к работе")
-        
-        root.after(3000, show_startup_status)
+        pipeline.run()
         
     except Exception as e:
         print(f"❌ Критическая ошибка инициализации приложения: {e}")
@@ -2822,4 +3915,6 @@ def initialize_main_application():
         root.destroy()
 
 if __name__ == "__main__":
+    # Нужно для пула процессов поиска дублей в собранном exe
+    multiprocessing.freeze_support()
     main()
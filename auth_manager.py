@@ -4,91 +4,31 @@ import os
 import json
 import secrets
 from datetime import datetime, timedelta
+from password_hash import PasswordHasher
+import migrations
 
 class AuthManager:
     def __init__(self, db_path):
         self.db_path = db_path
         self.current_user = None
         self.remember_me = False
+        # Стоимость хеширования подбирается на машине один раз и хранится рядом с базой
+        self.hasher = PasswordHasher(os.path.join(os.path.dirname(db_path), "password_hash.json"))
         self.init_auth_db()
         self.load_remembered_user()
     
     def init_auth_db(self):
-        """Инициализация базы данных пользователей"""
+        """Таблицы пользователей и пользователи по умолчанию создаются миграциями"""
         with sqlite3.connect(self.db_path) as conn:
-            cur = conn.cursor()
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    username TEXT UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    full_name TEXT NOT NULL,
-                    role TEXT NOT NULL,
-                    permissions TEXT DEFAULT 'basic',
-                    is_active INTEGER DEFAULT 1,
-                    last_login TEXT,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS remember_tokens (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    token_hash TEXT NOT NULL,
-                    expires_at TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-                )
-            """)
-            
-            # Добавляем стандартных пользователей
-            default_users = [
-                {
-                    'username': 'admin',
-                    'password': 'admin',
-                    'full_name': 'Зеленков Д.В.',
-                    'role': 'младший администратор БД (Главный)',
-                    'permissions': 'all'
-                },
-                {
-                    'username': 'ДУРАНДИНА',
-                    'password': '12345',
-                    'full_name': 'Дурандина А.В.',
-                    'role': 'Заведующая',
-                    'permissions': 'all'
-                },
-                {
-                    'username': 'ЛАВРОВА',
-                    'password': '12345', 
-                    'full_name': 'Лаврова А.А.',
-                    'role': 'Сотрудник',
-                    'permissions': 'all'
-                }
-            ]
-            
-            for user in default_users:
-                password_hash = self.hash_password(user['password'])
-                try:
-                    cur.execute("""
-                        INSERT OR IGNORE INTO users 
-                        (username, password_hash, full_name, role, permissions) 
-                        VALUES (?, ?, ?, ?, ?)
-                    """, (user['username'], password_hash, user['full_name'], 
-                          user['role'], user['permissions']))
-                except sqlite3.IntegrityError:
-                    pass
-            
-            conn.commit()
+            migrations.migrate(conn)
     
     def hash_password(self, password):
-        """Хеширование пароля"""
-        return hashlib.sha256(password.encode()).hexdigest()
+        """Хеширование пароля (scrypt или PBKDF2 с солью)"""
+        return self.hasher.hash(password)
     
     def verify_password(self, password, password_hash):
-        """Проверка пароля"""
-        return self.hash_password(password) == password_hash
+        """Проверка пароля; занимает заметное время, вызывать вне потока Tk"""
+        return self.hasher.verify(password, password_hash)
     
     def generate_remember_token(self):
         """Генерация токена для запоминания"""
@@ -214,7 +154,11 @@ class AuthManager:
         return False
     
     def login(self, username, password, remember_me=False):
-        """Аутентификация пользователя"""
+        """Аутентификация пользователя.
+        
+        Проверка пароля занимает около TARGET_SECONDS, поэтому окно входа
+        вызывает этот метод из фонового потока.
+        """
         with sqlite3.connect(self.db_path) as conn:
             cur = conn.cursor()
             cur.execute("""
@@ -226,7 +170,12 @@ class AuthManager:
             user_data = cur.fetchone()
             
             if user_data and self.verify_password(password, user_data[2]):
-                user_id, username, _, full_name, role, permissions = user_data
+                user_id, username, password_hash, full_name, role, permissions = user_data
+                
+                # Старый или более дешёвый хеш пересчитываем, пока пароль известен
+                if self.hasher.needs_rehash(password_hash):
+                    cur.execute("UPDATE users SET password_hash = ? WHERE id = ?",
+                               (self.hash_password(password), user_id))
                 
                 # Обновляем время последнего входа
                 cur.execute("UPDATE users SET last_login = ? WHERE id = ?", 
@@ -0,0 +1,82 @@
+# Отслеживание изменений базы другими соединениями без перечитывания таблиц
+import sqlite3
+
+
+class ChangeWatcher:
+    """Дешёвый опрос изменений SQLite на одном постоянном соединении.
+
+    PRAGMA data_version меняется, только когда другое соединение (или другая
+    программа) зафиксировало транзакцию, поэтому в простое каждый опрос — это
+    один PRAGMA. При изменении перечитываются метки наблюдаемых таблиц
+    (например, максимальный id), и обработчик вызывается, только если его
+    метка сдвинулась.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.data_version = None
+        self.watches = {}
+        self._after_id = None
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = sqlite3.connect(self.db_path)
+        return self.conn
+
+    def watch(self, name, mark_sql, callback):
+        """Наблюдать за меткой mark_sql (запрос из одной строки).
+
+        callback(conn, old_mark, new_mark) получает постоянное соединение,
+        чтобы дочитать только строки после старой метки.
+        """
+        mark = self.connect().execute(mark_sql).fetchone()
+        self.watches[name] = [mark_sql, mark, callback]
+
+    def mark(self, name):
+        """Последняя прочитанная метка наблюдения name"""
+        return self.watches[name][1]
+
+    def unwatch(self, name):
+        self.watches.pop(name, None)
+
+    def poll(self):
+        """Проверить изменения; True, если база менялась с прошлого опроса"""
+        conn = self.connect()
+        version = conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self.data_version:
+            return False
+        self.data_version = version
+
+        for name, entry in list(self.watches.items()):
+            mark_sql, old_mark, callback = entry
+            new_mark = conn.execute(mark_sql).fetchone()
+            if new_mark == old_mark:
+                continue
+            entry[1] = new_mark
+            try:
+                callback(conn, old_mark, new_mark)
+            except Exception as e:
+                print(f"Ошибка обработки изменений ({name}): {e}")
+        return True
+
+    def start(self, widget, interval=2000):
+        """Опрашивать базу из цикла Tk каждые interval мс"""
+        def tick():
+            try:
+                self.poll()
+            except sqlite3.Error as e:
+                print(f"Ошибка проверки изменений базы: {e}")
+            self._after_id = widget.after(interval, tick)
+
+        self.stop(widget)
+        tick()
+
+    def stop(self, widget):
+        if self._after_id is not None:
+            widget.after_cancel(self._after_id)
+            self._after_id = None
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
@@ -0,0 +1,251 @@
+# Помесячный архив сообщений чата в отдельных сжатых базах
+import os
+import zlib
+from datetime import datetime, timezone
+
+# Сколько месяцев (включая текущий) сообщения остаются в основной таблице
+HOT_MONTHS = 2
+
+ARCHIVE_ALIAS = "arch"
+# Токенизатор полнотекстового поиска: без учёта регистра и диакритики
+FTS_TOKENIZE = "unicode61 remove_diacritics 2"
+
+
+def fts_text(expr):
+    """SQL-выражение текста для индекса: unicode61 не приравнивает «ё» к «е»"""
+    return f"replace(replace({expr}, 'ё', 'е'), 'Ё', 'Е')"
+
+
+def archive_dir(db_path):
+    return os.path.join(os.path.dirname(db_path), "chat_archive")
+
+
+def archive_path(db_path, month):
+    """Файл архива за месяц вида 2026-08"""
+    return os.path.join(archive_dir(db_path), f"chat_{month}.db")
+
+
+def compress(text):
+    return zlib.compress((text or "").encode("utf-8"))
+
+
+def decompress(blob):
+    return zlib.decompress(blob).decode("utf-8")
+
+
+def month_after(month):
+    """Начало следующего месяца как метка времени SQLite"""
+    year, mon = int(month[:4]), int(month[5:7])
+    year, mon = (year + 1, 1) if mon == 12 else (year, mon + 1)
+    return f"{year:04d}-{mon:02d}-01 00:00:00"
+
+
+def first_hot_month(now=None, hot_months=HOT_MONTHS):
+    """Самый ранний месяц, который остаётся в основной таблице"""
+    now = now or datetime.now(timezone.utc)
+    index = now.year * 12 + now.month - 1 - (hot_months - 1)
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def attach(conn, db_path, month):
+    """Подключить архив месяца; при необходимости создать таблицы и индекс поиска.
+    
+    Текст в архиве сжат, поэтому поисковый индекс бесконтентный (content=''):
+    он хранит только словарь, а фрагменты для выдачи строятся из
+    распакованного текста.
+    """
+    conn.create_function("chat_decompress", 1, decompress, deterministic=True)
+    conn.execute(f"ATTACH DATABASE ? AS {ARCHIVE_ALIAS}", (archive_path(db_path, month),))
+    conn.execute(f"""
+        CREATE TABLE IF NOT EXISTS {ARCHIVE_ALIAS}.messages (
+            id INTEGER PRIMARY KEY,
+            user_name TEXT NOT NULL,
+            message BLOB NOT NULL,
+            timestamp DATETIME,
+            message_type TEXT DEFAULT 'text'
+        )
+    """)
+    has_fts = conn.execute(
+        f"SELECT 1 FROM {ARCHIVE_ALIAS}.sqlite_master WHERE name = 'messages_fts'"
+    ).fetchone()
+    if not has_fts:
+        # Архивы, созданные до появления поиска, индексируются при первом подключении
+        with conn:
+            conn.execute(f"""
+                CREATE VIRTUAL TABLE {ARCHIVE_ALIAS}.messages_fts
+                USING fts5(message, content='', tokenize='{FTS_TOKENIZE}')
+            """)
+            conn.execute(f"""
+                INSERT INTO {ARCHIVE_ALIAS}.messages_fts (rowid, message)
+                SELECT id, {fts_text('chat_decompress(message)')} FROM {ARCHIVE_ALIAS}.messages
+            """)
+
+
+def detach(conn):
+    conn.execute(f"DETACH DATABASE {ARCHIVE_ALIAS}")
+
+
+def rollover(conn, db_path, now=None, hot_months=HOT_MONTHS):
+    """Перенести сообщения старше hot_months месяцев в архивы по месяцам.
+
+    Месяц переносится одной транзакцией по обеим базам: копия в архив со
+    сжатием текста, удаление из chat_messages и запись в оглавление. Сообщения
+    идут по id в порядке времени, поэтому граница месяца ищется обходом
+    первичного ключа с начала таблицы. Возвращает число перенесённых сообщений.
+    """
+    conn.create_function("chat_compress", 1, compress, deterministic=True)
+    cur = conn.cursor()
+    keep_from = first_hot_month(now, hot_months)
+    moved = 0
+
+    while True:
+        row = cur.execute("SELECT id, timestamp FROM chat_messages ORDER BY id LIMIT 1").fetchone()
+        if not row or not row[1] or row[1][:7] >= keep_from:
+            break
+        month = row[1][:7]
+        boundary = cur.execute(
+            "SELECT id FROM chat_messages WHERE timestamp >= ? ORDER BY id LIMIT 1",
+            (month_after(month),)
+        ).fetchone()
+        if boundary:
+            boundary = boundary[0]
+        else:
+            boundary = cur.execute("SELECT MAX(id) FROM chat_messages").fetchone()[0] + 1
+
+        os.makedirs(archive_dir(db_path), exist_ok=True)
+        attach(conn, db_path, month)
+        try:
+            with conn:
+                cur.execute(f"""
+                    INSERT INTO {ARCHIVE_ALIAS}.messages_fts (rowid, message)
+                    SELECT id, {fts_text('message')} FROM main.chat_messages
+                    WHERE id < ? AND id NOT IN (SELECT id FROM {ARCHIVE_ALIAS}.messages)
+                """, (boundary,))
+                cur.execute(f"""
+                    INSERT OR IGNORE INTO {ARCHIVE_ALIAS}.messages
+                        (id, user_name, message, timestamp, message_type)
+                    SELECT id, user_name, chat_compress(message), timestamp, message_type
+                    FROM main.chat_messages WHERE id < ?
+                """, (boundary,))
+                cur.execute("DELETE FROM main.chat_messages WHERE id < ?", (boundary,))
+                count = cur.rowcount
+                cur.execute(f"""
+                    INSERT INTO chat_archives (month, first_id, last_id, message_count)
+                    SELECT ?, MIN(id), MAX(id), COUNT(*) FROM {ARCHIVE_ALIAS}.messages
+                    WHERE 1
+                    ON CONFLICT(month) DO UPDATE SET
+                        first_id = excluded.first_id,
+                        last_id = excluded.last_id,
+                        message_count = excluded.message_count
+                """, (month,))
+        finally:
+            detach(conn)
+        moved += count
+        print(f"📦 Чат: {count} сообщений за {month} перенесено в архив")
+    return moved
+
+
+def fetch_before(conn, db_path, before_id, limit):
+    """Страница архивных сообщений с id меньше before_id, новые первыми.
+
+    Архивы подключаются по одному и только те, чей диапазон id лежит
+    раньше before_id; строки в формате ChatManager.get_messages.
+    """
+    months = conn.execute(
+        "SELECT month FROM chat_archives WHERE first_id < ? ORDER BY last_id DESC",
+        (before_id,)
+    ).fetchall()
+
+    rows = []
+    for (month,) in months:
+        if len(rows) >= limit:
+            break
+        if not os.path.exists(archive_path(db_path, month)):
+            continue
+        attach(conn, db_path, month)
+        try:
+            part = conn.execute(f"""
+                SELECT m.id, m.user_name, cu.full_name, m.message, m.timestamp, m.message_type
+                FROM {ARCHIVE_ALIAS}.messages m
+                LEFT JOIN main.chat_users cu ON m.user_name = cu.user_name
+                WHERE m.id < ?
+                ORDER BY m.id DESC
+                LIMIT ?
+            """, (before_id, limit - len(rows))).fetchall()
+        finally:
+            detach(conn)
+        rows.extend((mid, user, full, decompress(text), ts, kind)
+                    for mid, user, full, text, ts, kind in part)
+        if part:
+            before_id = part[-1][0]
+    return rows
+
+
+def fetch_after(conn, db_path, after_id, limit):
+    """Архивные сообщения с id больше after_id по возрастанию id"""
+    months = conn.execute(
+        "SELECT month FROM chat_archives WHERE last_id > ? ORDER BY first_id",
+        (after_id,)
+    ).fetchall()
+
+    rows = []
+    for (month,) in months:
+        if len(rows) >= limit:
+            break
+        if not os.path.exists(archive_path(db_path, month)):
+            continue
+        attach(conn, db_path, month)
+        try:
+            part = conn.execute(f"""
+                SELECT m.id, m.user_name, cu.full_name, m.message, m.timestamp, m.message_type
+                FROM {ARCHIVE_ALIAS}.messages m
+                LEFT JOIN main.chat_users cu ON m.user_name = cu.user_name
+                WHERE m.id > ?
+                ORDER BY m.id
+                LIMIT ?
+            """, (after_id, limit - len(rows))).fetchall()
+        finally:
+            detach(conn)
+        rows.extend((mid, user, full, decompress(text), ts, kind)
+                    for mid, user, full, text, ts, kind in part)
+        if part:
+            after_id = part[-1][0]
+    return rows
+
+
+def search(conn, db_path, fts_query, limit):
+    """Поиск по всем архивам: (id, user_name, full_name, текст, время, ранг)"""
+    months = conn.execute("SELECT month FROM chat_archives ORDER BY last_id DESC").fetchall()
+
+    hits = []
+    for (month,) in months:
+        if not os.path.exists(archive_path(db_path, month)):
+            continue
+        attach(conn, db_path, month)
+        try:
+            part = conn.execute(f"""
+                SELECT m.id, m.user_name, cu.full_name, m.message, m.timestamp, f.rank
+                FROM {ARCHIVE_ALIAS}.messages_fts f
+                JOIN {ARCHIVE_ALIAS}.messages m ON m.id = f.rowid
+                LEFT JOIN main.chat_users cu ON m.user_name = cu.user_name
+                WHERE f.messages_fts MATCH ?
+                ORDER BY f.rank
+                LIMIT ?
+            """, (fts_query, limit)).fetchall()
+        finally:
+            detach(conn)
+        hits.extend((mid, user, full, decompress(text), ts, rank)
+                    for mid, user, full, text, ts, rank in part)
+    return hits
+
+
+def clear(conn, db_path):
+    """Удалить все архивы и их оглавление"""
+    months = conn.execute("SELECT month FROM chat_archives").fetchall()
+    conn.execute("DELETE FROM chat_archives")
+    conn.commit()
+    for (month,) in months:
+        try:
+            os.remove(archive_path(db_path, month))
+        except OSError:
+            pass
@@ -0,0 +1,198 @@
+# Нагрузочная проверка сервера чата: пропускная способность и задержка доставки
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class HttpConnection:
+    """Минимальный HTTP/1.1-клиент с keep-alive поверх asyncio"""
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = (f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode("latin-1") + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return status, json.loads(data) if data else None
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def listener(host, port, start_id, expected, latencies, done, stop):
+    """Клиент длинного опроса: отмечает задержку каждого полученного сообщения"""
+    conn = HttpConnection(host, port)
+    after_id, received = start_id, 0
+    try:
+        while received < expected and not stop.is_set():
+            status, messages = await conn.request("GET", f"/get_messages?after_id={after_id}&wait=20")
+            now = time.time()
+            if status != 200:
+                await asyncio.sleep(0.5)
+                continue
+            for msg in messages:
+                after_id = msg["id"]
+                if msg["message"].startswith("lt "):
+                    latencies.append(now - float(msg["message"].split()[1]))
+                    received += 1
+    finally:
+        done.append(received)
+        await conn.close()
+
+
+async def sender(host, port, count, rate, send_times, rejected):
+    conn = HttpConnection(host, port)
+    interval = 1.0 / rate if rate else 0
+    try:
+        for i in range(count):
+            started = time.time()
+            status, _ = await conn.request("POST", "/send_message",
+                                           {"user": "loadtest", "message": f"lt {started} {i}"})
+            if status == 200:
+                send_times.append(time.time() - started)
+            else:
+                rejected.append(status)
+            if interval:
+                await asyncio.sleep(max(0.0, interval - (time.time() - started)))
+    finally:
+        await conn.close()
+
+
+async def run(args, host, port):
+    probe = HttpConnection(host, port)
+    _, latest = await probe.request("GET", "/get_messages?limit=1")
+    await probe.close()
+    start_id = latest[-1]["id"] if latest else 0
+    expected = args.senders * args.messages
+
+    latencies, done, send_times, rejected = [], [], [], []
+    stop = asyncio.Event()
+    listeners = []
+    for i in range(args.clients):
+        listeners.append(asyncio.create_task(
+            listener(host, port, start_id, expected, latencies, done, stop)))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)
+    await asyncio.sleep(1.0)  # все клиенты встали в ожидание
+
+    started = time.time()
+    await asyncio.gather(*(sender(host, port, args.messages, args.rate, send_times, rejected)
+                           for _ in range(args.senders)))
+    send_elapsed = time.time() - started
+
+    try:
+        await asyncio.wait_for(asyncio.gather(*listeners), args.drain_timeout)
+    except asyncio.TimeoutError:
+        stop.set()
+    total_elapsed = time.time() - started
+
+    sent = len(send_times)
+    print(f"Клиентов в ожидании:   {args.clients}")
+    print(f"Отправлено сообщений:  {sent} (отклонено: {len(rejected)}) за {send_elapsed:.2f} с")
+    print(f"Пропускная способность: {sent / send_elapsed:.0f} сообщ./с на запись, "
+          f"{len(latencies) / total_elapsed:.0f} доставок/с")
+    print(f"Доставлено:            {len(latencies)} из {sent * args.clients}")
+    print(f"Ответ на отправку:     p50 {percentile(send_times, 50) * 1000:.1f} мс, "
+          f"p99 {percentile(send_times, 99) * 1000:.1f} мс")
+    print(f"Задержка доставки:     p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+          f"p99 {percentile(latencies, 99) * 1000:.1f} мс, "
+          f"макс {max(latencies, default=0) * 1000:.1f} мс")
+
+
+async def wait_for_port(host, port, timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("Сервер чата не запустился")
+
+
+def raise_file_limit():
+    """Тысячи соединений требуют поднять лимит открытых файлов"""
+    if resource is None:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = hard if hard != resource.RLIM_INFINITY else 65536
+    if soft < target:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест сервера чата")
+    parser.add_argument("--url", help="адрес запущенного сервера; без него сервер "
+                                      "запускается локально на временной базе")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--clients", type=int, default=1000, help="клиентов в длинном опросе")
+    parser.add_argument("--senders", type=int, default=10)
+    parser.add_argument("--messages", type=int, default=50, help="сообщений на отправителя")
+    parser.add_argument("--rate", type=float, default=20, help="сообщений в секунду на "
+                                                               "отправителя, 0 — без паузы")
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    args = parser.parse_args()
+    raise_file_limit()
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = "127.0.0.1", args.port
+        db_path = os.path.join(tempfile.mkdtemp(), "chat_loadtest.db")
+        server = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(
+            os.path.abspath(__file__)), "chat_server.py"),
+            "--host", host, "--port", str(port), "--db", db_path])
+    try:
+        if server:
+            asyncio.run(wait_for_port(host, port))
+        asyncio.run(run(args, host, port))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,63 @@
 import sqlite3
 import os
+import re
 from datetime import datetime
 from tkinter import messagebox
+import chat_archive
+import migrations
+from presence import PresenceTracker
 
 # Пути
 APP_DIR = os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp")
 DB_NAME = os.path.join(APP_DIR, "clients.db")
 
+# Верхняя граница id (максимум INTEGER в SQLite) для выборки без before_id
+MAX_MESSAGE_ID = 2 ** 63 - 1
+
+# Длина фрагмента текста вокруг найденного слова в результатах поиска
+SNIPPET_CHARS = 80
+
+# Присутствие в памяти процесса вместо флага is_online в базе: замена сервера
+# присутствия для локального чата, истекает без сигналов
+local_presence = PresenceTracker()
+
+
+def fts_query(text):
+    """Строка поиска пользователя в запрос FTS5: все слова, каждое как префикс"""
+    words = re.findall(r"\w+", (text or "").replace("ё", "е").replace("Ё", "Е"))
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def make_snippet(text, query):
+    """Фрагмент сообщения вокруг первого совпадения, совпадения в «»"""
+    words = [w.casefold().replace("ё", "е") for w in re.findall(r"\w+", query or "")]
+    folded = text.casefold().replace("ё", "е")
+    positions = []
+    for word in words:
+        match = re.search(r"\b" + re.escape(word), folded)
+        if match:
+            positions.append(match.start())
+    start = max(0, min(positions) - SNIPPET_CHARS // 3) if positions else 0
+    fragment = text[start:start + SNIPPET_CHARS]
+    if words:
+        fragment = re.sub(r"\b(" + "|".join(re.escape(w).replace("е", "[её]") for w in words) + r")\w*",
+                          lambda m: f"«{m.group(0)}»",
+                          fragment, flags=re.IGNORECASE)
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if start + SNIPPET_CHARS < len(text) else ""
+    return prefix + fragment.replace("\n", " ") + suffix
+
 class ChatManager:
     def __init__(self):
         self.current_user = "user1"  # Можно сделать выбор пользователя
         self.unread_count = 0
         self.init_chat_tables()
+        self.archive_old_messages()
         
     def init_chat_tables(self):
-        """Инициализация таблиц чата"""
+        """Инициализация таблиц чата (миграции схемы)"""
         with sqlite3.connect(DB_NAME) as conn:
-            cur = conn.cursor()
-            
-            # Таблица для сообщений чата
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS chat_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_name TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                    message_type TEXT DEFAULT 'text',
-                    is_read INTEGER DEFAULT 0
-                )
-            """)
-            
-            # Таблица для пользователей чата
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS chat_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_name TEXT UNIQUE NOT NULL,
-                    full_name TEXT NOT NULL,
-                    role TEXT DEFAULT 'employee',
-                    is_online INTEGER DEFAULT 0,
-                    last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Добавляем стандартных пользователей
-            default_users = [
-                ("admin", "Зеленков Д.В.", "admin"),
-                ("manager", "Дурандина А.В.", "manager"),
-                ("social1", "Социальный работник 1", "employee"),
-                ("social2", "Социальный работник 2", "employee"),
-                ("social3", "Социальный работник 3", "employee")
-            ]
-            
-            for username, fullname, role in default_users:
-                try:
-                    cur.execute(
-                        "INSERT OR IGNORE INTO chat_users (user_name, full_name, role) VALUES (?, ?, ?)",
-                        (username, fullname, role)
-                    )
-                except Exception as e:
-                    print(f"Ошибка добавления пользователя {username}: {e}")
-            
-            conn.commit()
+            migrations.migrate(conn)
     
     def send_message(self, message, message_type="text"):
         """Отправка сообщения в чат"""
@@ -80,8 +77,24 @@ class ChatManager:
             messagebox.showerror("Ошибка", f"Не удалось отправить сообщение: {e}")
             return False
     
-    def get_messages(self, limit=100, offset=0):
-        """Получение сообщений из чата"""
+    def archive_old_messages(self):
+        """Перенос старых месяцев переписки в архивные базы"""
+        try:
+            with sqlite3.connect(DB_NAME) as conn:
+                moved = chat_archive.rollover(conn, DB_NAME)
+            if moved:
+                print(f"✅ Чат: в архив перенесено {moved} сообщений")
+        except Exception as e:
+            print(f"Ошибка архивации сообщений чата: {e}")
+    
+    def get_messages(self, limit=100, offset=0, before_id=None):
+        """Получение сообщений из чата, новые первыми.
+        
+        Порядок по id (обход первичного ключа), а не по неиндексированному
+        timestamp; before_id позволяет листать историю без OFFSET. Когда
+        основная таблица кончается, страница дополняется из помесячных
+        архивов (только при листании по before_id).
+        """
         try:
             with sqlite3.connect(DB_NAME) as conn:
                 cur = conn.cursor()
@@ -89,64 +102,176 @@ class ChatManager:
                     SELECT cm.id, cm.user_name, cu.full_name, cm.message, cm.timestamp, cm.message_type
                     FROM chat_messages cm
                     LEFT JOIN chat_users cu ON cm.user_name = cu.user_name
-                    ORDER BY cm.timestamp DESC
+                    WHERE cm.id < ?
+                    ORDER BY cm.id DESC
                     LIMIT ? OFFSET ?
-                """, (limit, offset))
-                return cur.fetchall()
+                """, (before_id if before_id is not None else MAX_MESSAGE_ID, limit, offset))
+                messages = cur.fetchall()
+                if len(messages) < limit and not offset:
+                    if messages:
+                        before_id = messages[-1][0]
+                    elif before_id is None:
+                        before_id = MAX_MESSAGE_ID
+                    messages += chat_archive.fetch_before(conn, DB_NAME, before_id,
+                                                          limit - len(messages))
+                return messages
+        except Exception as e:
+            print(f"Ошибка получения сообщений: {e}")
+            return []
+    
+    def get_last_read_id(self, cur):
+        """id последнего прочитанного текущим пользователем сообщения"""
+        row = cur.execute("SELECT last_read_id FROM chat_read_cursors WHERE user_name = ?",
+                          (self.current_user,)).fetchone()
+        return row[0] if row else 0
+    
+    def count_unread(self, cur):
+        """Число сообщений других пользователей после курсора (диапазон первичного ключа)"""
+        cur.execute("SELECT COUNT(*) FROM chat_messages WHERE id > ? AND user_name != ?",
+                   (self.get_last_read_id(cur), self.current_user))
+        return cur.fetchone()[0]
+    
+    def move_read_cursor(self, cur, up_to_id):
+        """Сдвинуть курсор прочтения текущего пользователя (назад не двигается)"""
+        cur.execute("""
+            INSERT INTO chat_read_cursors (user_name, last_read_id) VALUES (?, ?)
+            ON CONFLICT(user_name) DO UPDATE SET
+                last_read_id = MAX(last_read_id, excluded.last_read_id)
+        """, (self.current_user, up_to_id))
+    
+    def get_messages_after(self, after_id, limit=50):
+        """Сообщения после after_id по возрастанию id, включая архивные месяцы"""
+        try:
+            with sqlite3.connect(DB_NAME) as conn:
+                messages = chat_archive.fetch_after(conn, DB_NAME, after_id, limit)
+                if len(messages) < limit:
+                    if messages:
+                        after_id = messages[-1][0]
+                    messages += conn.execute("""
+                        SELECT cm.id, cm.user_name, cu.full_name, cm.message, cm.timestamp, cm.message_type
+                        FROM chat_messages cm
+                        LEFT JOIN chat_users cu ON cm.user_name = cu.user_name
+                        WHERE cm.id > ?
+                        ORDER BY cm.id
+                        LIMIT ?
+                    """, (after_id, limit - len(messages))).fetchall()
+                return messages
         except Exception as e:
             print(f"Ошибка получения сообщений: {e}")
             return []
     
+    def search_messages(self, text, limit=30):
+        """Полнотекстовый поиск по чату и архивам.
+        
+        Возвращает до limit результатов (id, user_name, full_name, время,
+        фрагмент), лучшие первыми по рангу bm25.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        try:
+            with sqlite3.connect(DB_NAME) as conn:
+                hits = conn.execute("""
+                    SELECT cm.id, cm.user_name, cu.full_name, cm.message, cm.timestamp, f.rank
+                    FROM chat_messages_fts f
+                    JOIN chat_messages cm ON cm.id = f.rowid
+                    LEFT JOIN chat_users cu ON cm.user_name = cu.user_name
+                    WHERE chat_messages_fts MATCH ?
+                    ORDER BY f.rank
+                    LIMIT ?
+                """, (query, limit)).fetchall()
+                hits += chat_archive.search(conn, DB_NAME, query, limit)
+        except Exception as e:
+            print(f"Ошибка поиска по чату: {e}")
+            return []
+        hits.sort(key=lambda hit: (hit[5], -hit[0]))
+        return [(mid, user, full, ts, make_snippet(message, text))
+                for mid, user, full, message, ts, _ in hits[:limit]]
+    
     def get_unread_count(self):
         """Получение количества непрочитанных сообщений"""
         try:
             with sqlite3.connect(DB_NAME) as conn:
-                cur = conn.cursor()
-                cur.execute("SELECT COUNT(*) FROM chat_messages WHERE is_read = 0 AND user_name != ?", 
-                           (self.current_user,))
-                return cur.fetchone()[0]
+                return self.count_unread(conn.cursor())
         except:
             return 0
     
-    def mark_as_read(self):
-        """Пометить все сообщения как прочитанные"""
+    def mark_as_read(self, up_to_id=None):
+        """Пометить сообщения как прочитанные текущим пользователем.
+        
+        Сдвигает курсор пользователя (одна строка) до up_to_id или до
+        последнего сообщения.
+        """
         try:
             with sqlite3.connect(DB_NAME) as conn:
                 cur = conn.cursor()
-                cur.execute("UPDATE chat_messages SET is_read = 1 WHERE user_name != ?", 
-                           (self.current_user,))
+                if up_to_id is None:
+                    up_to_id = cur.execute("SELECT COALESCE(MAX(id), 0) FROM chat_messages").fetchone()[0]
+                self.move_read_cursor(cur, up_to_id)
                 conn.commit()
         except Exception as e:
             print(f"Ошибка пометки сообщений как прочитанных: {e}")
     
-    def get_online_users(self):
-        """Получить список онлайн пользователей"""
-        try:
-            with sqlite3.connect(DB_NAME) as conn:
-                cur = conn.cursor()
-                cur.execute("""
-                    SELECT full_name, role, last_seen 
-                    FROM chat_users 
-                    WHERE is_online = 1 
-                    ORDER BY role, full_name
-                """)
-                return cur.fetchall()
-        except:
-            return []
-    
-    def set_user_online(self, online=True):
-        """Установить статус пользователя"""
+    def fetch_updates(self, after_id=0, limit=50):
+        """Сообщения после after_id по возрастанию id и число непрочитанных.
+        
+        При after_id = 0 возвращает последние limit сообщений. Показанные
+        сообщения помечаются прочитанными; всё — в одном соединении.
+        """
         try:
             with sqlite3.connect(DB_NAME) as conn:
                 cur = conn.cursor()
-                cur.execute("""
-                    UPDATE chat_users 
-                    SET is_online = ?, last_seen = CURRENT_TIMESTAMP 
-                    WHERE user_name = ?
-                """, (1 if online else 0, self.current_user))
+                if after_id:
+                    cur.execute("""
+                        SELECT cm.id, cm.user_name, cu.full_name, cm.message, cm.timestamp, cm.message_type
+                        FROM chat_messages cm
+                        LEFT JOIN chat_users cu ON cm.user_name = cu.user_name
+                        WHERE cm.id > ?
+                        ORDER BY cm.id
+                    """, (after_id,))
+                    messages = cur.fetchall()
+                else:
+                    cur.execute("""
+                        SELECT cm.id, cm.user_name, cu.full_name, cm.message, cm.timestamp, cm.message_type
+                        FROM chat_messages cm
+                        LEFT JOIN chat_users cu ON cm.user_name = cu.user_name
+                        ORDER BY cm.id DESC
+                        LIMIT ?
+                    """, (limit,))
+                    messages = cur.fetchall()[::-1]
+                if messages:
+                    self.move_read_cursor(cur, messages[-1][0])
+                unread = self.count_unread(cur)
                 conn.commit()
+                return messages, unread
         except Exception as e:
-            print(f"Ошибка установки статуса пользователя: {e}")
+            print(f"Ошибка получения сообщений: {e}")
+            return [], 0
+    
+    def get_online_users(self):
+        """Получить список онлайн пользователей (full_name, role, в сети с)"""
+        local_presence.expire()
+        users = [(u.get('full_name', u['user']), u.get('role', ''), u['since'])
+                 for u in local_presence.online()]
+        return sorted(users, key=lambda u: (u[1], u[0]))
+    
+    def set_user_online(self, online=True):
+        """Сигнал присутствия текущего пользователя.
+        
+        База не трогается: статус живёт в памяти и истекает через
+        PRESENCE_TTL, если сигнал не повторять.
+        """
+        if not online:
+            local_presence.leave(self.current_user)
+            return
+        entry = local_presence.users.get(self.current_user)
+        if entry is None:
+            # Имя и роль читаются один раз при входе, повторные сигналы базу не читают
+            full_name, role = self.get_user_info() or (self.current_user, 'employee')
+            info = {'full_name': full_name, 'role': role}
+        else:
+            info = entry[1]
+        local_presence.heartbeat(self.current_user, info)
     
     def get_user_info(self, username=None):
         """Получить информацию о пользователе"""
@@ -176,6 +301,7 @@ class ChatManager:
                 cur = conn.cursor()
                 cur.execute("DELETE FROM chat_messages")
                 conn.commit()
+                chat_archive.clear(conn, DB_NAME)
             return True
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось очистить историю: {e}")
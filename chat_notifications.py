@@ -6,78 +6,114 @@ from chat_manager import ChatManager
 class ChatNotifications:
     def __init__(self, chat_manager):
         self.chat_manager = chat_manager
+        self.db_path = os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp", "clients.db")
         self.setup_automatic_messages()
     
     def setup_automatic_messages(self):
-        """Настройка автоматических сообщений"""
-        self.send_daily_greeting()
-        self.send_ippcu_reminders()
-        self.send_birthday_reminders()
+        """Настройка автоматических сообщений.
+        
+        Кандидаты собираются со всех проверок и публикуются одной транзакцией,
+        поэтому повторный запуск программы (на любом рабочем месте) не
+        дублирует уже отправленные сообщения.
+        """
+        candidates = []
+        candidates += self.daily_greeting()
+        candidates += self.ippcu_reminders()
+        candidates += self.birthday_reminders()
+        return self.post_once(candidates)
     
-    def send_daily_greeting(self):
-        """Ежедневное приветственное сообщение"""
-        # Проверяем, не отправляли ли сегодня уже приветствие
-        today = datetime.now().strftime("%Y-%m-%d")
+    def post_once(self, candidates):
+        """Опубликовать сообщения, ещё не записанные в журнал.
+        
+        candidates — список (вид, субъект, дата, текст, тип сообщения).
+        BEGIN IMMEDIATE берёт блокировку записи сразу, поэтому два рабочих
+        места не могут одновременно занять одну запись журнала; INSERT OR
+        IGNORE по первичному ключу отсекает уже отправленные. Возвращает
+        число опубликованных сообщений.
+        """
+        if not candidates:
+            return 0
         try:
-            with sqlite3.connect(os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp", "clients.db")) as conn:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            try:
                 cur = conn.cursor()
-                cur.execute("""
-                    SELECT COUNT(*) FROM chat_messages 
-                    WHERE message LIKE 'Доброе утро%' 
-                    AND DATE(timestamp) = ?
-                """, (today,))
-                count = cur.fetchone()[0]
-                
-                if count == 0:
-                    greeting = f"Доброе утро! Сегодня {datetime.now().strftime('%d.%m.%Y')}. Удачи в работе! 🌞"
-                    self.chat_manager.send_system_message(greeting)
+                cur.execute("BEGIN IMMEDIATE")
+                messages = []
+                for kind, subject, day, text, message_type in candidates:
+                    cur.execute(
+                        "INSERT OR IGNORE INTO chat_notification_ledger (kind, subject, day) VALUES (?, ?, ?)",
+                        (kind, subject, day)
+                    )
+                    if cur.rowcount == 1:
+                        messages.append((self.chat_manager.current_user, text, message_type))
+                cur.executemany(
+                    "INSERT INTO chat_messages (user_name, message, message_type) VALUES (?, ?, ?)",
+                    messages
+                )
+                cur.execute("COMMIT")
+                return len(messages)
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
         except Exception as e:
-            print(f"Ошибка отправки приветствия: {e}")
+            print(f"Ошибка отправки автоматических сообщений: {e}")
+            return 0
+    
+    def daily_greeting(self):
+        """Ежедневное приветственное сообщение"""
+        today = datetime.now()
+        greeting = f"Доброе утро! Сегодня {today.strftime('%d.%m.%Y')}. Удачи в работе! 🌞"
+        return [("greeting", "", today.strftime("%Y-%m-%d"), greeting, "system")]
     
-    def send_ippcu_reminders(self):
-        """Напоминания о ИППСУ через чат"""
+    def ippcu_reminders(self):
+        """Напоминания о ИППСУ через чат: одно на каждый срок окончания"""
         today = datetime.today().date()
         soon = today + timedelta(days=3)
+        candidates = []
         
         try:
-            with sqlite3.connect(os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp", "clients.db")) as conn:
+            with sqlite3.connect(self.db_path) as conn:
                 cur = conn.cursor()
                 cur.execute("""
-                    SELECT last_name, first_name, ippcu_end 
+                    SELECT id, last_name, first_name, ippcu_end 
                     FROM clients 
                     WHERE ippcu_end BETWEEN ? AND ?
                 """, (today.strftime("%Y-%m-%d"), soon.strftime("%Y-%m-%d")))
                 
                 expiring_clients = cur.fetchall()
                 
-                for last_name, first_name, ippcu_end in expiring_clients:
+                for client_id, last_name, first_name, ippcu_end in expiring_clients:
                     end_date = datetime.strptime(ippcu_end, "%Y-%m-%d").date()
                     days_left = (end_date - today).days
                     
                     if days_left <= 3:
                         message = f"⚠️ Внимание! ИППСУ клиента {last_name} {first_name} истекает через {days_left} дн. ({end_date.strftime('%d.%m.%Y')})"
-                        self.chat_manager.send_alert_message(message)
+                        candidates.append(("ippcu", str(client_id), ippcu_end, message, "alert"))
                         
         except Exception as e:
-            print(f"Ошибка отправки напоминаний ИППСУ: {e}")
+            print(f"Ошибка подготовки напоминаний ИППСУ: {e}")
+        return candidates
     
-    def send_birthday_reminders(self):
-        """Напоминания о днях рождения"""
+    def birthday_reminders(self):
+        """Напоминания о днях рождения: одно на каждый день рождения"""
         today = datetime.today().date()
         next_week = today + timedelta(days=7)
+        candidates = []
         
         try:
-            with sqlite3.connect(os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp", "clients.db")) as conn:
+            with sqlite3.connect(self.db_path) as conn:
                 cur = conn.cursor()
                 cur.execute("""
-                    SELECT last_name, first_name, middle_name, dob 
+                    SELECT id, last_name, first_name, middle_name, dob 
                     FROM clients 
                     WHERE substr(dob, 6, 5) BETWEEN ? AND ?
                 """, (today.strftime("%m-%d"), next_week.strftime("%m-%d")))
                 
                 birthdays = cur.fetchall()
                 
-                for last_name, first_name, middle_name, dob in birthdays:
+                for client_id, last_name, first_name, middle_name, dob in birthdays:
                     bday = datetime.strptime(dob, "%Y-%m-%d").date()
                     bday_this_year = bday.replace(year=today.year)
                     days_until = (bday_this_year - today).days
@@ -85,10 +121,12 @@ class ChatNotifications:
                     if days_until >= 0:
                         middle = f" {middle_name}" if middle_name else ""
                         message = f"🎂 Через {days_until} дн. день рождения у {last_name} {first_name}{middle} ({bday.strftime('%d.%m')})"
-                        self.chat_manager.send_system_message(message)
+                        candidates.append(("birthday", str(client_id),
+                                           bday_this_year.strftime("%Y-%m-%d"), message, "system"))
                         
         except Exception as e:
-            print(f"Ошибка отправки напоминаний о днях рождения: {e}")
+            print(f"Ошибка подготовки напоминаний о днях рождения: {e}")
+        return candidates
     
     def send_custom_alert(self, message, alert_type="system"):
         """Отправка пользовательского уведомления"""
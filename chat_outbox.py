@@ -0,0 +1,111 @@
+# Локальная очередь исходящих сообщений чата: переживает обрыв связи и перезапуск
+import random
+import sqlite3
+import time
+import uuid
+from datetime import datetime, timedelta
+
+# Предел паузы между повторами отправки, секунды
+MAX_RETRY_DELAY = 300
+# Сколько дней хранить доставленные сообщения для сверки
+KEEP_DELIVERED_DAYS = 7
+
+
+class ChatOutbox:
+    """Очередь отправки в основной базе приложения.
+
+    Сообщение сначала записывается сюда и только потом уходит на сервер
+    фоновым потоком. У каждого сообщения свой client_key: сервер по нему
+    отбрасывает повторы, поэтому повтор после обрыва связи не создаёт дубль.
+    """
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.purge_delivered()
+
+    @staticmethod
+    def _entries(rows):
+        return [{'client_key': r[0], 'user': r[1], 'message': r[2], 'timestamp': r[3]}
+                for r in rows]
+
+    def enqueue(self, user, message):
+        """Поставить сообщение в очередь; вернуть его для показа как ожидающего"""
+        entry = {'client_key': uuid.uuid4().hex, 'user': user, 'message': message,
+                 'timestamp': datetime.now().isoformat()}
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO chat_outbox (client_key, user, message, created_at)
+                VALUES (?, ?, ?, ?)
+            """, (entry['client_key'], user, message, entry['timestamp']))
+        return entry
+
+    def due(self, limit):
+        """Сообщения, которые пора отправить, в порядке постановки"""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("""
+                SELECT client_key, user, message, created_at FROM chat_outbox
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id LIMIT ?
+            """, (time.time(), limit)).fetchall()
+        return self._entries(rows)
+
+    def pending(self):
+        """Все недоставленные сообщения (для показа после перезапуска)"""
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute("""
+                SELECT client_key, user, message, created_at FROM chat_outbox
+                WHERE status = 'pending' ORDER BY id
+            """).fetchall()
+        return self._entries(rows)
+
+    def next_due_in(self):
+        """Секунд до ближайшего повтора; None, если очередь пуста"""
+        with sqlite3.connect(self.db_path) as conn:
+            next_at = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM chat_outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+        if next_at is None:
+            return None
+        return max(0.0, next_at - time.time())
+
+    def mark_delivered(self, delivered):
+        """Отметить доставку: delivered — пары (client_key, id на сервере)"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                UPDATE chat_outbox SET status = 'delivered', server_id = ?, last_error = NULL
+                WHERE client_key = ?
+            """, [(server_id, key) for key, server_id in delivered])
+
+    def mark_retry(self, keys, error):
+        """Отложить повтор с экспоненциальной паузой и случайным разбросом"""
+        if not keys:
+            return
+        now = time.time()
+        with sqlite3.connect(self.db_path) as conn:
+            placeholders = ",".join("?" * len(keys))
+            rows = conn.execute(
+                f"SELECT client_key, attempts FROM chat_outbox WHERE client_key IN ({placeholders})",
+                keys).fetchall()
+            updates = []
+            for key, attempts in rows:
+                delay = min(2 ** attempts, MAX_RETRY_DELAY)
+                updates.append((now + delay * random.uniform(0.5, 1.0), str(error), key))
+            conn.executemany("""
+                UPDATE chat_outbox
+                SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?
+                WHERE client_key = ?
+            """, updates)
+
+    def mark_rejected(self, keys, error):
+        """Сервер отказался принять сообщения — повторять бесполезно"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.executemany("""
+                UPDATE chat_outbox SET status = 'rejected', last_error = ?
+                WHERE client_key = ?
+            """, [(str(error), key) for key in keys])
+
+    def purge_delivered(self, days=KEEP_DELIVERED_DAYS):
+        """Удалить давно доставленные сообщения"""
+        border = (datetime.now() - timedelta(days=days)).isoformat()
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DELETE FROM chat_outbox WHERE status = 'delivered' AND created_at < ?",
+                         (border,))
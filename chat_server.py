@@ -0,0 +1,499 @@
+# Сервер чата для chat_server_url: asyncio + SQLite, только стандартная библиотека
+import argparse
+import asyncio
+import json
+import sqlite3
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+
+from presence import PresenceTracker
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 500
+# Длинный опрос: сколько максимум держать запрос без новых сообщений
+MAX_WAIT = 60
+MAX_BODY = 64 * 1024
+MAX_HEADERS = 100
+# Сколько сообщений записывать в SQLite одной транзакцией
+WRITE_BATCH = 256
+# Пауза перед записью пакета: под нагрузкой одно пробуждение ожидающих
+# клиентов доставляет сразу несколько сообщений
+WRITE_LINGER = 0.005
+# Очередь записи; при переполнении клиент получает 503 и Retry-After
+MAX_PENDING_WRITES = 5000
+# Сколько сообщений можно прислать одним запросом /send_messages
+MAX_SEND_BATCH = 500
+# Последние сообщения в памяти: ожидающие клиенты читают их без обращения к БД
+CACHE_SIZE = 2000
+# Соединение без запросов дольше этого закрывается
+IDLE_TIMEOUT = 120
+# Клиент, который не забирает ответ дольше этого, отключается
+SEND_TIMEOUT = 30
+WRITE_BUFFER_HIGH = 64 * 1024
+
+STATUS_TEXT = {
+    200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+def encode(payload):
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+EMPTY = encode([])
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ChatStore:
+    """Сообщения в SQLite. Все методы вызываются из одного потока записи"""
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp)")
+        # Ключ, выданный клиентом: повтор отправки после обрыва не создаёт дубль
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(messages)")]
+        if "client_key" not in columns:
+            self.conn.execute("ALTER TABLE messages ADD COLUMN client_key TEXT")
+        self.conn.execute("""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_client_key
+            ON messages(client_key) WHERE client_key IS NOT NULL
+        """)
+        self.conn.commit()
+
+    @staticmethod
+    def _message(row):
+        message = {"id": row[0], "user": row[1], "message": row[2], "timestamp": row[3]}
+        if row[4] is not None:
+            message["client_key"] = row[4]
+        return message
+
+    @classmethod
+    def _rows(cls, rows):
+        return [cls._message(r) for r in rows]
+
+    def insert_batch(self, rows):
+        """Записать пакет (user, message, timestamp, client_key) одной транзакцией.
+
+        Возвращает для каждой строки (сообщение, новое ли оно): сообщение с уже
+        известным client_key не записывается повторно, а возвращается прежнее.
+        """
+        results = []
+        with self.conn:
+            for row in rows:
+                cur = self.conn.execute(
+                    "INSERT OR IGNORE INTO messages (user, message, timestamp, client_key) "
+                    "VALUES (?, ?, ?, ?)", row)
+                if cur.rowcount:
+                    results.append((self._message((cur.lastrowid,) + tuple(row)), True))
+                else:
+                    existing = self.conn.execute(
+                        "SELECT id, user, message, timestamp, client_key FROM messages "
+                        "WHERE client_key = ?", (row[3],)).fetchone()
+                    results.append((self._message(existing), False))
+        return results
+
+    def last_id(self):
+        return self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM messages").fetchone()[0]
+
+    def after(self, after_id, limit):
+        return self._rows(self.conn.execute(
+            "SELECT id, user, message, timestamp, client_key FROM messages WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)).fetchall())
+
+    def before(self, before_id, limit):
+        rows = self.conn.execute(
+            "SELECT id, user, message, timestamp, client_key FROM messages WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before_id, limit)).fetchall()
+        return self._rows(reversed(rows))
+
+    def since(self, timestamp, limit):
+        """Старый протокол: сообщения новее метки времени клиента"""
+        return self._rows(self.conn.execute(
+            "SELECT id, user, message, timestamp, client_key FROM messages WHERE timestamp > ? ORDER BY id LIMIT ?",
+            (timestamp, limit)).fetchall())
+
+    def before_timestamp(self, timestamp, limit):
+        rows = self.conn.execute(
+            "SELECT id, user, message, timestamp, client_key FROM messages WHERE timestamp < ? "
+            "ORDER BY id DESC LIMIT ?", (timestamp, limit)).fetchall()
+        return self._rows(reversed(rows))
+
+
+class ChatServer:
+    """HTTP-сервер чата с курсором по id и длинным опросом.
+
+    Протокол (все ответы — JSON, заголовок X-Last-Id — id последнего сообщения):
+      GET  /get_messages?after_id=N&wait=S&limit=L  новые сообщения после N,
+           при их отсутствии запрос ждёт до S секунд
+      GET  /get_messages?before_id=N&limit=L        страница перед сообщением N
+      GET  /get_messages?limit=L                    последние L сообщений
+      GET  /get_messages?since=ISO | before=ISO     старые клиенты, по времени
+      POST /send_message {"user", "message", "client_key"?}  ответ {"status": "ok", "id": N}
+      POST /send_messages {"messages": [...]}       пакет, ответ {"messages": [...]}
+      POST /presence {"user", "info"?, "status"?}   сигнал присутствия или выход
+           ("status": "offline"), ответ {"version", "ttl", "users"}
+      GET  /presence?version=V&wait=S               список в сети; если версия
+           не менялась, запрос ждёт изменения до S секунд
+    Повтор с тем же client_key возвращает уже записанное сообщение.
+    Присутствие хранится только в памяти и истекает без сигналов.
+    """
+    def __init__(self, db_path, cache_size=CACHE_SIZE):
+        self.store = ChatStore(db_path)
+        # Один поток для SQLite: запросы не блокируют цикл событий и не конкурируют
+        self.db_executor = ThreadPoolExecutor(max_workers=1)
+        self.cache_size = cache_size
+        self.cache_ids = []
+        self.cache_messages = []
+        self.last_id = 0
+        # Готовые тела ответов для ожидающих клиентов: после публикации все они
+        # просят одно и то же, поэтому JSON кодируется один раз
+        self.encoded = {}
+        self.pending = None
+        self.new_message = None
+        self.connections = 0
+        self.server = None
+        self.writer_task = None
+        self.presence = PresenceTracker()
+        self.presence_changed = None
+        self.presence_task = None
+
+    async def db(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.db_executor, func, *args)
+
+    async def start(self, host="0.0.0.0", port=5000):
+        loop = asyncio.get_running_loop()
+        self.pending = asyncio.Queue(maxsize=MAX_PENDING_WRITES)
+        # Одно общее ожидание на всех клиентов длинного опроса; при записи
+        # пакета оно завершается и заменяется новым
+        self.new_message = loop.create_future()
+        self.presence_changed = loop.create_future()
+        self.last_id = await self.db(self.store.last_id)
+        self.remember(await self.db(self.store.before, self.last_id + 1, self.cache_size))
+        self.writer_task = asyncio.create_task(self.write_loop())
+        self.presence_task = asyncio.create_task(self.presence_loop())
+        self.server = await asyncio.start_server(self.handle_connection, host, port,
+                                                 backlog=4096)
+        return self.server
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in (self.writer_task, self.presence_task):
+            if task:
+                task.cancel()
+        self.db_executor.shutdown(wait=True)
+
+    def remember(self, messages):
+        """Добавить сообщения в кэш последних, держа его в пределах cache_size"""
+        for msg in messages:
+            self.cache_ids.append(msg["id"])
+            self.cache_messages.append(msg)
+        if len(self.cache_ids) > 2 * self.cache_size:
+            del self.cache_ids[:-self.cache_size]
+            del self.cache_messages[:-self.cache_size]
+
+    def publish(self):
+        """Разбудить всех клиентов, ожидающих новых сообщений"""
+        self.encoded.clear()
+        waiting, self.new_message = self.new_message, asyncio.get_running_loop().create_future()
+        waiting.set_result(None)
+
+    async def write_loop(self):
+        """Пакетная запись: всё, что накопилось в очереди, — одной транзакцией"""
+        while True:
+            batch = [await self.pending.get()]
+            await asyncio.sleep(WRITE_LINGER)
+            while len(batch) < WRITE_BATCH and not self.pending.empty():
+                batch.append(self.pending.get_nowait())
+            try:
+                results = await self.db(self.store.insert_batch, [row for row, _ in batch])
+            except Exception as e:
+                print(f"❌ Ошибка записи сообщений: {e}")
+                if isinstance(e, sqlite3.OperationalError) and "locked" in str(e):
+                    # База занята другим процессом — временно, повтор поможет
+                    e = HttpError(503, "База данных занята, повторите позже")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            messages = []
+            for (_, future), (message, is_new) in zip(batch, results):
+                if is_new:
+                    messages.append(message)
+                if not future.done():
+                    future.set_result(message)
+            if messages:
+                self.remember(messages)
+                self.last_id = messages[-1]["id"]
+                self.publish()
+
+    def publish_presence(self):
+        """Разбудить клиентов, ожидающих изменения списка в сети"""
+        waiting, self.presence_changed = (self.presence_changed,
+                                          asyncio.get_running_loop().create_future())
+        waiting.set_result(None)
+
+    async def presence_loop(self):
+        """Снимать пользователей без сигнала точно к сроку истечения"""
+        while True:
+            delay = self.presence.next_expiry()
+            # Новый сигнал истекает не раньше ttl, поэтому спать до ближайшего срока безопасно
+            await asyncio.sleep((self.presence.ttl if delay is None else delay) + 0.05)
+            if self.presence.expire():
+                self.publish_presence()
+
+    async def post_presence(self, body):
+        data = self.parse_json(body)
+        user, info = data.get("user"), data.get("info") or {}
+        if not isinstance(user, str) or not user or not isinstance(info, dict):
+            raise HttpError(400, "Нужно поле user")
+        if data.get("status") == "offline":
+            changed = self.presence.leave(user)
+        else:
+            changed = self.presence.heartbeat(user, info)
+        if changed:
+            self.publish_presence()
+        return self.presence.snapshot()
+
+    async def get_presence(self, params):
+        try:
+            version = int(params["version"]) if "version" in params else None
+            wait = max(0.0, min(float(params.get("wait", 0)), MAX_WAIT))
+        except ValueError:
+            raise HttpError(400, "Некорректные параметры запроса")
+        if version == self.presence.version and wait:
+            try:
+                await asyncio.wait_for(asyncio.shield(self.presence_changed), wait)
+            except asyncio.TimeoutError:
+                pass
+        return self.presence.snapshot()
+
+    async def messages_after(self, after_id, limit):
+        if self.cache_ids and after_id >= self.cache_ids[0] - 1:
+            key = (after_id, limit)
+            if key not in self.encoded:
+                start = bisect_right(self.cache_ids, after_id)
+                self.encoded[key] = encode(self.cache_messages[start:start + limit])
+            return self.encoded[key]
+        return encode(await self.db(self.store.after, after_id, limit))
+
+    async def get_messages(self, params):
+        try:
+            limit = max(1, min(int(params.get("limit", DEFAULT_LIMIT)), MAX_LIMIT))
+            if "before_id" in params:
+                return await self.db(self.store.before, int(params["before_id"]), limit)
+            if "after_id" in params:
+                after_id = int(params["after_id"])
+                wait = max(0.0, min(float(params.get("wait", 0)), MAX_WAIT))
+            else:
+                after_id = wait = None
+        except ValueError:
+            raise HttpError(400, "Некорректные параметры запроса")
+
+        if after_id is not None:
+            waiting = self.new_message
+            messages = await self.messages_after(after_id, limit)
+            if messages == EMPTY and wait:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiting), wait)
+                except asyncio.TimeoutError:
+                    return EMPTY
+                messages = await self.messages_after(after_id, limit)
+            return messages
+        if "before" in params:
+            return await self.db(self.store.before_timestamp, params["before"], limit)
+        if "since" in params:
+            return await self.db(self.store.since, params["since"], limit)
+        return self.cache_messages[-limit:]
+
+    @staticmethod
+    def parse_json(body):
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            raise HttpError(400, "Тело запроса должно быть JSON")
+
+    @staticmethod
+    def message_row(data):
+        """Проверить сообщение клиента и собрать строку для записи"""
+        if not isinstance(data, dict):
+            raise HttpError(400, "Сообщение должно быть объектом")
+        user, message, client_key = data.get("user"), data.get("message"), data.get("client_key")
+        if not isinstance(user, str) or not isinstance(message, str) or not message.strip():
+            raise HttpError(400, "Нужны поля user и message")
+        if client_key is not None and not isinstance(client_key, str):
+            raise HttpError(400, "client_key должен быть строкой")
+        # Время ставит сервер: часы рабочих мест могут расходиться
+        return (user, message, datetime.now().isoformat(), client_key)
+
+    def enqueue(self, rows):
+        """Поставить строки в очередь записи целиком или не ставить вовсе"""
+        if self.pending.qsize() + len(rows) > MAX_PENDING_WRITES:
+            raise HttpError(503, "Сервер перегружен, повторите позже")
+        loop = asyncio.get_running_loop()
+        futures = []
+        for row in rows:
+            future = loop.create_future()
+            self.pending.put_nowait((row, future))
+            futures.append(future)
+        return futures
+
+    async def send_message(self, body):
+        [future] = self.enqueue([self.message_row(self.parse_json(body))])
+        message = await future
+        return {"status": "ok", "id": message["id"]}
+
+    async def send_messages(self, body):
+        """Пакет сообщений одним запросом (очередь отправки клиента)"""
+        items = self.parse_json(body).get("messages")
+        if not isinstance(items, list) or not items or len(items) > MAX_SEND_BATCH:
+            raise HttpError(400, f"Нужен список messages из 1..{MAX_SEND_BATCH} сообщений")
+        futures = self.enqueue([self.message_row(item) for item in items])
+        return {"status": "ok", "messages": list(await asyncio.gather(*futures))}
+
+    async def dispatch(self, method, target, body):
+        parts = urlsplit(target)
+        params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+        if parts.path == "/get_messages":
+            if method != "GET":
+                raise HttpError(405, "Ожидается GET")
+            return await self.get_messages(params)
+        if parts.path == "/send_message":
+            if method != "POST":
+                raise HttpError(405, "Ожидается POST")
+            return await self.send_message(body)
+        if parts.path == "/send_messages":
+            if method != "POST":
+                raise HttpError(405, "Ожидается POST")
+            return await self.send_messages(body)
+        if parts.path == "/presence":
+            if method == "POST":
+                return await self.post_presence(body)
+            if method == "GET":
+                return await self.get_presence(params)
+            raise HttpError(405, "Ожидается GET или POST")
+        raise HttpError(404, "Неизвестный адрес")
+
+    async def handle_connection(self, reader, writer):
+        self.connections += 1
+        # Ограничиваем буфер отправки: медленный клиент тормозит только себя
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_HIGH)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(read_request(reader), IDLE_TIMEOUT)
+                except HttpError as e:
+                    await self.respond(writer, e.status, {"error": str(e)}, keep_alive=False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    status, payload = 200, await self.dispatch(method, target, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": str(e)}
+                except Exception as e:
+                    # 500 без Retry-After: повтор того же запроса не поможет,
+                    # 503 остаётся только для перегрузки
+                    print(f"❌ Ошибка обработки запроса {target}: {e}")
+                    status, payload = 500, {"error": "Внутренняя ошибка сервера"}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+
+    async def respond(self, writer, status, payload, keep_alive=True):
+        body = payload if isinstance(payload, bytes) else encode(payload)
+        head = [
+            f"HTTP/1.1 {status} {STATUS_TEXT.get(status, 'Error')}",
+            "Content-Type: application/json; charset=utf-8",
+            f"Content-Length: {len(body)}",
+            f"X-Last-Id: {self.last_id}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+
+
+async def read_request(reader):
+    """Прочитать один HTTP/1.1-запрос; None — клиент закрыл соединение"""
+    line = await reader.readline()
+    if not line:
+        return None
+    method, target, _ = line.decode("latin-1").split(" ", 2)
+
+    headers = {}
+    for _ in range(MAX_HEADERS):
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    else:
+        raise HttpError(400, "Слишком много заголовков")
+
+    length = int(headers.get("content-length", 0) or 0)
+    if length > MAX_BODY:
+        raise HttpError(413, "Слишком большой запрос")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+async def serve(host, port, db_path):
+    server = ChatServer(db_path)
+    await server.start(host, port)
+    print(f"💬 Сервер чата запущен на http://{host}:{port} (база {db_path})")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сервер чата сотрудников")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--db", default="chat_server.db", help="файл базы сообщений")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.db))
+    except KeyboardInterrupt:
+        print("👋 Сервер чата остановлен")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, messagebox
 from datetime import datetime
-from chat_manager import ChatManager
+from chat_manager import ChatManager, DB_NAME
+from change_watcher import ChangeWatcher
 
 class ChatUI:
     def __init__(self, parent, chat_manager, style_colors, style_fonts):
@@ -9,8 +10,27 @@ class ChatUI:
         self.chat_manager = chat_manager
         self.colors = style_colors
         self.fonts = style_fonts
+        # id последнего показанного сообщения: новые дочитываются после него
+        self.last_id = 0
+        # id самого раннего показанного сообщения: от него листается история
+        self.first_id = None
+        # False, пока показан фрагмент истории вокруг найденного сообщения
+        self.live = True
         self.setup_ui()
         
+        # Сообщения перечитываются, только когда в таблице появился новый id
+        self.watcher = ChangeWatcher(DB_NAME)
+        self.watcher.watch("chat_messages", "SELECT MAX(id) FROM chat_messages",
+                           lambda conn, old, new: self.load_new_messages())
+        self.watcher.start(self.parent)
+        self.chat_frame.bind('<Destroy>', self.on_destroy)
+        self.refresh_chat()
+    
+    def on_destroy(self, event):
+        if event.widget is self.chat_frame:
+            self.watcher.stop(self.parent)
+            self.watcher.close()
+        
     def setup_ui(self):
         """Создание интерфейса чата"""
         self.chat_frame = tk.Frame(self.parent, bg=self.colors['background'])
@@ -51,12 +71,29 @@ class ChatUI:
                                 command=self.refresh_chat,
                                 width=3)
         refresh_btn.pack(side='right', padx=5)
+        
+        # Поиск по истории чата
+        search_btn = ttk.Button(chat_header, text="🔍",
+                               style='Secondary.TButton',
+                               command=self.search_messages,
+                               width=3)
+        search_btn.pack(side='right', padx=5)
+        
+        self.search_entry = tk.Entry(chat_header, font=self.fonts['small'], width=20)
+        self.search_entry.pack(side='right', padx=5)
+        self.search_entry.bind('<Return>', lambda e: self.search_messages())
     
     def create_chat_main_area(self):
         """Создание основной области сообщений"""
         chat_main = tk.Frame(self.chat_frame, bg=self.colors['background'])
         chat_main.pack(fill='both', expand=True, padx=5, pady=5)
         
+        # Подгрузка более ранних сообщений, в том числе из архива
+        self.older_btn = ttk.Button(chat_main, text="⬆ Ранние сообщения",
+                                    style='Secondary.TButton',
+                                    command=self.load_older_messages)
+        self.older_btn.pack(fill='x', pady=(0, 5))
+        
         # Список сообщений с прокруткой
         message_frame = tk.Frame(chat_main, bg=self.colors['surface'])
         message_frame.pack(fill='both', expand=True, pady=(0, 5))
@@ -102,6 +139,9 @@ class ChatUI:
                                        font=(self.fonts['body'][0], self.fonts['body'][1], 'bold'))
         self.messages_text.tag_configure("message_alert", 
                                        foreground=self.colors['error'])
+        
+        # Найденное сообщение
+        self.messages_text.tag_configure("search_hit", background='#FFF3CD')
     
     def create_input_panel(self):
         """Создание панели ввода сообщения"""
@@ -141,56 +181,167 @@ class ChatUI:
         message = self.input_entry.get().strip()
         if message and self.chat_manager.send_message(message):
             self.input_entry.delete(0, tk.END)
-            self.refresh_chat()
-            self.update_unread_count()
+            self.load_new_messages()
     
     def refresh_chat(self):
-        """Обновление отображения сообщений"""
+        """Полная перерисовка: последние сообщения с нуля"""
+        self.clear_messages()
+        self.last_id = 0
+        self.first_id = None
+        self.live = True
+        self.chat_title.config(text="💬 Чат сотрудников")
+        self.older_btn.config(state='normal')
+        self.load_new_messages()
+    
+    def load_new_messages(self):
+        """Дописать сообщения после последнего показанного"""
+        if not self.live:
+            # Открыт фрагмент истории: новые сообщения только считаем
+            self.update_unread_count()
+            return
+        messages, unread_count = self.chat_manager.fetch_updates(self.last_id)
+        if messages:
+            at_bottom = self.messages_text.yview()[1] >= 0.999
+            self.messages_text.config(state='normal')
+            for msg in messages:
+                self.insert_message(*msg)
+            self.messages_text.config(state='disabled')
+            self.last_id = messages[-1][0]
+            if self.first_id is None:
+                self.first_id = messages[0][0]
+            if at_bottom:
+                self.messages_text.see(tk.END)  # Прокрутка к последнему сообщению
+        self.show_unread_count(unread_count)
+    
+    def load_older_messages(self):
+        """Дописать сверху страницу более ранних сообщений, не сдвигая вид"""
+        if self.first_id is None:
+            return
+        older = self.chat_manager.get_messages(limit=50, before_id=self.first_id)
+        if not older:
+            self.older_btn.config(state='disabled')
+            return
+        
+        top_line = int(self.messages_text.index("@0,0").split('.')[0])
+        lines_before = int(self.messages_text.index("end").split('.')[0])
         self.messages_text.config(state='normal')
-        self.messages_text.delete(1.0, tk.END)
+        for msg in older:  # новые первыми: каждое следующее встаёт выше
+            self.insert_message(*msg, index="1.0")
+        self.messages_text.config(state='disabled')
+        added = int(self.messages_text.index("end").split('.')[0]) - lines_before
+        self.messages_text.yview(f"{top_line + added}.0")
+        self.first_id = older[-1][0]
+    
+    def search_messages(self):
+        """Поиск по чату и архивам, результаты — в отдельном окне"""
+        text = self.search_entry.get().strip()
+        if not text:
+            return
+        results = self.chat_manager.search_messages(text)
+        if not results:
+            messagebox.showinfo("Поиск", "Ничего не найдено")
+            return
         
-        messages = self.chat_manager.get_messages(limit=50)
-        messages.reverse()  # Показываем старые сверху, новые снизу
-        
-        for msg_id, username, fullname, message, timestamp, msg_type in messages:
-            # Форматируем время
-            try:
-                msg_time = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%H:%M")
-            except:
-                msg_time = timestamp
-            
-            # Определяем префикс в зависимости от типа сообщения
-            if msg_type == "system":
-                prefix = f"⚡ {msg_time} "
-                header_tag = "header_system"
-                message_tag = "message_system"
-            elif msg_type == "alert":
-                prefix = f"🚨 {msg_time} "
-                header_tag = "header_alert"
-                message_tag = "message_alert"
-            else:
-                # Определяем текущий пользователь или другой
-                if username == self.chat_manager.current_user:
-                    prefix = f"👤 Вы ({msg_time}): "
-                else:
-                    prefix = f"👤 {fullname or username} ({msg_time}): "
-                header_tag = "header_text"
-                message_tag = "message_text"
-            
-            self.messages_text.insert(tk.END, prefix, header_tag)
-            self.messages_text.insert(tk.END, f"{message}\n\n", message_tag)
+        win = tk.Toplevel(self.parent)
+        win.title(f"Поиск: {text}")
+        win.geometry("700x350")
+        listbox = tk.Listbox(win, font=self.fonts['small'], activestyle='none')
+        scroll = ttk.Scrollbar(win, command=listbox.yview)
+        listbox.config(yscrollcommand=scroll.set)
+        scroll.pack(side='right', fill='y')
+        listbox.pack(fill='both', expand=True)
+        
+        for msg_id, username, fullname, timestamp, snippet in results:
+            listbox.insert(tk.END, f"{(timestamp or '')[:16]}  {fullname or username}: {snippet}")
         
+        def open_selected(event=None):
+            selection = listbox.curselection()
+            if selection:
+                self.jump_to(results[selection[0]][0])
+        
+        listbox.bind('<Double-Button-1>', open_selected)
+        listbox.bind('<Return>', open_selected)
+    
+    def jump_to(self, msg_id):
+        """Прокрутить чат к сообщению msg_id и подсветить его"""
+        mark = f"msg{msg_id}"
+        if mark not in self.messages_text.mark_names():
+            self.show_history_around(msg_id)
+        if mark not in self.messages_text.mark_names():
+            # История очищена или файл архива удалён после поиска
+            messagebox.showinfo("Поиск", "Сообщение больше недоступно")
+            return
+        self.messages_text.tag_remove("search_hit", "1.0", tk.END)
+        self.messages_text.tag_add("search_hit", mark, f"{mark} lineend")
+        self.messages_text.see(mark)
+    
+    def show_history_around(self, msg_id, context=25):
+        """Показать фрагмент истории вокруг сообщения (в том числе из архива)"""
+        before = self.chat_manager.get_messages(limit=context + 1, before_id=msg_id + 1)
+        after = self.chat_manager.get_messages_after(msg_id, context)
+        messages = before[::-1] + after
+        if not messages:
+            return
+        
+        self.clear_messages()
+        self.messages_text.config(state='normal')
+        for msg in messages:
+            self.insert_message(*msg)
+        self.messages_text.config(state='disabled')
+        
+        self.first_id = messages[0][0]
+        self.last_id = messages[-1][0]
+        self.older_btn.config(state='normal')
+        # Если после фрагмента сообщений нет, он уже доходит до конца ленты
+        self.live = len(after) < context
+        if not self.live:
+            self.chat_title.config(text="💬 Чат сотрудников — история (🔄 к последним)")
+    
+    def clear_messages(self):
+        """Очистить окно сообщений вместе с метками сообщений"""
+        self.messages_text.config(state='normal')
+        self.messages_text.delete(1.0, tk.END)
         self.messages_text.config(state='disabled')
-        self.messages_text.see(tk.END)  # Прокрутка к последнему сообщению
+        marks = [m for m in self.messages_text.mark_names() if m.startswith("msg")]
+        if marks:
+            self.messages_text.mark_unset(*marks)
+    
+    def insert_message(self, msg_id, username, fullname, message, timestamp, msg_type, index=tk.END):
+        """Вставить одно сообщение в окно (по умолчанию в конец)"""
+        # Форматируем время
+        try:
+            msg_time = datetime.strptime(timestamp, "%Y-%m-%d %H:%M:%S").strftime("%H:%M")
+        except:
+            msg_time = timestamp
+        
+        # Определяем префикс в зависимости от типа сообщения
+        if msg_type == "system":
+            prefix = f"⚡ {msg_time} "
+            header_tag = "header_system"
+            message_tag = "message_system"
+        elif msg_type == "alert":
+            prefix = f"🚨 {msg_time} "
+            header_tag = "header_alert"
+            message_tag = "message_alert"
+        else:
+            # Определяем текущий пользователь или другой
+            if username == self.chat_manager.current_user:
+                prefix = f"👤 Вы ({msg_time}): "
+            else:
+                prefix = f"👤 {fullname or username} ({msg_time}): "
+            header_tag = "header_text"
+            message_tag = "message_text"
         
-        # Помечаем сообщения как прочитанные
-        self.chat_manager.mark_as_read()
-        self.update_unread_count()
+        start = self.messages_text.index("end-1c" if index == tk.END else index)
+        self.messages_text.insert(index, prefix, header_tag, f"{message}\n\n", message_tag)
+        # Метка начала сообщения для перехода из поиска
+        self.messages_text.mark_set(f"msg{msg_id}", start)
     
     def update_unread_count(self):
         """Обновление счетчика непрочитанных"""
-        unread_count = self.chat_manager.get_unread_count()
-        
+        self.show_unread_count(self.chat_manager.get_unread_count())
+    
+    def show_unread_count(self, unread_count):
         if unread_count > 0:
             self.unread_label.config(text=f"Непрочитанных: {unread_count}")
         else:
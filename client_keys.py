@@ -0,0 +1,71 @@
+# Нормализованные ключи клиентов для поиска дублей и сортировки
+from datetime import datetime
+
+# Форматы даты рождения, которые встречаются в базе и при импорте
+DOB_FORMATS = ("%Y-%m-%d", "%d.%m.%Y", "%d/%m/%Y")
+
+
+def normalize_name(value):
+    """Приведение части ФИО к сравнимому виду.
+
+    В отличие от lower() в SQLite, str.casefold() учитывает кириллицу;
+    «ё» приравнивается к «е», лишние пробелы убираются.
+    """
+    return " ".join((value or "").split()).casefold().replace("ё", "е")
+
+
+def normalize_dob(value):
+    """Дата рождения в ISO (ГГГГ-ММ-ДД); нераспознанная строка — как есть"""
+    text = (value or "").strip()
+    for fmt in DOB_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return text
+
+
+def identity_key(last_name, first_name, middle_name, dob):
+    """Ключ идентичности клиента: нормализованные ФИО + дата рождения"""
+    return "|".join((
+        normalize_name(last_name),
+        normalize_name(first_name),
+        normalize_name(middle_name),
+        normalize_dob(dob),
+    ))
+
+
+def sort_key(last_name, first_name, middle_name):
+    """Ключ сортировки по ФИО.
+
+    После нормализации кириллица а..я идёт в алфавитном порядке кодов
+    («ё» уже заменена на «е»), поэтому ключ сравнивается побайтно и может
+    храниться в обычном индексе. Разделитель меньше любой буквы, так что
+    «Иванов» идёт раньше «Иванова».
+    """
+    return "\x1f".join((
+        normalize_name(last_name),
+        normalize_name(first_name),
+        normalize_name(middle_name),
+    ))
+
+
+def russian_collation(a, b):
+    """Правило сравнения строк для SQLite (COLLATE RU) без учёта регистра и «ё»"""
+    a, b = normalize_name(a), normalize_name(b)
+    return (a > b) - (a < b)
+
+
+def split_fio(fio: str):
+    """Разбор строки ФИО на фамилию, имя и отчество"""
+    if not fio:
+        return "", "", ""
+    parts = fio.strip().split()
+    if len(parts) == 1:
+        return parts[0], "", ""
+    if len(parts) == 2:
+        return parts[0], parts[1], ""
+    last = parts[0]
+    first = parts[1]
+    middle = " ".join(parts[2:])
+    return last, first, middle
@@ -0,0 +1,322 @@
+import os
+import sqlite3
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+from client_keys import normalize_name, identity_key, sort_key
+
+# Порог похожести, начиная с которого пара считается кандидатом на объединение
+MATCH_THRESHOLD = 0.8
+# Группы с одной датой рождения больше этого размера сравниваются
+# «скользящим окном» по отсортированным ФИО
+MAX_BLOCK_SIZE = 400
+SORTED_WINDOW = 40
+# Меньше этого числа записей пул процессов не окупает запуск
+POOL_MIN_RECORDS = 5000
+
+# Упрощённая фонетика для русских фамилий: звонкие -> глухие, близкие гласные
+# объединяются, мягкий и твёрдый знаки отбрасываются
+_PHONETIC_TABLE = str.maketrans({
+    'б': 'п', 'в': 'ф', 'г': 'к', 'д': 'т', 'ж': 'ш', 'з': 'с',
+    'щ': 'ш', 'ц': 'с', 'о': 'а', 'я': 'а', 'ы': 'и', 'э': 'и',
+    'е': 'и', 'й': 'и', 'ю': 'у', 'ь': None, 'ъ': None, '-': None, ' ': None
+})
+
+
+def phonetic_key(name):
+    """Фонетический ключ фамилии (устойчив к типичным опечаткам)"""
+    value = normalize_name(name).translate(_PHONETIC_TABLE)
+    result = []
+    for ch in value:
+        if not result or result[-1] != ch:
+            result.append(ch)
+    return "".join(result)
+
+
+@lru_cache(maxsize=200000)
+def trigrams(value):
+    """Множество триграмм строки с обрамляющими пробелами"""
+    value = f"  {value} "
+    return {value[i:i + 3] for i in range(len(value) - 2)}
+
+
+def trigram_similarity(a, b):
+    """Коэффициент Жаккара по триграммам (0..1)"""
+    if not a and not b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    ta, tb = trigrams(a), trigrams(b)
+    return len(ta & tb) / len(ta | tb)
+
+
+def edit_similarity(a, b, minimum=0.0):
+    """Похожесть по расстоянию Дамерау–Левенштейна (перестановка соседних букв = 1 правка).
+
+    Если похожесть заведомо ниже minimum, расчёт прерывается и возвращается 0.
+    """
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    longest = max(len(a), len(b))
+    max_edits = int((1.0 - minimum) * longest + 1e-9)
+    if abs(len(a) - len(b)) > max_edits:
+        return 0.0
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            best = prev[j - 1] + cost
+            if prev[j] + 1 < best:
+                best = prev[j] + 1
+            if cur[j - 1] + 1 < best:
+                best = cur[j - 1] + 1
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1] and prev2[j - 2] + 1 < best:
+                best = prev2[j - 2] + 1
+            cur[j] = best
+        if min(cur) > max_edits:
+            return 0.0
+        prev2, prev = prev, cur
+    return 1.0 - prev[len(b)] / longest
+
+
+def _parse_date(value):
+    for fmt in ("%Y-%m-%d", "%d.%m.%Y"):
+        try:
+            return datetime.strptime((value or "").strip(), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def dob_similarity(a, b, da=None, db=None):
+    """Похожесть дат рождения: совпадение, соседний день, переставленные день и месяц"""
+    if (a or "").strip() == (b or "").strip():
+        return 1.0
+    da = da or _parse_date(a)
+    db = db or _parse_date(b)
+    if not da or not db:
+        return 0.0
+    if abs(da.toordinal() - db.toordinal()) == 1:
+        return 0.9
+    if da.year == db.year and da.day == db.month and da.month == db.day:
+        return 0.8
+    return 0.0
+
+
+def given_names_similarity(first_a, middle_a, first_b, middle_b):
+    """Похожесть имени и отчества с учётом перестановки и пропущенного отчества"""
+    if not middle_a or not middle_b:
+        # Отчество не указано у одного из клиентов: сравниваем только имя
+        # (или имя с отчеством другого, если их перепутали местами)
+        best = max(trigram_similarity(first_a, first_b),
+                   trigram_similarity(first_a, middle_b) if middle_b else 0.0,
+                   trigram_similarity(middle_a, first_b) if middle_a else 0.0)
+        return best * 0.95
+    direct = (trigram_similarity(first_a, first_b) + trigram_similarity(middle_a, middle_b)) / 2
+    swapped = (trigram_similarity(first_a, middle_b) + trigram_similarity(middle_a, first_b)) / 2
+    return max(direct, swapped * 0.95)
+
+
+def score_pair(a, b):
+    """Оценка похожести двух записей (id, фамилия, имя, отчество, дата рождения, дата).
+
+    Возвращает (оценка, причины) или None, если записи не похожи.
+    """
+    dob_sim = dob_similarity(a[4], b[4], a[5], b[5])
+    if dob_sim == 0.0:
+        return None
+    given_sim = given_names_similarity(a[2], a[3], b[2], b[3])
+    if 0.45 + 0.35 * given_sim + 0.2 * dob_sim < MATCH_THRESHOLD:
+        return None
+    # Триграммы слишком строги к перестановке букв в коротких фамилиях
+    last_sim = trigram_similarity(a[1], b[1])
+    required = (MATCH_THRESHOLD - 0.35 * given_sim - 0.2 * dob_sim) / 0.45
+    if last_sim < required:
+        last_sim = max(last_sim, edit_similarity(a[1], b[1], required))
+    score = 0.45 * last_sim + 0.35 * given_sim + 0.2 * dob_sim
+    if score < MATCH_THRESHOLD:
+        return None
+
+    reasons = []
+    if last_sim < 1.0:
+        reasons.append("фамилия отличается")
+    if given_sim < 1.0:
+        reasons.append("имя/отчество отличаются")
+    if dob_sim < 1.0:
+        reasons.append("дата рождения отличается")
+    return round(score, 3), ", ".join(reasons) or "полное совпадение"
+
+
+def _normalized_record(row):
+    cid, last, first, middle, dob = row
+    dob = (dob or "").strip()
+    return (cid, normalize_name(last), normalize_name(first), normalize_name(middle), dob, _parse_date(dob))
+
+
+def blocking_keys(record):
+    """Ключи блоков, в которых запись сравнивается с соседями"""
+    cid, last, first, middle, dob, parsed = record
+    keys = []
+    year = parsed.year if parsed else dob[:4]
+    # Опечатки в фамилии и сдвиг даты на день: фонетика фамилии + год рождения
+    keys.append(("s", phonetic_key(last), year))
+    # Сильная опечатка в фамилии: точная дата рождения + имя (или отчество)
+    for given in (first, middle):
+        if given:
+            keys.append(("d", dob, phonetic_key(given)[:3]))
+    # Опечатка в фамилии вместе со сдвигом даты: имя и отчество (в любом порядке) + год
+    if first and middle:
+        keys.append(("g", tuple(sorted((phonetic_key(first), phonetic_key(middle)))), year))
+    return keys
+
+
+def build_blocks(records):
+    """Группировка записей по ключам блоков"""
+    blocks = {}
+    for record in records:
+        for key in set(blocking_keys(record)):
+            blocks.setdefault(key, []).append(record)
+    return [block for block in blocks.values() if len(block) > 1]
+
+
+def _related_dates(day):
+    """Даты, которые считаются опечаткой данной: следующий день и перестановка дня и месяца"""
+    related = [day + timedelta(days=1)]
+    if day.day <= 12 and day.day != day.month:
+        related.append(date(day.year, day.day, day.month))
+    return related
+
+
+def _block_pairs(block):
+    """Пары записей блока с совместимыми датами рождения"""
+    by_dob = {}
+    for record in block:
+        by_dob.setdefault(record[5] or record[4], []).append(record)
+
+    for key, group in by_dob.items():
+        if len(group) <= MAX_BLOCK_SIZE:
+            for i in range(len(group)):
+                for j in range(i + 1, len(group)):
+                    yield group[i], group[j]
+        else:
+            group = sorted(group, key=lambda r: (r[1], r[2], r[3]))
+            for i in range(len(group)):
+                for j in range(i + 1, min(i + 1 + SORTED_WINDOW, len(group))):
+                    yield group[i], group[j]
+
+        if isinstance(key, date):
+            for other in _related_dates(key):
+                if other > key and other in by_dob:
+                    for a in group:
+                        for b in by_dob[other]:
+                            yield a, b
+
+
+def score_blocks(blocks):
+    """Сравнение записей внутри блоков (выполняется в процессе пула)"""
+    results = {}
+    for block in blocks:
+        for a, b in _block_pairs(block):
+            if a[0] == b[0]:
+                continue
+            pair = (a[0], b[0]) if a[0] < b[0] else (b[0], a[0])
+            if pair in results:
+                continue
+            scored = score_pair(a, b)
+            if scored:
+                results[pair] = scored
+    return results
+
+
+def _chunk_blocks(blocks, chunks):
+    """Раскладка блоков по частям примерно равной трудоёмкости"""
+    parts = [[] for _ in range(chunks)]
+    loads = [0] * chunks
+    for block in sorted(blocks, key=len, reverse=True):
+        i = loads.index(min(loads))
+        parts[i].append(block)
+        loads[i] += len(block)
+    return [part for part in parts if part]
+
+
+def find_duplicate_candidates(db_path, workers=None, progress=None):
+    """Поиск похожих клиентов по всей базе.
+
+    Возвращает список (оценка, id1, id2, причины), отсортированный по
+    убыванию оценки.
+    """
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute(
+            "SELECT id, last_name, first_name, middle_name, dob FROM clients"
+        ).fetchall()
+
+    records = [_normalized_record(row) for row in rows]
+    blocks = build_blocks(records)
+    if progress:
+        progress(f"Записей: {len(records)}, блоков для сравнения: {len(blocks)}")
+
+    results = {}
+    if len(records) < POOL_MIN_RECORDS or workers == 1:
+        results = score_blocks(blocks)
+    else:
+        workers = workers or max(1, (os.cpu_count() or 2) - 1)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for part in pool.map(score_blocks, _chunk_blocks(blocks, workers * 4)):
+                for pair, scored in part.items():
+                    results.setdefault(pair, scored)
+
+    candidates = [(score, a, b, reasons) for (a, b), (score, reasons) in results.items()]
+    candidates.sort(key=lambda c: (-c[0], c[1], c[2]))
+    return candidates
+
+
+def merge_clients(db_path, keep_id, drop_id):
+    """Объединение двух карточек клиента.
+
+    Пустые поля оставляемой карточки заполняются из удаляемой, все таблицы
+    со ссылкой client_id переводятся на оставляемую карточку, а факт
+    объединения записывается в client_merges.
+    """
+    fields = ["last_name", "first_name", "middle_name", "dob", "phone",
+              "contract_number", "ippcu_start", "ippcu_end", "group_name"]
+
+    with sqlite3.connect(db_path) as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT {', '.join(fields)} FROM clients WHERE id = ?", (keep_id,))
+        keep = cur.fetchone()
+        cur.execute(f"SELECT {', '.join(fields)} FROM clients WHERE id = ?", (drop_id,))
+        drop = cur.fetchone()
+        if not keep or not drop:
+            raise ValueError("Одна из карточек уже удалена")
+
+        merged = [k if (k or "").strip() else d for k, d in zip(keep, drop)]
+
+        cur.execute(
+            "INSERT INTO client_merges (kept_id, dropped_id, dropped_data) VALUES (?, ?, ?)",
+            (keep_id, drop_id, " | ".join(str(v or "") for v in drop))
+        )
+
+        # Переносим ссылки из всех таблиц, где есть колонка client_id
+        cur.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        for (table,) in cur.fetchall():
+            columns = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+            if "client_id" in columns:
+                cur.execute(f'UPDATE "{table}" SET client_id = ? WHERE client_id = ?',
+                            (keep_id, drop_id))
+
+        cur.execute("DELETE FROM clients WHERE id = ?", (drop_id,))
+        try:
+            cur.execute(
+                f"UPDATE clients SET {', '.join(f'{f} = ?' for f in fields)}, "
+                f"updated_at = ?, identity_key = ?, sort_key = ? WHERE id = ?",
+                (*merged, datetime.now().isoformat(timespec="microseconds"),
+                 identity_key(merged[0], merged[1], merged[2], merged[3]),
+                 sort_key(merged[0], merged[1], merged[2]), keep_id)
+            )
+        except sqlite3.IntegrityError:
+            conn.rollback()
+            raise ValueError("После объединения карточка совпадёт с другим клиентом в базе")
+        conn.commit()
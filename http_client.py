@@ -0,0 +1,249 @@
+# Общий HTTP-клиент: пул соединений, таймауты, повторы, размыкатель и метрики
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+RequestException = requests.exceptions.RequestException
+# Обрыв при чтении тела ответа напрямую из response.raw (ошибки urllib3)
+StreamError = urllib3.exceptions.HTTPError
+
+# Ответы, после которых запрос имеет смысл повторить
+RETRY_STATUSES = {502, 503, 504}
+# Пауза перед повтором: случайная в пределах base * 2**попытка, но не больше cap
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8
+# Сколько ошибок подряд размыкают цепь и сколько секунд сервер не беспокоим
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30
+# Сколько последних замеров хранить на каждый тип запросов
+METRICS_WINDOW = 500
+
+
+class Endpoint:
+    """Правила для одного вида запросов"""
+    def __init__(self, timeout, retries=0, retry_post=False, breaker=False):
+        self.timeout = timeout
+        self.retries = retries
+        # POST повторяется, только если сервер отсекает дубли
+        self.retry_post = retry_post
+        self.breaker = breaker
+
+
+ENDPOINTS = {
+    # Обычные запросы к серверу чата
+    'chat': Endpoint(timeout=(3, 10), retries=2, breaker=True),
+    # Длинный опрос: время чтения задаётся на запрос, повторяет цикл доставки
+    'chat_poll': Endpoint(timeout=(3, 35), breaker=True),
+    # Отправка из очереди: повтор по расписанию очереди, дубли отсекает client_key
+    'chat_send': Endpoint(timeout=(3, 15), breaker=True),
+    'update_check': Endpoint(timeout=(5, 10), retries=2),
+    'update_download': Endpoint(timeout=(10, 60), retries=3),
+}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Сервер недавно не отвечал, запрос не отправлялся"""
+
+
+class CircuitBreaker:
+    """Размыкатель цепи для одного сервера.
+
+    После BREAKER_THRESHOLD сетевых ошибок или ответов 5xx подряд запросы
+    отклоняются сразу, без обращения к сети. Через BREAKER_RESET секунд
+    пропускается один пробный запрос: успех замыкает цепь, ошибка снова
+    размыкает её.
+    """
+    def __init__(self, name, threshold=BREAKER_THRESHOLD, reset_after=BREAKER_RESET):
+        self.name = name
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.trial or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self.trial = True
+            return True
+
+    def record(self, ok):
+        """Итог запроса: True — сервер ответил, False — сбой сервера или сети,
+        None — ошибка не говорит о сервере (пробный запрос просто завершён)"""
+        with self.lock:
+            if ok is None:
+                self.trial = False
+                return
+            if ok:
+                if self.opened_at is not None:
+                    print(f"✅ Связь с {self.name} восстановлена")
+                self.failures = 0
+                self.opened_at = None
+                self.trial = False
+                return
+            self.failures += 1
+            if self.trial or self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"⚠️ {self.name} не отвечает, запросы приостановлены "
+                          f"на {self.reset_after} с")
+                self.opened_at = time.monotonic()
+                self.trial = False
+
+
+class Metrics:
+    """Счётчики и время ответа по видам запросов"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+
+    def _entry(self, endpoint):
+        return self.stats.setdefault(endpoint, {
+            'count': 0, 'errors': 0, 'retries': 0, 'rejected': 0,
+            'durations': deque(maxlen=METRICS_WINDOW)
+        })
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            entry = self._entry(endpoint)
+            entry['count'] += 1
+            entry['durations'].append(seconds)
+            if not ok:
+                entry['errors'] += 1
+
+    def count(self, endpoint, field):
+        with self.lock:
+            self._entry(endpoint)[field] += 1
+
+    def snapshot(self):
+        """Сводка: число запросов, ошибок, повторов и время ответа в мс"""
+        result = {}
+        with self.lock:
+            for endpoint, entry in self.stats.items():
+                durations = sorted(entry['durations'])
+                summary = {field: entry[field]
+                           for field in ('count', 'errors', 'retries', 'rejected')}
+                if durations:
+                    summary.update({
+                        'avg_ms': round(sum(durations) / len(durations) * 1000, 1),
+                        'p50_ms': round(durations[len(durations) // 2] * 1000, 1),
+                        'p95_ms': round(durations[min(len(durations) - 1,
+                                                      int(len(durations) * 0.95))] * 1000, 1),
+                        'max_ms': round(durations[-1] * 1000, 1),
+                    })
+                result[endpoint] = summary
+        return result
+
+
+class HttpClient:
+    """Одна сессия requests на всё приложение.
+
+    Сессия держит соединения открытыми (keep-alive), поэтому опрос чата и
+    проверка обновлений не платят за новое TCP/TLS-соединение на каждый
+    запрос. Таймауты, повторы и размыкатель берутся из ENDPOINTS по имени
+    вида запроса.
+    """
+    def __init__(self, endpoints=ENDPOINTS):
+        self.endpoints = endpoints
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.breakers = {}
+        self.breakers_lock = threading.Lock()
+        self.metrics = Metrics()
+
+    def breaker(self, url):
+        parts = urlsplit(url)
+        host = f"{parts.scheme}://{parts.netloc}"
+        with self.breakers_lock:
+            if host not in self.breakers:
+                self.breakers[host] = CircuitBreaker(host)
+            return self.breakers[host]
+
+    @staticmethod
+    def backoff(attempt):
+        return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+    @staticmethod
+    def retry_after(response):
+        try:
+            return min(float(response.headers.get('Retry-After', '')), BACKOFF_CAP)
+        except ValueError:
+            return None
+
+    def request(self, endpoint, method, url, **kwargs):
+        """Запрос по правилам endpoint; ошибки сети — RequestException"""
+        profile = self.endpoints[endpoint]
+        kwargs.setdefault('timeout', profile.timeout)
+        breaker = self.breaker(url) if profile.breaker else None
+        retries = profile.retries if method == 'GET' or profile.retry_post else 0
+
+        attempt = 0
+        while True:
+            if breaker and not breaker.allow():
+                self.metrics.count(endpoint, 'rejected')
+                raise CircuitOpenError(f"{breaker.name} временно недоступен")
+            started = time.perf_counter()
+            # Итог для размыкателя записывается при любом исходе, иначе пробный
+            # запрос с неожиданной ошибкой оставил бы цепь разомкнутой навсегда
+            outcome = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except RequestException as e:
+                self.metrics.record(endpoint, time.perf_counter() - started, ok=False)
+                network_error = isinstance(e, (requests.exceptions.ConnectionError,
+                                               requests.exceptions.Timeout))
+                if network_error:
+                    outcome = False
+                if not network_error or attempt >= retries:
+                    raise
+                delay = self.backoff(attempt)
+            else:
+                outcome = response.status_code < 500
+                self.metrics.record(endpoint, time.perf_counter() - started, ok=outcome)
+                if response.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return response
+                delay = self.retry_after(response) or self.backoff(attempt)
+                response.close()
+            finally:
+                if breaker:
+                    breaker.record(outcome)
+            attempt += 1
+            self.metrics.count(endpoint, 'retries')
+            time.sleep(delay)
+
+    def get(self, endpoint, url, **kwargs):
+        return self.request(endpoint, 'GET', url, **kwargs)
+
+    def post(self, endpoint, url, **kwargs):
+        return self.request(endpoint, 'POST', url, **kwargs)
+
+
+client = HttpClient()
+
+
+def get(endpoint, url, **kwargs):
+    return client.get(endpoint, url, **kwargs)
+
+
+def post(endpoint, url, **kwargs):
+    return client.post(endpoint, url, **kwargs)
+
+
+def log_metrics():
+    """Вывести сводку по сетевым запросам за время работы"""
+    for endpoint, summary in sorted(client.metrics.snapshot().items()):
+        timing = (f", p50 {summary['p50_ms']} мс, p95 {summary['p95_ms']} мс, "
+                  f"макс {summary['max_ms']} мс" if 'p50_ms' in summary else "")
+        print(f"🌐 {endpoint}: запросов {summary['count']}, ошибок {summary['errors']}, "
+              f"повторов {summary['retries']}, отклонено {summary['rejected']}{timing}")
@@ -0,0 +1,155 @@
+# Время импорта при холодном старте: отчёт по модулям и проверка бюджета запуска
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+# Бюджет холодного импорта — во столько раз больше замеренной базы,
+# но не меньше пола (при совсем малой базе шум замера больше её самой)
+BUDGET_FACTOR = 2.0
+BUDGET_FLOOR = 0.1
+# База: время импорта app.py и эталонного модуля на машине, где она снята.
+# Эталон замеряется и при проверке, так что база пересчитывается под
+# скорость машины (CI обычно медленнее рабочей)
+BASELINE_FILE = "import_baseline.json"
+REFERENCE_MODULE = "tkinter"
+# Импорт замеряется несколько раз, в зачёт идёт лучший (меньше шума диска и ОС)
+RUNS = 3
+# Модули, которые app.py загружает только при первом использовании
+DEFERRED_MODULES = ("tkcalendar", "docx", "gspread", "google.oauth2.service_account",
+                    "http_client", "updater")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(module):
+    """Один импорт в новом интерпретаторе.
+
+    Возвращает (общее время, список (глубина, модуль, своё время,
+    накопленное время)) по выводу python -X importtime; время в секундах.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=HERE, capture_output=True, text=True, encoding="utf-8",
+                            errors="replace")
+    if result.returncode != 0:
+        raise ImportError(result.stderr.strip().splitlines()[-1])
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            self_us, cumulative_us = int(parts[0]), int(parts[1])
+        except ValueError:
+            continue  # строка заголовка
+        name = parts[2].rstrip()
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        rows.append((depth, name.strip(), self_us / 1e6, cumulative_us / 1e6))
+
+    total = next(cumulative for depth, name, _, cumulative in rows
+                 if depth == 0 and name == module)
+    return total, rows
+
+
+def best_of(module, runs=RUNS):
+    """Лучший из runs замеров"""
+    return min((measure(module) for _ in range(runs)), key=lambda m: m[0])
+
+
+def report(module="app", top=15, runs=RUNS):
+    """Напечатать отчёт; вернуть общее время импорта module"""
+    total, rows = best_of(module, runs)
+    print(f"Холодный импорт {module}: {total * 1000:.0f} мс (лучший из {runs})")
+
+    print(f"\nПрямые зависимости {module}, самые дорогие:")
+    direct = sorted((r for r in rows if r[0] == 1), key=lambda r: r[3], reverse=True)
+    for _, name, _, cumulative in direct[:top]:
+        print(f"  {cumulative * 1000:8.1f} мс  {name}")
+
+    print("\nСамые дорогие модули по собственному времени:")
+    for _, name, own, _ in sorted(rows, key=lambda r: r[2], reverse=True)[:top]:
+        print(f"  {own * 1000:8.1f} мс  {name}")
+
+    print("\nОтложенные модули (загружаются при первом использовании):")
+    for name in DEFERRED_MODULES:
+        try:
+            cost = best_of(name, 1)[0]
+        except ImportError as e:
+            print(f"  {'—':>8}     {name}: не импортируется ({e})")
+            continue
+        print(f"  {cost * 1000:8.1f} мс  {name}")
+    return total
+
+
+def load_baseline(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, module, total, runs=RUNS):
+    reference = best_of(REFERENCE_MODULE, runs)[0]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"module": module, "seconds": round(total, 4),
+                   "reference": REFERENCE_MODULE, "reference_seconds": round(reference, 4)},
+                  f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    print(f"\n💾 База сохранена в {os.path.basename(path)}: {module} {total * 1000:.0f} мс, "
+          f"{REFERENCE_MODULE} {reference * 1000:.0f} мс")
+
+
+def budget_from_baseline(baseline, runs=RUNS):
+    """Бюджет в секундах: база, пересчитанная под эту машину, × BUDGET_FACTOR"""
+    reference = best_of(baseline["reference"], runs)[0]
+    scale = reference / baseline["reference_seconds"] if baseline["reference_seconds"] else 1.0
+    expected = baseline["seconds"] * scale
+    print(f"\nБаза {expected * 1000:.0f} мс ({baseline['seconds'] * 1000:.0f} мс × {scale:.2f} "
+          f"по {baseline['reference']})")
+    return max(expected * BUDGET_FACTOR, BUDGET_FLOOR)
+
+
+def check_budget(module="app", baseline_path=None, runs=RUNS):
+    """(время импорта module, бюджет по базе) без отчёта; для тестов"""
+    baseline = load_baseline(baseline_path or os.path.join(HERE, BASELINE_FILE))
+    if baseline["module"] != module:
+        raise ValueError(f"База снята для {baseline['module']}, а не для {module}")
+    return best_of(module, runs)[0], budget_from_baseline(baseline, runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Отчёт о времени импорта при запуске")
+    parser.add_argument("--module", default="app", help="какой модуль замерять")
+    parser.add_argument("--top", type=int, default=15, help="сколько строк в списках")
+    parser.add_argument("--runs", type=int, default=RUNS)
+    parser.add_argument("--budget", type=float, default=None,
+                        help="явный бюджет в секундах; при превышении код выхода 1")
+    parser.add_argument("--check", action="store_true",
+                        help=f"проверить бюджет по базе {BASELINE_FILE} (так делает CI): "
+                             f"{BUDGET_FACTOR:g}× базы, не меньше {BUDGET_FLOOR:g} с")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help=f"записать замер как новую базу в {BASELINE_FILE}")
+    parser.add_argument("--baseline", default=os.path.join(HERE, BASELINE_FILE))
+    args = parser.parse_args()
+
+    total = report(args.module, args.top, args.runs)
+    if args.save_baseline:
+        save_baseline(args.baseline, args.module, total, args.runs)
+    budget = args.budget
+    if budget is None and args.check:
+        baseline = load_baseline(args.baseline)
+        if baseline["module"] != args.module:
+            print(f"\n❌ База снята для {baseline['module']}, а не для {args.module}")
+            return 1
+        budget = budget_from_baseline(baseline, args.runs)
+    if budget is not None:
+        if total > budget:
+            print(f"\n❌ Импорт {args.module} занял {total * 1000:.0f} мс — "
+                  f"больше бюджета {budget * 1000:.0f} мс")
+            return 1
+        print(f"\n✅ Импорт {args.module} укладывается в бюджет {budget * 1000:.0f} мс")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
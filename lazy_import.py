@@ -0,0 +1,39 @@
+# Отложенная загрузка тяжёлых модулей: импорт при первом обращении к атрибуту
+import importlib
+import threading
+import time
+
+# Время фактической загрузки отложенных модулей, секунды
+LOAD_TIMES = {}
+
+
+class LazyModule:
+    """Заменитель модуля, который импортирует его при первом обращении.
+
+    Используется для библиотек, нужных только в отдельных действиях (чат,
+    проверка обновлений, выбор даты): программа стартует без них, а цену
+    импорта платит первое действие, которому они нужны.
+    Сборщик exe не видит такой импорт, поэтому модуль нужно перечислить
+    в --hidden-import (или --collect-all) при сборке.
+    """
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                started = time.perf_counter()
+                self._module = importlib.import_module(self._name)
+                LOAD_TIMES[self._name] = time.perf_counter() - started
+                print(f"📦 Загружен модуль {self._name}: "
+                      f"{LOAD_TIMES[self._name] * 1000:.0f} мс")
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "загружен" if self._module is not None else "не загружен"
+        return f"<отложенный модуль {self._name}, {state}>"
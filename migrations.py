@@ -0,0 +1,490 @@
+# Версионные миграции схемы базы: номер применённой версии хранится в PRAGMA user_version
+import os
+import sqlite3
+import time
+
+import chat_archive
+from client_keys import identity_key, sort_key, split_fio
+from password_hash import PasswordHasher
+
+# (версия, название, функция(cur[, prepared]), подготовка(conn) или None) в порядке применения
+MIGRATIONS = []
+
+CLIENTS_TABLE = """
+    CREATE TABLE {name} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        last_name TEXT NOT NULL,
+        first_name TEXT NOT NULL,
+        middle_name TEXT,
+        dob TEXT NOT NULL,
+        phone TEXT,
+        contract_number TEXT,
+        ippcu_start TEXT,
+        ippcu_end TEXT,
+        group_name TEXT,
+        updated_at TEXT DEFAULT '',
+        identity_key TEXT,
+        sort_key TEXT,
+        UNIQUE(last_name, first_name, middle_name, dob)
+    )
+"""
+
+# Колонки, по которым список сортируется щелчком на заголовке
+ORDER_INDEX_COLUMNS = ("first_name", "middle_name", "dob", "phone", "contract_number",
+                       "ippcu_start", "ippcu_end", "group_name")
+
+
+class MigrationError(Exception):
+    """Шаг миграции не применён и откачен; база осталась на прежней версии"""
+    def __init__(self, version, name, error):
+        super().__init__(f"Миграция {version} «{name}» не применена: {error}")
+        self.version = version
+        self.error = error
+
+
+def migration(version, name, prepare=None):
+    """Зарегистрировать шаг миграции с номером version.
+
+    prepare(conn) — долгая подготовка (например, хеширование паролей),
+    которая выполняется до блокировки базы; её результат передаётся шагу
+    вторым аргументом.
+    """
+    def register(func):
+        MIGRATIONS.append((version, name, func, prepare))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return func
+    return register
+
+
+def migrate(conn):
+    """Довести схему до последней версии; вернуть номер версии.
+
+    Если база уже актуальна, всё сводится к одному чтению PRAGMA
+    user_version. Каждый шаг выполняется в своей транзакции вместе с записью
+    нового номера версии: при ошибке шаг откатывается целиком и будет
+    повторён при следующем запуске. Номер перечитывается под блокировкой,
+    поэтому две одновременно запущенные копии не применят шаг дважды.
+    Подготовка шага выполняется до BEGIN IMMEDIATE и не держит блокировку
+    записи. Ошибка шага — MigrationError.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    pending = [m for m in MIGRATIONS if m[0] > version]
+    if not pending:
+        return version
+
+    isolation_level = conn.isolation_level
+    conn.isolation_level = None
+    total = time.perf_counter()
+    try:
+        for target, name, func, prepare in pending:
+            started = time.perf_counter()
+            try:
+                prepared = prepare(conn) if prepare else None
+            except Exception as e:
+                print(f"❌ Миграция {target} «{name}» не применена")
+                raise MigrationError(target, name, e) from e
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("PRAGMA user_version").fetchone()[0] >= target:
+                    conn.execute("COMMIT")
+                    continue
+                if prepare:
+                    func(conn.cursor(), prepared)
+                else:
+                    func(conn.cursor())
+                conn.execute(f"PRAGMA user_version = {int(target)}")
+                conn.execute("COMMIT")
+            except Exception as e:
+                conn.execute("ROLLBACK")
+                print(f"❌ Миграция {target} «{name}» не применена")
+                raise MigrationError(target, name, e) from e
+            version = target
+            print(f"🗃️ Миграция {target} «{name}»: {(time.perf_counter() - started) * 1000:.0f} мс")
+    finally:
+        conn.isolation_level = isolation_level
+    print(f"✅ Схема базы обновлена до версии {version} "
+          f"за {(time.perf_counter() - total) * 1000:.0f} мс")
+    return version
+
+
+def table_columns(cur, table):
+    return [row[1] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def database_path(cur):
+    """Файл основной базы соединения ('' для базы в памяти)"""
+    return cur.execute("PRAGMA database_list").fetchone()[2]
+
+
+@migration(1, "Таблица клиентов")
+def create_clients(cur):
+    """Таблица clients; старая схема с одним полем fio переносится пакетом"""
+    cols = table_columns(cur, "clients")
+    if not cols:
+        cur.execute(CLIENTS_TABLE.format(name="clients"))
+        return
+
+    if "fio" in cols and "last_name" not in cols:
+        cur.execute("DROP TABLE IF EXISTS clients_new")
+        cur.execute(CLIENTS_TABLE.format(name="clients_new"))
+        rows = cur.execute("""
+            SELECT id, fio, dob, phone, contract_number, ippcu_start, ippcu_end, group_name
+            FROM clients
+        """).fetchall()
+        cur.executemany("""
+            INSERT OR IGNORE INTO clients_new
+            (id, last_name, first_name, middle_name, dob, phone, contract_number,
+             ippcu_start, ippcu_end, group_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [(cid, *split_fio(fio or ""), dob or "", phone, contract, start, end, group)
+              for cid, fio, dob, phone, contract, start, end, group in rows])
+        print(f"🔄 Старая схема ФИО перенесена: {cur.rowcount} из {len(rows)} записей")
+        cur.execute("DROP TABLE clients")
+        cur.execute("ALTER TABLE clients_new RENAME TO clients")
+        cols = table_columns(cur, "clients")
+
+    for col_def in ("last_name TEXT DEFAULT ''", "first_name TEXT DEFAULT ''",
+                    "middle_name TEXT DEFAULT ''", "updated_at TEXT DEFAULT ''",
+                    "identity_key TEXT", "sort_key TEXT"):
+        if col_def.split()[0] not in cols:
+            cur.execute(f"ALTER TABLE clients ADD COLUMN {col_def}")
+            print(f"✅ Добавлена колонка: {col_def.split()[0]}")
+
+
+def backfill_identity_keys(cur):
+    """Заполнение ключа идентичности у записей, где он ещё не посчитан.
+
+    Уже существующие дубли (отличающиеся только регистром, «ё» или записью
+    даты рождения) получают ключ-заглушку «#id»: он не совпадает ни с одним
+    настоящим ключом, не нарушает уникальный индекс и не даёт пересматривать
+    запись заново. Такие записи можно найти и объединить через поиск дублей.
+    """
+    cur.execute("""
+        SELECT id, last_name, first_name, middle_name, dob FROM clients
+        WHERE identity_key IS NULL ORDER BY id
+    """)
+    pending = cur.fetchall()
+    if not pending:
+        return
+
+    cur.execute("SELECT identity_key FROM clients WHERE identity_key IS NOT NULL")
+    taken = {row[0] for row in cur.fetchall()}
+
+    updates = []
+    duplicates = 0
+    for cid, last, first, middle, dob in pending:
+        key = identity_key(last, first, middle, dob)
+        if key in taken:
+            duplicates += 1
+            key = f"#{cid}"
+        taken.add(key)
+        updates.append((key, cid))
+
+    if updates:
+        cur.executemany("UPDATE clients SET identity_key = ? WHERE id = ?", updates)
+        print(f"🔑 Ключи идентичности рассчитаны: {len(updates) - duplicates}")
+    if duplicates:
+        print(f"⚠️ Найдено возможных дублей без ключа: {duplicates}")
+
+
+def backfill_sort_keys(cur):
+    """Расчёт ключа сортировки у записей, где он ещё не заполнен"""
+    cur.execute("SELECT id, last_name, first_name, middle_name FROM clients WHERE sort_key IS NULL")
+    updates = [(sort_key(last, first, middle), cid) for cid, last, first, middle in cur.fetchall()]
+    if updates:
+        cur.executemany("UPDATE clients SET sort_key = ? WHERE id = ?", updates)
+        print(f"🔤 Ключи сортировки рассчитаны: {len(updates)}")
+
+
+@migration(2, "Ключи и индексы клиентов")
+def create_client_indexes(cur):
+    # Выгрузка в Google Sheets читает изменения по курсору (updated_at, id)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_clients_updated ON clients(updated_at, id)")
+    backfill_identity_keys(cur)
+    cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_clients_identity ON clients(identity_key)")
+    # Списки выдаются в порядке индекса (sort_key, id), без отдельной сортировки
+    backfill_sort_keys(cur)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_clients_sort ON clients(sort_key, id)")
+    for column in ORDER_INDEX_COLUMNS:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_clients_order_{column} "
+                    f"ON clients(COALESCE({column}, ''), id)")
+
+
+DEFAULT_USERS = [
+    ('admin', 'admin', 'Зеленков Д.В.', 'младший администратор БД (Главный)', 'all'),
+    ('ДУРАНДИНА', '12345', 'Дурандина А.В.', 'Заведующая', 'all'),
+    ('ЛАВРОВА', '12345', 'Лаврова А.А.', 'Сотрудник', 'all'),
+]
+
+
+def hash_default_users(conn):
+    """Хеши паролей пользователей по умолчанию, которых ещё нет в базе.
+
+    Хеш намеренно медленный (а при первом запуске ещё и подбирается его
+    стоимость), поэтому он считается до блокировки базы и только для
+    отсутствующих пользователей.
+    """
+    try:
+        existing = {row[0] for row in conn.execute("SELECT username FROM users")}
+    except sqlite3.OperationalError:
+        existing = set()  # таблицы users ещё нет
+    missing = [user for user in DEFAULT_USERS if user[0] not in existing]
+    if not missing:
+        return {}
+    db_path = database_path(conn)
+    hasher = PasswordHasher(os.path.join(os.path.dirname(db_path), "password_hash.json")
+                            if db_path else None)
+    return {username: hasher.hash(password) for username, password, *_ in missing}
+
+
+@migration(3, "Пользователи и токены входа", prepare=hash_default_users)
+def create_auth_tables(cur, password_hashes):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT NOT NULL,
+            role TEXT NOT NULL,
+            permissions TEXT DEFAULT 'basic',
+            is_active INTEGER DEFAULT 1,
+            last_login TEXT,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS remember_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token_hash TEXT NOT NULL,
+            expires_at TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+        )
+    """)
+
+    # INSERT OR IGNORE: пользователь мог появиться, пока считались хеши
+    cur.executemany("""
+        INSERT OR IGNORE INTO users (username, password_hash, full_name, role, permissions)
+        VALUES (?, ?, ?, ?, ?)
+    """, [(username, password_hashes[username], full_name, role, permissions)
+          for username, _, full_name, role, permissions in DEFAULT_USERS
+          if username in password_hashes])
+
+
+@migration(4, "Таблицы чата")
+def create_chat_tables(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_name TEXT NOT NULL,
+            message TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            message_type TEXT DEFAULT 'text',
+            is_read INTEGER DEFAULT 0
+        )
+    """)
+
+    # Курсор прочтения: id последнего прочитанного сообщения для каждого
+    # пользователя. Заменяет общий флаг is_read, который один читатель
+    # снимал сразу для всех
+    cursors_exist = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_read_cursors'"
+    ).fetchone()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_read_cursors (
+            user_name TEXT PRIMARY KEY,
+            last_read_id INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_name TEXT UNIQUE NOT NULL,
+            full_name TEXT NOT NULL,
+            role TEXT DEFAULT 'employee',
+            is_online INTEGER DEFAULT 0,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.executemany(
+        "INSERT OR IGNORE INTO chat_users (user_name, full_name, role) VALUES (?, ?, ?)", [
+            ("admin", "Зеленков Д.В.", "admin"),
+            ("manager", "Дурандина А.В.", "manager"),
+            ("social1", "Социальный работник 1", "employee"),
+            ("social2", "Социальный работник 2", "employee"),
+            ("social3", "Социальный работник 3", "employee"),
+        ])
+
+    # Полнотекстовый индекс по сообщениям; содержимое берётся из
+    # chat_messages, триггеры держат индекс в актуальном состоянии
+    fts_exists = cur.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'chat_messages_fts'"
+    ).fetchone()
+    cur.execute(f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts
+        USING fts5(message, content='chat_messages', content_rowid='id',
+                   tokenize='{chat_archive.FTS_TOKENIZE}')
+    """)
+    # В индекс идёт текст с «ё» → «е», поэтому вместо 'rebuild'
+    # индекс заполняется и чистится теми же выражениями явно
+    new_text, old_text = chat_archive.fts_text("new.message"), chat_archive.fts_text("old.message")
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+            INSERT INTO chat_messages_fts (rowid, message) VALUES (new.id, {new_text});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+            INSERT INTO chat_messages_fts (chat_messages_fts, rowid, message)
+            VALUES ('delete', old.id, {old_text});
+        END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE OF message ON chat_messages BEGIN
+            INSERT INTO chat_messages_fts (chat_messages_fts, rowid, message)
+            VALUES ('delete', old.id, {old_text});
+            INSERT INTO chat_messages_fts (rowid, message) VALUES (new.id, {new_text});
+        END
+    """)
+    if not fts_exists:
+        cur.execute(f"""
+            INSERT INTO chat_messages_fts (rowid, message)
+            SELECT id, {chat_archive.fts_text('message')} FROM chat_messages
+        """)
+
+    if not cursors_exist:
+        # Однократный перенос старых флагов is_read в курсоры
+        cur.execute("""
+            INSERT OR IGNORE INTO chat_read_cursors (user_name, last_read_id)
+            SELECT user_name,
+                   (SELECT COALESCE(MAX(id), 0) FROM chat_messages WHERE is_read = 1)
+            FROM chat_users
+        """)
+
+
+@migration(5, "Журнал удалённых клиентов")
+def create_client_deletions(cur):
+    # Выгрузка в Google Sheets убирает строки удалённых и объединённых клиентов
+    # по этому журналу, читая его по возрастанию seq после своего курсора
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS client_deletions (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER NOT NULL,
+            deleted_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS clients_log_delete AFTER DELETE ON clients BEGIN
+            INSERT INTO client_deletions (client_id) VALUES (old.id);
+        END
+    """)
+
+
+@migration(6, "Счётчик изменений клиентов")
+def create_client_changes(cur):
+    # Метка изменений для окон и снимка таблицы: version растёт при любой правке
+    # клиентов, membership — только при добавлении и удалении. Чтение метки —
+    # одна строка по ключу, без COUNT(*) по всей таблице
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS client_changes (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL DEFAULT 0,
+            membership INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO client_changes (id) VALUES (1)")
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS clients_count_insert AFTER INSERT ON clients BEGIN
+            UPDATE client_changes SET version = version + 1, membership = membership + 1 WHERE id = 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS clients_count_delete AFTER DELETE ON clients BEGIN
+            UPDATE client_changes SET version = version + 1, membership = membership + 1 WHERE id = 1;
+        END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS clients_count_update AFTER UPDATE ON clients BEGIN
+            UPDATE client_changes SET version = version + 1 WHERE id = 1;
+        END
+    """)
+
+
+@migration(7, "Ключи идентичности с датой рождения в ISO")
+def rebuild_identity_keys(cur):
+    # Прежние ключи брали дату рождения как есть, и «01.02.1950» не совпадало
+    # с «1950-02-01»; ключи пересчитываются заново с нормализованной датой
+    cur.execute("UPDATE clients SET identity_key = NULL")
+    backfill_identity_keys(cur)
+
+
+@migration(8, "Служебные таблицы чата и выгрузки")
+def create_service_tables(cur):
+    """Таблицы, которые раньше создавались при каждом обращении к ним.
+
+    В уже работающих базах они есть, поэтому все запросы с IF NOT EXISTS;
+    у sheet_sync_state старых версий нет курсора журнала удалений.
+    """
+    # Оглавление архивов чата: диапазон id каждого месяца (chat_archive)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_archives (
+            month TEXT PRIMARY KEY,
+            first_id INTEGER NOT NULL,
+            last_id INTEGER NOT NULL,
+            message_count INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    # Очередь исходящих сообщений чата (chat_outbox.ChatOutbox)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_key TEXT NOT NULL UNIQUE,
+            user TEXT NOT NULL,
+            message TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL DEFAULT 0,
+            server_id INTEGER,
+            last_error TEXT
+        )
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_chat_outbox_due
+        ON chat_outbox(status, next_attempt_at)
+    """)
+    # Журнал автоматических сообщений: одно на (вид, субъект, дата)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS chat_notification_ledger (
+            kind TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            day TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (kind, subject, day)
+        )
+    """)
+    # Курсоры выгрузки в Google Sheets для каждого листа (sheets_sync.SheetPusher)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS sheet_sync_state (
+            sheet_key TEXT PRIMARY KEY,
+            last_updated_at TEXT NOT NULL DEFAULT '',
+            last_id INTEGER NOT NULL DEFAULT 0,
+            last_deletion_seq INTEGER NOT NULL DEFAULT 0,
+            pushed_at TEXT
+        )
+    """)
+    if "last_deletion_seq" not in table_columns(cur, "sheet_sync_state"):
+        cur.execute("ALTER TABLE sheet_sync_state "
+                    "ADD COLUMN last_deletion_seq INTEGER NOT NULL DEFAULT 0")
+    # История объединения карточек (dedupe.merge_clients)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS client_merges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kept_id INTEGER NOT NULL,
+            dropped_id INTEGER NOT NULL,
+            dropped_data TEXT,
+            merged_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
@@ -0,0 +1,256 @@
+# Хеширование паролей: соль, scrypt или PBKDF2, стоимость подбирается под машину
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import statistics
+import threading
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+# Сколько должна длиться одна проверка пароля на этой машине, секунды
+TARGET_SECONDS = 0.25
+SALT_BYTES = 16
+DIGEST_BYTES = 32
+
+
+def b64encode(data):
+    return base64.b64encode(data).decode("ascii")
+
+
+def b64decode(text):
+    return base64.b64decode(text.encode("ascii"))
+
+
+class KdfHasher(ABC):
+    """Общая часть алгоритмов: формат «алгоритм$стоимость$соль$хеш»"""
+    algorithm = None
+    MIN_COST = MAX_COST = None
+
+    def available(self):
+        return True
+
+    @abstractmethod
+    def derive(self, password, salt, cost):
+        """Хеш пароля с солью при стоимости cost"""
+
+    def hash(self, password, cost):
+        salt = secrets.token_bytes(SALT_BYTES)
+        digest = self.derive(password, salt, cost)
+        return f"{self.algorithm}${cost}${b64encode(salt)}${b64encode(digest)}"
+
+    @staticmethod
+    def parse(encoded):
+        """(стоимость, соль, хеш) из строки в базе"""
+        _, cost, salt, digest = encoded.split("$")
+        return int(cost), b64decode(salt), b64decode(digest)
+
+    def verify(self, password, encoded):
+        cost, salt, digest = self.parse(encoded)
+        return hmac.compare_digest(self.derive(password, salt, cost), digest)
+
+    def measure(self, cost):
+        started = time.perf_counter()
+        self.derive("calibration", b"\0" * SALT_BYTES, cost)
+        return time.perf_counter() - started
+
+    @abstractmethod
+    def calibrate(self, target):
+        """Стоимость, при которой проверка занимает около target секунд"""
+
+    @abstractmethod
+    def benchmark_costs(self):
+        """Значения стоимости для замера времени входа"""
+
+
+class ScryptHasher(KdfHasher):
+    """scrypt: стоимость — параметр N (степень двойки), память 128·r·N байт"""
+    algorithm = "scrypt"
+    MIN_COST = 2 ** 14
+    # 128 МБ памяти на проверку — предел для старых рабочих мест
+    MAX_COST = 2 ** 17
+    R = 8
+    P = 1
+
+    def available(self):
+        return hasattr(hashlib, "scrypt")
+
+    def derive(self, password, salt, cost):
+        return hashlib.scrypt(password.encode("utf-8"), salt=salt, n=cost, r=self.R, p=self.P,
+                              maxmem=256 * self.R * cost + (1 << 20), dklen=DIGEST_BYTES)
+
+    def calibrate(self, target):
+        """Наибольшее N из допустимых, при котором проверка не дольше target"""
+        cost = self.MIN_COST
+        self.measure(cost)  # первый вызов медленнее из-за выделения памяти
+        elapsed = self.measure(cost)
+        # Время растёт линейно по N: удвоение оправдано, пока укладываемся в target
+        while cost < self.MAX_COST and elapsed * 2 <= target:
+            cost *= 2
+            elapsed = self.measure(cost)
+        return cost
+
+    def benchmark_costs(self):
+        cost, costs = self.MIN_COST, []
+        while cost <= self.MAX_COST:
+            costs.append(cost)
+            cost *= 2
+        return costs
+
+
+class Pbkdf2Hasher(KdfHasher):
+    """PBKDF2-HMAC-SHA256: стоимость — число итераций"""
+    algorithm = "pbkdf2_sha256"
+    MIN_COST = 100_000
+    MAX_COST = 5_000_000
+    PROBE = 20_000
+
+    def derive(self, password, salt, cost):
+        return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt, cost,
+                                   dklen=DIGEST_BYTES)
+
+    def calibrate(self, target):
+        """Итерации пропорционально замеру на PROBE итерациях"""
+        elapsed = max(self.measure(self.PROBE), 1e-6)
+        cost = int(self.PROBE * target / elapsed) // 1000 * 1000
+        return max(self.MIN_COST, min(cost, self.MAX_COST))
+
+    def benchmark_costs(self):
+        return [100_000, 200_000, 400_000, 800_000, 1_600_000]
+
+
+HASHERS = {hasher.algorithm: hasher for hasher in (ScryptHasher(), Pbkdf2Hasher())}
+
+
+def is_legacy(encoded):
+    """Старый формат: несолёный SHA-256 в hex"""
+    return len(encoded) == 64 and "$" not in encoded
+
+
+class PasswordHasher:
+    """Хеширование и проверка паролей с подбором стоимости.
+
+    Стоимость подбирается один раз на машине так, чтобы проверка занимала
+    около target секунд, и сохраняется в settings_path. Проверка понимает
+    все известные форматы, включая старый SHA-256; needs_rehash подсказывает,
+    что хеш пора пересчитать при ближайшем успешном входе.
+    """
+    def __init__(self, settings_path=None, target=TARGET_SECONDS, algorithm=None):
+        self.settings_path = settings_path
+        self.target = target
+        if algorithm is None:
+            algorithm = "scrypt" if HASHERS["scrypt"].available() else "pbkdf2_sha256"
+        self.hasher = HASHERS[algorithm]
+        self.cost = None
+        self.lock = threading.Lock()
+
+    def load_cost(self):
+        if not self.settings_path or not os.path.exists(self.settings_path):
+            return None
+        try:
+            with open(self.settings_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("algorithm") != self.hasher.algorithm or data.get("target") != self.target:
+            return None
+        return data.get("cost")
+
+    def save_cost(self, cost, seconds):
+        if not self.settings_path:
+            return
+        data = {"algorithm": self.hasher.algorithm, "cost": cost, "target": self.target,
+                "seconds": round(seconds, 3), "calibrated_at": datetime.now().isoformat()}
+        try:
+            with open(self.settings_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"Ошибка сохранения параметров хеширования: {e}")
+
+    def current_cost(self):
+        """Стоимость для новых хешей; при первом вызове — замер на машине"""
+        with self.lock:
+            if self.cost is None:
+                self.cost = self.load_cost()
+            if self.cost is None:
+                self.cost = self.hasher.calibrate(self.target)
+                seconds = self.hasher.measure(self.cost)
+                self.save_cost(self.cost, seconds)
+                print(f"🔐 Хеширование паролей: {self.hasher.algorithm}, стоимость {self.cost}, "
+                      f"проверка {seconds * 1000:.0f} мс")
+            return self.cost
+
+    def hash(self, password):
+        return self.hasher.hash(password, self.current_cost())
+
+    def verify(self, password, encoded):
+        if not encoded:
+            return False
+        if is_legacy(encoded):
+            digest = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(digest, encoded)
+        hasher = HASHERS.get(encoded.split("$", 1)[0])
+        if hasher is None or not hasher.available():
+            return False
+        try:
+            return hasher.verify(password, encoded)
+        except ValueError:
+            return False
+
+    def needs_rehash(self, encoded):
+        """True для старого формата, другого алгоритма или меньшей стоимости"""
+        if is_legacy(encoded) or not encoded.startswith(self.hasher.algorithm + "$"):
+            return True
+        try:
+            cost = self.hasher.parse(encoded)[0]
+        except ValueError:
+            return True
+        return cost < self.current_cost()
+
+
+def benchmark(rounds=3, target=TARGET_SECONDS):
+    """Время входа (одна проверка пароля) для каждой стоимости"""
+    password = "benchmark-password"
+    print(f"Цель: {target * 1000:.0f} мс на проверку, замеров на значение: {rounds}")
+    for name, hasher in HASHERS.items():
+        if not hasher.available():
+            print(f"{name}: недоступен в этой сборке Python")
+            continue
+        chosen = hasher.calibrate(target)
+        costs = sorted(set(hasher.benchmark_costs()) | {chosen})
+        for cost in costs:
+            encoded = hasher.hash(password, cost)
+            times = []
+            for _ in range(rounds):
+                started = time.perf_counter()
+                hasher.verify(password, encoded)
+                times.append(time.perf_counter() - started)
+            mark = "  ← подобрано" if cost == chosen else ""
+            print(f"{name:14} {cost:>10}  {statistics.median(times) * 1000:8.1f} мс{mark}")
+
+    legacy = hashlib.sha256(password.encode()).hexdigest()
+    started = time.perf_counter()
+    PasswordHasher().verify(password, legacy)
+    print(f"{'sha256 (старый)':14} {'-':>10}  {(time.perf_counter() - started) * 1000:8.3f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Параметры хеширования паролей")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="замерить время входа для разных значений стоимости")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--target", type=float, default=TARGET_SECONDS,
+                        help="целевое время проверки, секунды")
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.rounds, args.target)
+    else:
+        PasswordHasher(target=args.target).current_cost()
+
+
+if __name__ == "__main__":
+    main()
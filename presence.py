@@ -0,0 +1,72 @@
+# Присутствие пользователей в чате: сигналы «я здесь» с истечением в памяти
+import time
+from datetime import datetime
+
+# Пользователь считается вышедшим, если от него нет сигнала дольше этого, секунды
+PRESENCE_TTL = 45
+# Как часто клиент подаёт сигнал; с запасом в несколько пропусков до TTL
+HEARTBEAT_INTERVAL = 15
+
+
+class PresenceTracker:
+    """Кто сейчас в сети, без записи в базу.
+
+    Каждый сигнал продлевает присутствие на ttl секунд; пропавший без выхода
+    клиент (сбой, выключение) пропадает из списка сам по истечении срока.
+    version растёт только при изменении списка (вход, выход, истечение,
+    смена данных пользователя), поэтому клиенты могут ждать изменений по
+    версии, а не перечитывать список.
+    """
+    def __init__(self, ttl=PRESENCE_TTL, clock=time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        # user -> [срок истечения, данные, время входа]
+        self.users = {}
+        self.version = 0
+
+    def heartbeat(self, user, info=None):
+        """Отметить сигнал пользователя; True, если список изменился"""
+        info = info or {}
+        entry = self.users.get(user)
+        expires_at = self.clock() + self.ttl
+        if entry is None:
+            self.users[user] = [expires_at, info, datetime.now().isoformat(timespec="seconds")]
+            self.version += 1
+            return True
+        entry[0] = expires_at
+        if entry[1] != info:
+            entry[1] = info
+            self.version += 1
+            return True
+        return False
+
+    def leave(self, user):
+        """Явный выход; True, если пользователь был в сети"""
+        if self.users.pop(user, None) is None:
+            return False
+        self.version += 1
+        return True
+
+    def expire(self):
+        """Убрать пользователей без сигнала дольше ttl; вернуть их имена"""
+        now = self.clock()
+        expired = [user for user, entry in self.users.items() if entry[0] <= now]
+        for user in expired:
+            del self.users[user]
+        if expired:
+            self.version += 1
+        return expired
+
+    def next_expiry(self):
+        """Секунд до ближайшего истечения; None, если никого нет"""
+        if not self.users:
+            return None
+        return max(0.0, min(entry[0] for entry in self.users.values()) - self.clock())
+
+    def online(self):
+        """Список в сети: словари user, since и данные пользователя"""
+        return [dict(info, user=user, since=since)
+                for user, (_, info, since) in sorted(self.users.items())]
+
+    def snapshot(self):
+        return {"version": self.version, "ttl": self.ttl, "users": self.online()}
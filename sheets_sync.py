@@ -0,0 +1,302 @@
+import sqlite3
+import time
+import random
+from datetime import datetime
+from client_keys import normalize_name
+
+# Колонки листа Google Sheets и соответствующие им поля клиента; по «ID»
+# строка листа сопоставляется с клиентом, поэтому смена ФИО не создаёт новую строку
+SHEET_COLUMNS = [
+    "ID", "ФИО", "Дата рождения", "Телефон", "Номер договора",
+    "Дата начала ИППСУ", "Дата окончания ИППСУ", "Группа"
+]
+
+
+class RateLimitError(Exception):
+    """Превышен лимит запросов к Google Sheets (HTTP 429)"""
+    def __init__(self, message="Превышен лимит запросов", retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _is_rate_limited(error):
+    """Проверка, что ошибка вызвана ограничением частоты запросов"""
+    if isinstance(error, RateLimitError):
+        return True
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None) == 429
+
+
+def _col_letter(index):
+    """Номер колонки (с 1) в буквенное обозначение A1"""
+    letters = ""
+    while index > 0:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+
+def _row_key(fio, dob):
+    """Ключ строки без ID (выгружена до появления колонки): ФИО + дата рождения"""
+    return f"{normalize_name(fio)}|{(dob or '').strip()}"
+
+
+class FakeWorksheet:
+    """Локальная замена gspread.Worksheet для проверки выгрузки без сети"""
+    def __init__(self, rows=None, fail_every=0):
+        self.rows = [list(r) for r in (rows or [SHEET_COLUMNS])]
+        self.fail_every = fail_every
+        self.calls = 0
+        self.batch_calls = 0
+
+    def get_all_values(self):
+        self.calls += 1
+        return [list(r) for r in self.rows]
+
+    def batch_update(self, data, **kwargs):
+        self.calls += 1
+        if self.fail_every and self.calls % self.fail_every == 0:
+            raise RateLimitError(retry_after=0)
+        self.batch_calls += 1
+        for item in data:
+            start, _, _ = item["range"].partition(":")
+            row_num = int("".join(ch for ch in start if ch.isdigit()))
+            while len(self.rows) < row_num:
+                self.rows.append([])
+            for offset, values in enumerate(item["values"]):
+                self.rows[row_num - 1 + offset] = list(values)
+        return {"totalUpdatedRows": len(data)}
+
+
+class SheetPusher:
+    """Выгрузка изменённых клиентов обратно в Google Sheets пакетами"""
+    def __init__(self, db_path, worksheet, sheet_key, batch_size=200,
+                 max_retries=5, min_interval=1.0, sleep=time.sleep):
+        self.db_path = db_path
+        self.worksheet = worksheet
+        self.sheet_key = sheet_key
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.min_interval = min_interval
+        self.sleep = sleep
+        self._last_call = 0.0
+
+    def get_cursor(self):
+        """Позиция, до которой изменения уже выгружены"""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT last_updated_at, last_id FROM sheet_sync_state WHERE sheet_key = ?",
+                (self.sheet_key,)
+            ).fetchone()
+        return row if row else ("", 0)
+
+    def save_cursor(self, updated_at, last_id):
+        """Сохранение курсора после успешной записи пакета"""
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO sheet_sync_state (sheet_key, last_updated_at, last_id, pushed_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(sheet_key) DO UPDATE SET
+                    last_updated_at = excluded.last_updated_at,
+                    last_id = excluded.last_id,
+                    pushed_at = excluded.pushed_at
+            """, (self.sheet_key, updated_at, last_id, datetime.now().isoformat()))
+            conn.commit()
+
+    def get_deletion_cursor(self):
+        """Номер последней записи журнала удалений, уже убранной с листа"""
+        with sqlite3.connect(self.db_path) as conn:
+            row = conn.execute(
+                "SELECT last_deletion_seq FROM sheet_sync_state WHERE sheet_key = ?",
+                (self.sheet_key,)
+            ).fetchone()
+        return row[0] if row else 0
+
+    def save_deletion_cursor(self, seq):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("""
+                INSERT INTO sheet_sync_state (sheet_key, last_deletion_seq, pushed_at)
+                VALUES (?, ?, ?)
+                ON CONFLICT(sheet_key) DO UPDATE SET
+                    last_deletion_seq = excluded.last_deletion_seq,
+                    pushed_at = excluded.pushed_at
+            """, (self.sheet_key, seq, datetime.now().isoformat()))
+            conn.commit()
+
+    def fetch_deletions(self, after_seq, limit):
+        """Удалённые клиенты (журнал client_deletions) после курсора"""
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("""
+                SELECT seq, client_id FROM client_deletions
+                WHERE seq > ? ORDER BY seq LIMIT ?
+            """, (after_seq, limit)).fetchall()
+
+    def fetch_changed(self, cursor, limit):
+        """Клиенты, изменённые после курсора, в порядке (updated_at, id)"""
+        updated_at, last_id = cursor
+        with sqlite3.connect(self.db_path) as conn:
+            return conn.execute("""
+                SELECT id, last_name, first_name, middle_name, dob, phone,
+                       contract_number, ippcu_start, ippcu_end, group_name, updated_at
+                FROM clients
+                WHERE updated_at > ? OR (updated_at = ? AND id > ?)
+                ORDER BY updated_at, id
+                LIMIT ?
+            """, (updated_at, updated_at, last_id, limit)).fetchall()
+
+    def _call(self, func, *args, **kwargs):
+        """Вызов API с паузой между запросами и повтором при HTTP 429"""
+        delay = self.min_interval
+        for attempt in range(self.max_retries + 1):
+            wait = self.min_interval - (time.monotonic() - self._last_call)
+            if wait > 0:
+                self.sleep(wait)
+            try:
+                self._last_call = time.monotonic()
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not _is_rate_limited(e) or attempt == self.max_retries:
+                    raise
+                retry_after = getattr(e, "retry_after", None)
+                pause = retry_after if retry_after is not None else delay + random.uniform(0, delay)
+                print(f"⏳ Лимит Google Sheets, пауза {pause:.1f} с")
+                self.sleep(pause)
+                delay = min(delay * 2, 64)
+
+    def load_sheet_index(self):
+        """Чтение листа одним запросом.
+
+        Возвращает SheetIndex: заголовок, позиции колонок, строки по ID
+        клиента, строки без ID (по ФИО и дате рождения) и пустые строки,
+        которые можно занять новыми клиентами.
+        """
+        values = self._call(self.worksheet.get_all_values)
+        header = list(values[0]) if values else []
+        header_changed = not values
+        for name in SHEET_COLUMNS:
+            if name not in header:
+                header.append(name)
+                header_changed = True
+        return SheetIndex(header, values[1:], header_changed)
+
+    def push(self, progress=None):
+        """Выгрузить все изменения после последней выгрузки.
+
+        Сначала с листа убираются строки удалённых (в том числе объединённых)
+        клиентов, затем пишутся изменённые клиенты. Пишет пакетами по
+        batch_size строк через batch_update и сохраняет курсор после каждого
+        пакета, поэтому прерванная выгрузка продолжается с того же места.
+        Возвращает (обновлено, добавлено, удалено).
+        """
+        sheet = self.load_sheet_index()
+        last_col = _col_letter(len(sheet.header))
+        if sheet.header_changed:
+            self._call(self.worksheet.batch_update,
+                       [{"range": f"A1:{last_col}1", "values": [sheet.header]}])
+
+        def row_update(row_num, values):
+            return {"range": f"A{row_num}:{last_col}{row_num}", "values": [values]}
+
+        updated = added = removed = 0
+        deletion_seq = self.get_deletion_cursor()
+        while True:
+            deletions = self.fetch_deletions(deletion_seq, self.batch_size)
+            if not deletions:
+                break
+            data = []
+            for _, cid in deletions:
+                row_num = sheet.remove(cid)
+                if row_num is not None:
+                    data.append(row_update(row_num, [""] * len(sheet.header)))
+                    removed += 1
+            if data:
+                self._call(self.worksheet.batch_update, data, value_input_option="RAW")
+            deletion_seq = deletions[-1][0]
+            self.save_deletion_cursor(deletion_seq)
+            if progress:
+                progress(updated, added)
+
+        cursor = self.get_cursor()
+        while True:
+            rows = self.fetch_changed(cursor, self.batch_size)
+            if not rows:
+                break
+
+            data = []
+            for (cid, last, first, middle, dob, phone, contract,
+                 ippcu_start, ippcu_end, group, updated_at) in rows:
+                fio = " ".join(p for p in (last, first, middle) if p)
+                fields = {
+                    "ID": str(cid), "ФИО": fio, "Дата рождения": dob or "", "Телефон": phone or "",
+                    "Номер договора": contract or "", "Дата начала ИППСУ": ippcu_start or "",
+                    "Дата окончания ИППСУ": ippcu_end or "", "Группа": group or ""
+                }
+                row_num, values, is_new = sheet.place(cid, fio, dob)
+                if is_new:
+                    added += 1
+                else:
+                    updated += 1
+                for name, value in fields.items():
+                    values[sheet.positions[name]] = value
+                data.append(row_update(row_num, values))
+
+            self._call(self.worksheet.batch_update, data, value_input_option="RAW")
+            cursor = (rows[-1][10], rows[-1][0])
+            self.save_cursor(*cursor)
+            if progress:
+                progress(updated, added)
+
+        return updated, added, removed
+
+
+class SheetIndex:
+    """Соответствие строк листа и клиентов на время одной выгрузки"""
+    def __init__(self, header, rows, header_changed=False):
+        self.header = header
+        self.header_changed = header_changed
+        self.positions = {name: header.index(name) for name in SHEET_COLUMNS}
+        self.by_id = {}
+        self.by_key = {}
+        self.free = []
+        for row_num, row in enumerate(rows, start=2):
+            padded = list(row) + [""] * (len(header) - len(row))
+            cid = padded[self.positions["ID"]].strip()
+            fio = padded[self.positions["ФИО"]]
+            if cid:
+                self.by_id.setdefault(cid, (row_num, padded))
+            elif fio.strip():
+                key = _row_key(fio, padded[self.positions["Дата рождения"]])
+                self.by_key.setdefault(key, (row_num, padded))
+            else:
+                self.free.append(row_num)
+        self.next_row = len(rows) + 2
+
+    def place(self, cid, fio, dob):
+        """Строка для клиента: (номер, значения, новая ли строка).
+
+        Строка ищется по ID, затем среди строк без ID — по ФИО и дате
+        рождения (такая строка с этого момента привязывается к ID). Новый
+        клиент занимает освободившуюся строку или строку в конце листа.
+        """
+        cid = str(cid)
+        found = self.by_id.get(cid) or self.by_key.pop(_row_key(fio, dob), None)
+        if found:
+            row_num, values = found
+            values, is_new = list(values), False
+        else:
+            row_num = self.free.pop(0) if self.free else self.next_row
+            if row_num == self.next_row:
+                self.next_row += 1
+            values, is_new = [""] * len(self.header), True
+        self.by_id[cid] = (row_num, values)
+        return row_num, values, is_new
+
+    def remove(self, cid):
+        """Освободить строку удалённого клиента; номер строки или None"""
+        found = self.by_id.pop(str(cid), None)
+        if found is None:
+            return None
+        row_num = found[0]
+        self.free.append(row_num)
+        self.free.sort()
+        return row_num
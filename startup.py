@@ -0,0 +1,196 @@
+# Запуск приложения как граф этапов: зависимости, фоновые потоки и журнал времени
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Сколько последних запусков хранить в журнале времени
+KEEP_LAUNCHES = 200
+
+
+class Phase:
+    """Этап запуска.
+
+    func получает словарь результатов уже завершённых этапов и возвращает
+    свой результат. tk=True — этап трогает виджеты и выполняется в потоке
+    Tk; иначе он уходит в фоновый поток и не задерживает интерфейс.
+    """
+    def __init__(self, name, func, deps=(), tk=True):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.tk = tk
+
+
+class StartupPipeline:
+    """Запускает этапы, как только готовы их зависимости.
+
+    Независимые фоновые этапы идут параллельно друг другу и этапам в
+    потоке Tk. Ошибка этапа печатается, а зависящие от него этапы
+    пропускаются. По завершении всех этапов время каждого дописывается
+    в журнал log_path (JSON по строке на запуск) для сравнения запусков.
+    """
+    def __init__(self, root, log_path=None, on_finished=None):
+        self.root = root
+        self.log_path = log_path
+        self.on_finished = on_finished
+        self.phases = {}
+        self.results = {}
+        self.timings = {}
+        # Моменты от начала запуска до заметных пользователю событий, секунды
+        self.milestones = {}
+        self.failed = set()
+        self.started = set()
+        self.finished = set()
+        self.start_time = None
+
+    def add(self, name, func, deps=(), tk=True):
+        for dep in deps:
+            if dep not in self.phases:
+                raise ValueError(f"Этап {name}: неизвестная зависимость {dep}")
+        self.phases[name] = Phase(name, func, deps, tk)
+
+    def mark_done(self, name, seconds, result=None):
+        """Учесть этап, выполненный до запуска конвейера (например, построение окна)"""
+        self.phases[name] = Phase(name, None)
+        self.started.add(name)
+        self.finished.add(name)
+        self.results[name] = result
+        self.timings[name] = {"start": 0.0, "seconds": round(seconds, 4), "thread": "tk"}
+
+    def milestone(self, name, seconds):
+        """Отметить событие запуска (например, первый экран с данными)"""
+        self.milestones.setdefault(name, round(seconds, 4))
+        print(f"⏱️ {name}: {seconds * 1000:.0f} мс")
+
+    def run(self):
+        self.start_time = time.perf_counter()
+        self.schedule()
+
+    def schedule(self):
+        """Запустить все этапы, у которых завершены зависимости"""
+        for phase in list(self.phases.values()):
+            if phase.name in self.started:
+                continue
+            if any(dep in self.failed for dep in phase.deps):
+                self.started.add(phase.name)
+                self.failed.add(phase.name)
+                self.finished.add(phase.name)
+                print(f"⏭️ Этап {phase.name} пропущен: не выполнена зависимость")
+                continue
+            if all(dep in self.finished for dep in phase.deps):
+                self.started.add(phase.name)
+                if phase.tk:
+                    self.root.after(0, self.execute, phase)
+                else:
+                    threading.Thread(target=self.execute, args=(phase, True), daemon=True,
+                                     name=f"startup-{phase.name}").start()
+        if len(self.finished) == len(self.phases):
+            self.finish()
+
+    def execute(self, phase, background=False):
+        started = time.perf_counter()
+        try:
+            result, error = phase.func(self.results), None
+        except Exception as e:
+            result, error = None, e
+        elapsed = time.perf_counter() - started
+        if background:
+            # Итог фонового этапа обрабатывается в потоке Tk
+            try:
+                self.root.after(0, self.complete, phase, started, elapsed, result, error)
+            except RuntimeError:
+                pass  # окно уже закрыто
+        else:
+            self.complete(phase, started, elapsed, result, error)
+
+    def complete(self, phase, started, elapsed, result, error):
+        self.timings[phase.name] = {"start": round(started - self.start_time, 4),
+                                    "seconds": round(elapsed, 4),
+                                    "thread": "tk" if phase.tk else "background"}
+        if error is not None:
+            print(f"❌ Этап запуска {phase.name}: {error}")
+            self.failed.add(phase.name)
+            self.timings[phase.name]["error"] = str(error)
+        else:
+            self.results[phase.name] = result
+        self.finished.add(phase.name)
+        self.schedule()
+
+    def finish(self):
+        if self.start_time is None:
+            return
+        total = time.perf_counter() - self.start_time
+        self.start_time = None
+        print(f"🚀 Запуск завершён за {total * 1000:.0f} мс:")
+        for name, timing in sorted(self.timings.items(), key=lambda item: item[1]["start"]):
+            mark = " ❌" if name in self.failed else ""
+            print(f"   {timing['start'] * 1000:7.0f} +{timing['seconds'] * 1000:6.0f} мс  "
+                  f"{name} ({timing['thread']}){mark}")
+        for name, seconds in self.milestones.items():
+            print(f"   {seconds * 1000:7.0f} мс  {name}")
+        self.save(total)
+        if self.on_finished:
+            self.on_finished(self.results)
+
+    def save(self, total):
+        if not self.log_path:
+            return
+        entry = {"at": datetime.now().isoformat(timespec="seconds"),
+                 "total": round(total, 4), "phases": self.timings,
+                 "milestones": self.milestones}
+        try:
+            lines = []
+            if os.path.exists(self.log_path):
+                with open(self.log_path, "r", encoding="utf-8") as f:
+                    lines = f.read().splitlines()[-(KEEP_LAUNCHES - 1):]
+            lines.append(json.dumps(entry, ensure_ascii=False))
+            with open(self.log_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print(f"Ошибка записи журнала запуска: {e}")
+
+
+def load_history(log_path, last=20):
+    """Последние last запусков из журнала, от старых к новым"""
+    if not os.path.exists(log_path):
+        return []
+    with open(log_path, "r", encoding="utf-8") as f:
+        lines = f.read().splitlines()[-last:]
+    history = []
+    for line in lines:
+        try:
+            history.append(json.loads(line))
+        except ValueError:
+            continue
+    return history
+
+
+def report(log_path, last=20):
+    """Медиана и последнее время по каждому этапу за last запусков"""
+    history = load_history(log_path, last)
+    if not history:
+        print("Журнал запусков пуст")
+        return
+    names = sorted({name for entry in history for name in entry["phases"]})
+    milestones = sorted({name for entry in history for name in entry.get("milestones", {})})
+    print(f"Запусков в отчёте: {len(history)}")
+    print(f"{'этап':24} {'медиана':>10} {'последний':>10}")
+    for name in names + ["всего"] + milestones:
+        if name == "всего":
+            values = [entry["total"] for entry in history]
+        elif name in milestones:
+            values = [entry["milestones"][name] for entry in history
+                      if name in entry.get("milestones", {})]
+        else:
+            values = [entry["phases"][name]["seconds"] for entry in history
+                      if name in entry["phases"]]
+        median = sorted(values)[len(values) // 2]
+        print(f"{name:24} {median * 1000:8.0f} мс {values[-1] * 1000:8.0f} мс")
+
+
+if __name__ == "__main__":
+    import sys
+    app_dir = os.path.join(os.getenv("APPDATA") or os.path.expanduser("~"), "MyApp")
+    report(sys.argv[1] if len(sys.argv) > 1 else os.path.join(app_dir, "startup_times.jsonl"))
@@ -0,0 +1,67 @@
+# Сортировка загруженных строк совпадает с порядком запроса страницы
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import app
+import migrations
+from client_keys import identity_key, sort_key
+
+CLIENTS = [
+    ("Иванов", "Иван", "Петрович", "1950-01-01", "8900", "Д-1", "Б"),
+    ("иванов", "иван", "", "1951-01-01", "8900", "д-1", "а"),
+    ("Ёлкин", "Яков", "", "1952-01-01", None, "Д-2", "Б"),
+    ("Елкин", "яков", "Ильич", "1953-01-01", "", None, "б"),
+    ("Абрамова", "Юлия", "", "1950-01-01", "7", "Д-1", None),
+    ("абрамова", "Юлия", "", "1954-01-01", "7", "Д-10", "Б"),
+    ("Яковлев", "Ёжик", "", "1950-01-01", "8900", "Д-2", "А"),
+]
+
+
+class ClientOrderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "clients.db")
+        with sqlite3.connect(self.db) as conn:
+            migrations.migrate(conn)
+            conn.executemany("""
+                INSERT INTO clients (last_name, first_name, middle_name, dob, phone,
+                                     contract_number, group_name, identity_key, sort_key)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [(last, first, middle, dob, phone, contract, group,
+                   identity_key(last, first, middle, dob), sort_key(last, first, middle))
+                  for last, first, middle, dob, phone, contract, group in CLIENTS])
+        patcher = mock.patch.object(app, "DB_NAME", self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def pages(self, order, limit):
+        rows, cursor = app.fetch_clients_page(limit=limit, order=order)
+        while cursor is not None:
+            more, cursor = app.fetch_clients_page(after=cursor, limit=limit, order=order)
+            rows += more
+        return rows
+
+    def test_local_sort_matches_query(self):
+        columns = ["ID", "Фамилия"] + list(app.ORDERABLE_FIELDS)
+        for column in columns:
+            for descending in (False, True):
+                with self.subTest(column=column, descending=descending):
+                    order = (column, descending)
+                    expected = self.pages(order, limit=100)
+                    self.assertEqual(len(expected), len(CLIENTS))
+                    shuffled = list(expected)
+                    random.Random(column).shuffle(shuffled)
+                    self.assertEqual(app.sorted_client_rows(shuffled, column, descending), expected)
+                    # Постраничная загрузка даёт тот же порядок, что и одна страница
+                    self.assertEqual(self.pages(order, limit=2), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
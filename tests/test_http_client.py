@@ -0,0 +1,49 @@
+# Размыкатель цепи общего HTTP-клиента
+import unittest
+
+import requests
+
+import http_client
+
+
+class FailingSession:
+    def __init__(self, error):
+        self.error = error
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        raise self.error
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def make_client(self, error):
+        client = http_client.HttpClient()
+        client.session = FailingSession(error)
+        breaker = client.breaker("http://chat.local/messages")
+        # Цепь разомкнута давно — следующий запрос пробный
+        breaker.opened_at, breaker.failures = -1e9, http_client.BREAKER_THRESHOLD
+        return client, breaker
+
+    def test_unexpected_error_in_trial_does_not_wedge_breaker(self):
+        client, breaker = self.make_client(requests.exceptions.InvalidHeader("bad header"))
+        with self.assertRaises(requests.exceptions.InvalidHeader):
+            client.get('chat_send', "http://chat.local/messages")
+        self.assertFalse(breaker.trial)
+        # Следующий запрос снова доходит до сети, а не отклоняется навсегда
+        with self.assertRaises(requests.exceptions.InvalidHeader):
+            client.get('chat_send', "http://chat.local/messages")
+        self.assertEqual(client.session.calls, 2)
+
+    def test_network_error_in_trial_reopens(self):
+        client, breaker = self.make_client(requests.exceptions.ConnectionError("down"))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get('chat_send', "http://chat.local/messages")
+        self.assertFalse(breaker.trial)
+        with self.assertRaises(http_client.CircuitOpenError):
+            client.get('chat_send', "http://chat.local/messages")
+        self.assertEqual(client.session.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
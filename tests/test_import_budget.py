@@ -0,0 +1,53 @@
+# Импорт app: отложенные библиотеки не загружаются, время укладывается в бюджет
+import os
+import subprocess
+import sys
+import unittest
+
+import import_report
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Модули, которые app загружает только при первом использовании
+DEFERRED_MODULES = ("requests", "http_client", "updater", "docx", "tkcalendar",
+                    "gspread", "google.oauth2")
+
+# Отдельный интерпретатор: в этом процессе их могли загрузить другие тесты.
+# Перехватчик поиска модулей записывает саму попытку импорта, поэтому
+# проверка работает и там, где библиотека не установлена
+SPY_IMPORTS = """
+import sys
+deferred = {deferred!r}
+attempted = set()
+
+class Spy:
+    def find_spec(self, name, path=None, target=None):
+        for module in deferred:
+            if name == module or name.startswith(module + "."):
+                attempted.add(module)
+        return None
+
+sys.meta_path.insert(0, Spy())
+import app
+attempted.update(m for m in deferred if m in sys.modules)
+print("deferred imported:", ",".join(sorted(attempted)))
+"""
+
+
+class ImportTest(unittest.TestCase):
+    def test_deferred_modules_not_imported_by_app(self):
+        code = SPY_IMPORTS.format(deferred=DEFERRED_MODULES)
+        result = subprocess.run([sys.executable, "-c", code], cwd=HERE,
+                                capture_output=True, text=True, encoding="utf-8")
+        self.assertEqual(result.returncode, 0, result.stderr)
+        report = [line for line in result.stdout.splitlines()
+                  if line.startswith("deferred imported:")]
+        self.assertEqual(report, ["deferred imported: "])
+
+    def test_import_within_budget(self):
+        total, budget = import_report.check_budget("app")
+        self.assertLessEqual(total, budget,
+                             f"импорт app {total * 1000:.0f} мс, бюджет {budget * 1000:.0f} мс")
+
+
+if __name__ == "__main__":
+    unittest.main()
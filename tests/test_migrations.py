@@ -0,0 +1,118 @@
+# Миграции схемы: подготовка вне блокировки и откат неудавшегося шага
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import app
+import migrations
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Процесс падает посреди транзакции; маленький кэш заставляет SQLite
+# записать страницы в файл базы, оставив горячий журнал для отката
+CRASH_IN_TRANSACTION = """
+import os, sqlite3, sys
+conn = sqlite3.connect(sys.argv[1], isolation_level=None)
+conn.execute("PRAGMA cache_size=1")
+conn.execute("BEGIN IMMEDIATE")
+conn.execute("CREATE TABLE half_done (x)")
+conn.executemany("INSERT INTO half_done VALUES (?)", [("x" * 500,)] * 2000)
+os._exit(1)
+"""
+
+
+class MigrateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "clients.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_password_hashes_prepared_outside_transaction(self):
+        seen = []
+        original = migrations.hash_default_users
+
+        def hash_default_users(conn):
+            seen.append(conn.in_transaction)
+            return original(conn)
+
+        steps = [(v, n, f, hash_default_users if p else None)
+                 for v, n, f, p in migrations.MIGRATIONS]
+        with mock.patch.object(migrations, "MIGRATIONS", steps):
+            with sqlite3.connect(self.db) as conn:
+                migrations.migrate(conn)
+                users = conn.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+        self.assertEqual(seen, [False])
+        self.assertEqual(users, len(migrations.DEFAULT_USERS))
+
+    def test_warm_start_is_one_pragma_read(self):
+        with sqlite3.connect(self.db) as conn:
+            migrations.migrate(conn)
+            tables = {row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table'")}
+            statements = []
+            conn.set_trace_callback(statements.append)
+            migrations.migrate(conn)
+        self.assertLessEqual({"chat_archives", "chat_outbox", "chat_notification_ledger",
+                              "sheet_sync_state", "client_merges"}, tables)
+        self.assertEqual(statements, ["PRAGMA user_version"])
+
+    def test_failed_step_rolls_back_and_keeps_data(self):
+        with sqlite3.connect(self.db) as conn:
+            migrations.migrate(conn)
+            conn.execute("INSERT INTO clients (last_name, first_name, dob) "
+                         "VALUES ('Иванов', 'Иван', '1950-01-01')")
+        version = migrations.MIGRATIONS[-1][0]
+
+        def broken(cur):
+            cur.execute("CREATE TABLE half_done (id INTEGER)")
+            raise sqlite3.OperationalError("disk I/O error")
+
+        steps = migrations.MIGRATIONS + [(version + 1, "Сломанный шаг", broken, None)]
+        with mock.patch.object(migrations, "MIGRATIONS", steps):
+            with sqlite3.connect(self.db) as conn:
+                with self.assertRaises(migrations.MigrationError):
+                    migrations.migrate(conn)
+                self.assertEqual(conn.execute("PRAGMA user_version").fetchone()[0], version)
+                self.assertIsNone(conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone())
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0], 1)
+
+    def test_identity_keys_match_across_dob_formats(self):
+        with sqlite3.connect(self.db) as conn:
+            migrations.migrate(conn)
+            conn.executemany("INSERT INTO clients (last_name, first_name, dob) VALUES (?, ?, ?)",
+                             [("Иванов", "Иван", "1950-02-01"), ("ИВАНОВ", "Иван", "01.02.1950")])
+            migrations.backfill_identity_keys(conn.cursor())
+            keys = [row[0] for row in conn.execute(
+                "SELECT identity_key FROM clients ORDER BY id")]
+            pending = conn.execute(
+                "SELECT COUNT(*) FROM clients WHERE identity_key IS NULL").fetchone()[0]
+        self.assertEqual(keys, ["иванов|иван||1950-02-01", "#2"])
+        self.assertEqual(pending, 0)
+
+    def test_init_db_rolls_back_hot_journal(self):
+        with sqlite3.connect(self.db) as conn:
+            migrations.migrate(conn)
+            conn.execute("INSERT INTO clients (last_name, first_name, dob) "
+                         "VALUES ('Иванов', 'Иван', '1950-01-01')")
+        subprocess.run([sys.executable, "-c", CRASH_IN_TRANSACTION, self.db], cwd=HERE)
+        self.assertTrue(os.path.exists(self.db + "-journal"))
+
+        with mock.patch.object(app, "DB_NAME", self.db):
+            self.assertTrue(app.init_db())
+        with sqlite3.connect(self.db) as conn:
+            self.assertIsNone(conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'half_done'").fetchone())
+            self.assertEqual(conn.execute("PRAGMA integrity_check").fetchone()[0], "ok")
+            # База откатилась, а не пересоздана аварийным восстановлением
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM clients").fetchone()[0], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# Выгрузка клиентов в Google Sheets на FakeWorksheet, без сети
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import migrations
+from client_keys import identity_key, sort_key
+from sheets_sync import SHEET_COLUMNS, FakeWorksheet, RateLimitError, SheetPusher
+
+
+class SheetPusherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "clients.db")
+        with sqlite3.connect(self.db) as conn:
+            migrations.migrate(conn)
+        self.clock = 0
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def stamp(self):
+        self.clock += 1
+        return f"2026-01-01T00:00:{self.clock:02d}"
+
+    def add(self, last, first, dob="1950-01-01"):
+        with sqlite3.connect(self.db) as conn:
+            cur = conn.execute("""
+                INSERT INTO clients (last_name, first_name, middle_name, dob, phone,
+                                     updated_at, identity_key, sort_key)
+                VALUES (?, ?, '', ?, '', ?, ?, ?)
+            """, (last, first, dob, self.stamp(), identity_key(last, first, "", dob),
+                  sort_key(last, first, "")))
+            return cur.lastrowid
+
+    def rename(self, cid, last):
+        with sqlite3.connect(self.db) as conn:
+            conn.execute("UPDATE clients SET last_name = ?, updated_at = ? WHERE id = ?",
+                         (last, self.stamp(), cid))
+
+    def delete(self, cid):
+        with sqlite3.connect(self.db) as conn:
+            conn.execute("DELETE FROM clients WHERE id = ?", (cid,))
+
+    def pusher(self, sheet, **kwargs):
+        kwargs.setdefault("min_interval", 0)
+        return SheetPusher(self.db, sheet, "test/Лист1", sleep=lambda s: None, **kwargs)
+
+    @staticmethod
+    def body(sheet):
+        """Непустые строки листа как {ID: ФИО}"""
+        header = sheet.rows[0]
+        id_col, fio_col = header.index("ID"), header.index("ФИО")
+        return {row[id_col]: row[fio_col] for row in sheet.rows[1:] if row and row[id_col]}
+
+    def test_insert(self):
+        first = self.add("Иванов", "Иван")
+        second = self.add("Петров", "Пётр")
+        sheet = FakeWorksheet()
+
+        self.assertEqual(self.pusher(sheet).push(), (0, 2, 0))
+        self.assertEqual(self.body(sheet), {str(first): "Иванов Иван", str(second): "Петров Пётр"})
+        # Повторная выгрузка без изменений ничего не пишет
+        calls = sheet.batch_calls
+        self.assertEqual(self.pusher(sheet).push(), (0, 0, 0))
+        self.assertEqual(sheet.batch_calls, calls)
+
+    def test_update_after_rename(self):
+        cid = self.add("Иванов", "Иван")
+        sheet = FakeWorksheet()
+        self.pusher(sheet).push()
+
+        self.rename(cid, "Сидоров")
+        self.assertEqual(self.pusher(sheet).push(), (1, 0, 0))
+        self.assertEqual(self.body(sheet), {str(cid): "Сидоров Иван"})
+        self.assertEqual(len(sheet.rows), 2)
+
+    def test_legacy_row_without_id_is_adopted(self):
+        cid = self.add("Иванов", "Иван")
+        legacy = [""] * len(SHEET_COLUMNS)
+        legacy[SHEET_COLUMNS.index("ФИО")] = "ИВАНОВ иван"
+        legacy[SHEET_COLUMNS.index("Дата рождения")] = "1950-01-01"
+        sheet = FakeWorksheet([SHEET_COLUMNS, legacy])
+
+        self.assertEqual(self.pusher(sheet).push(), (1, 0, 0))
+        self.assertEqual(self.body(sheet), {str(cid): "Иванов Иван"})
+
+    def test_deleted_client_row_is_cleared_and_reused(self):
+        kept = self.add("Иванов", "Иван")
+        dropped = self.add("Петров", "Пётр")
+        sheet = FakeWorksheet()
+        self.pusher(sheet).push()
+
+        self.delete(dropped)
+        self.assertEqual(self.pusher(sheet).push(), (0, 0, 1))
+        self.assertEqual(self.body(sheet), {str(kept): "Иванов Иван"})
+
+        newcomer = self.add("Орлов", "Олег")
+        self.pusher(sheet).push()
+        self.assertEqual(self.body(sheet), {str(kept): "Иванов Иван", str(newcomer): "Орлов Олег"})
+        self.assertEqual(len(sheet.rows), 3)
+
+    def test_batch_cursor_resume(self):
+        ids = [self.add(f"Клиент{i:02d}", "Тест") for i in range(10)]
+        # Третий запрос (второй пакет) упирается в лимит, повторов нет
+        sheet = FakeWorksheet(fail_every=3)
+        with self.assertRaises(RateLimitError):
+            self.pusher(sheet, batch_size=3, max_retries=0).push()
+        self.assertEqual(len(self.body(sheet)), 3)
+
+        sheet.fail_every = 0
+        self.assertEqual(self.pusher(sheet, batch_size=3).push(), (0, 7, 0))
+        self.assertEqual(sorted(self.body(sheet)), sorted(str(cid) for cid in ids))
+        self.assertEqual(len(sheet.rows), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
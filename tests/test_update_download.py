@@ -0,0 +1,140 @@
+# Загрузка обновления через локальный UpdateServer: докачка, If-Range, проверка и прогресс
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+import update_download
+from update_download import Downloader, DownloadError, IntegrityError
+from update_server import UpdateServer
+
+SIZE = 512 * 1024
+
+
+class UpdateDownloadTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "served.exe")
+        self.target = os.path.join(self.tmp.name, "app.exe")
+        self.data = self.write_source()
+        # Докачка после обрыва без паузы
+        patcher = mock.patch.object(update_download, "RESUME_DELAY", 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def write_source(self):
+        data = os.urandom(SIZE)
+        with open(self.source, "wb") as f:
+            f.write(data)
+        return data
+
+    def serve(self, **kwargs):
+        server = UpdateServer(("127.0.0.1", 0), self.source, **kwargs)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server
+
+    def downloader(self, server, sha256=None, **kwargs):
+        return Downloader(server.base_url() + "/app.exe", self.target,
+                          sha256 or server.sha256, **kwargs)
+
+    def read_target(self):
+        with open(self.target, "rb") as f:
+            return f.read()
+
+    def ranges(self, server):
+        return [header for path, header in server.requests if path == "/app.exe"]
+
+    def test_clean_download(self):
+        server = self.serve()
+        path = self.downloader(server, size=SIZE).run()
+        self.assertEqual(path, self.target)
+        self.assertEqual(hashlib.sha256(self.read_target()).hexdigest(), server.sha256)
+        self.assertFalse(os.path.exists(self.target + ".part"))
+        self.assertEqual(self.ranges(server), [None])
+
+    def test_resume_after_drop(self):
+        server = self.serve(drop_after=100 * 1024)
+        downloader = self.downloader(server, size=SIZE)
+        downloader.run()
+        self.assertEqual(self.read_target(), self.data)
+        self.assertEqual(downloader.resumes, 1)
+        sent = self.ranges(server)
+        self.assertEqual(len(sent), 2)
+        self.assertIsNone(sent[0])
+        self.assertTrue(sent[1].startswith("bytes="))
+        self.assertGreater(int(sent[1][len("bytes="):-1]), 0)
+
+    def test_swapped_file_restarts_by_if_range(self):
+        server = self.serve(drop_after=100 * 1024)
+        old_etag = server.etag
+        new_data = os.urandom(SIZE)
+        new_sha256 = hashlib.sha256(new_data).hexdigest()
+        # Первая попытка обрывается и не докачивается: остаётся часть старого файла
+        with mock.patch.object(update_download, "MAX_RESUMES", 0):
+            with self.assertRaises(DownloadError):
+                self.downloader(server, sha256=new_sha256).run()
+        self.assertGreater(os.path.getsize(self.target), 0)
+
+        with open(self.source, "wb") as f:
+            f.write(new_data)
+        server.reload()
+        seen = []
+        real_get = update_download.http_client.get
+
+        def get(name, url, **kwargs):
+            seen.append(dict(kwargs.get("headers") or {}))
+            return real_get(name, url, **kwargs)
+
+        with mock.patch.object(update_download.http_client, "get", get):
+            self.downloader(server, sha256=new_sha256).run()
+        self.assertEqual(seen[0].get("If-Range"), old_etag)
+        self.assertIn("Range", seen[0])
+        self.assertEqual(self.read_target(), new_data)
+
+    def test_server_without_ranges_restarts(self):
+        server = self.serve(drop_after=100 * 1024, ranges=False)
+        downloader = self.downloader(server, size=SIZE)
+        downloader.run()
+        self.assertEqual(self.read_target(), self.data)
+        self.assertEqual(downloader.resumes, 1)
+        # Range был отправлен, но сервер ответил 200 — файл скачан заново
+        self.assertIsNotNone(self.ranges(server)[1])
+
+    def test_hash_mismatch_discards_file(self):
+        server = self.serve()
+        with self.assertRaises(IntegrityError):
+            self.downloader(server, sha256="0" * 64).run()
+        self.assertFalse(os.path.exists(self.target))
+        self.assertFalse(os.path.exists(self.target + ".part"))
+
+    def test_progress_is_throttled(self):
+        server = self.serve(rate=1024 * 1024)
+        calls = []
+        started = time.perf_counter()
+        self.downloader(server, on_progress=lambda *args: calls.append(args)).run()
+        elapsed = time.perf_counter() - started
+        self.assertGreater(elapsed, 0.3)
+        limit = elapsed / update_download.PROGRESS_INTERVAL + 2  # плюс первый и итоговый
+        self.assertLessEqual(len(calls), limit)
+        self.assertGreaterEqual(len(calls), 2)
+        self.assertEqual(calls[-1][:2], (SIZE, SIZE))
+
+    def test_cancel(self):
+        server = self.serve(rate=256 * 1024)
+        cancel = threading.Event()
+        downloader = self.downloader(server, cancel_event=cancel,
+                                     on_progress=lambda *args: cancel.set())
+        with self.assertRaisesRegex(DownloadError, "отменена"):
+            downloader.run()
+        self.assertLess(os.path.getsize(self.target), SIZE)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,316 @@
+# Загрузка обновления: докачка по Range, проверка SHA-256 по манифесту, редкий прогресс
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+
+import http_client
+
+# Границы размера куска чтения; размер подстраивается под скорость сети
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# Сколько должно длиться чтение одного куска: быстрее — кусок растёт, медленнее — уменьшается
+CHUNK_TARGET = 0.1
+# Интервал событий прогресса, секунды (около 10 в секунду)
+PROGRESS_INTERVAL = 0.1
+# Сколько раз докачивать после обрыва связи посреди загрузки
+MAX_RESUMES = 5
+RESUME_DELAY = 2
+HASH_BLOCK = 1024 * 1024
+
+CONTENT_RANGE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+class DownloadError(Exception):
+    pass
+
+
+class IntegrityError(DownloadError):
+    """Скачанный файл не совпал с манифестом"""
+    pass
+
+
+def parse_manifest(data):
+    """Проверить манифест обновления: version, url, sha256 и (необязательно) size"""
+    try:
+        manifest = {
+            "version": str(data["version"]).strip(),
+            "url": str(data["url"]),
+            "sha256": str(data["sha256"]).strip().lower(),
+            "size": int(data["size"]) if data.get("size") is not None else None,
+        }
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise DownloadError(f"Неверный манифест обновления: {e}")
+    if not re.fullmatch(r"[0-9a-f]{64}", manifest["sha256"]):
+        raise DownloadError("Неверный манифест обновления: sha256")
+    return manifest
+
+
+def fetch_manifest(url):
+    resp = http_client.get('update_check', url)
+    if resp.status_code != 200:
+        raise DownloadError(f"Манифест обновления недоступен: HTTP {resp.status_code}")
+    try:
+        return parse_manifest(resp.json())
+    except ValueError as e:
+        raise DownloadError(f"Неверный манифест обновления: {e}")
+
+
+class Downloader:
+    """Загрузка одного файла с докачкой и проверкой.
+
+    Недокачанные байты остаются в path; следующий запуск (или повтор после
+    обрыва) продолжает с конца файла запросом Range, а хеш продолжает
+    считаться по уже скачанной части. Валидатор ответа (ETag или
+    Last-Modified) хранится рядом в path + ".part" и отправляется в If-Range:
+    если файл на сервере сменился, сервер отдаст его целиком заново; без
+    валидатора подмену поймает проверка SHA-256.
+    on_progress(скачано, всего, байт в секунду) вызывается из потока загрузки
+    не чаще раза в PROGRESS_INTERVAL секунд и один раз в конце.
+    """
+    def __init__(self, url, path, sha256, size=None, on_progress=None,
+                 progress_interval=PROGRESS_INTERVAL, cancel_event=None):
+        self.url = url
+        self.path = path
+        self.sha256 = sha256.lower()
+        self.size = size
+        self.on_progress = on_progress
+        self.progress_interval = progress_interval
+        self.cancel_event = cancel_event
+        self.meta_path = path + ".part"
+        self.chunk = MIN_CHUNK
+        self.downloaded = 0
+        self.total = size
+        self.hasher = None
+        self.last_progress = 0.0
+        self.speed = 0.0
+        # Для отчёта: сколько байт взято из прошлой попытки и сколько было докачек
+        self.resumed_from = 0
+        self.resumes = 0
+
+    # --- Частично скачанный файл ---
+
+    def load_meta(self):
+        """Сведения о частичной загрузке, если она того же файла; иначе None"""
+        try:
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(meta, dict) or meta.get("url") != self.url or meta.get("sha256") != self.sha256:
+            return None
+        return meta
+
+    def save_validator(self, validator):
+        try:
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"url": self.url, "sha256": self.sha256, "validator": validator}, f)
+        except OSError as e:
+            print(f"Ошибка сохранения сведений о загрузке: {e}")
+
+    def restart(self):
+        """Начать с нуля: пустой файл и новый хеш"""
+        with open(self.path, "wb"):
+            pass
+        self.downloaded = 0
+        self.hasher = hashlib.sha256()
+
+    def prepare(self):
+        """Хеш уже скачанной части; возвращает смещение для докачки"""
+        self.hasher = hashlib.sha256()
+        self.downloaded = 0
+        # Без сведений о загрузке неизвестно, тот ли это файл — начинаем с нуля
+        if not os.path.exists(self.path) or self.load_meta() is None:
+            self.restart()
+            return 0
+        if self.size is not None and os.path.getsize(self.path) > self.size:
+            self.restart()
+            return 0
+        with open(self.path, "rb") as f:
+            while True:
+                block = f.read(HASH_BLOCK)
+                if not block:
+                    break
+                self.hasher.update(block)
+                self.downloaded += len(block)
+        self.resumed_from = self.downloaded
+        return self.downloaded
+
+    # --- Сеть ---
+
+    def request(self):
+        """Запрос с текущего смещения; ответ, из которого можно читать, или None,
+        если файл уже скачан полностью"""
+        headers = {"Accept-Encoding": "identity"}
+        if self.downloaded:
+            headers["Range"] = f"bytes={self.downloaded}-"
+            validator = (self.load_meta() or {}).get("validator")
+            if validator:
+                headers["If-Range"] = validator
+        resp = http_client.get('update_download', self.url, stream=True, headers=headers)
+
+        if resp.status_code == 416 and self.downloaded:
+            resp.close()
+            if self.size is None or self.downloaded == self.size:
+                return None  # всё скачано в прошлый раз
+            self.restart()
+            return self.request()
+
+        if resp.status_code == 206:
+            match = CONTENT_RANGE.fullmatch(resp.headers.get("Content-Range", ""))
+            if not match or int(match.group(1)) != self.downloaded:
+                resp.close()
+                raise DownloadError("Сервер вернул не тот диапазон")
+            if match.group(3) != "*":
+                self.total = int(match.group(3))
+        elif resp.status_code == 200:
+            if self.downloaded:
+                print("⚠️ Сервер не продолжил загрузку, начинаем заново")
+                self.restart()
+            length = resp.headers.get("Content-Length")
+            if length is not None:
+                self.total = int(length)
+        else:
+            resp.close()
+            raise DownloadError(f"HTTP {resp.status_code}")
+
+        if self.size is not None and self.total is not None and self.total != self.size:
+            resp.close()
+            raise IntegrityError(f"Размер файла на сервере {self.total} байт, "
+                                 f"в манифесте {self.size}")
+        validator = resp.headers.get("ETag") or resp.headers.get("Last-Modified")
+        if validator and validator.startswith("W/"):
+            validator = None  # слабый ETag не годится для If-Range
+        self.save_validator(validator)
+        return resp
+
+    def read(self, resp, f):
+        """Читать ответ в файл, подстраивая размер куска под скорость"""
+        started = time.perf_counter()
+        session_bytes = 0
+        while True:
+            if self.cancel_event is not None and self.cancel_event.is_set():
+                raise DownloadError("Загрузка отменена")
+            read_started = time.perf_counter()
+            block = resp.raw.read(self.chunk)
+            if not block:
+                break
+            f.write(block)
+            self.hasher.update(block)
+            self.downloaded += len(block)
+            session_bytes += len(block)
+
+            elapsed = time.perf_counter() - read_started
+            if elapsed < CHUNK_TARGET / 2 and len(block) == self.chunk:
+                self.chunk = min(self.chunk * 2, MAX_CHUNK)
+            elif elapsed > CHUNK_TARGET * 2:
+                self.chunk = max(self.chunk // 2, MIN_CHUNK)
+
+            total_elapsed = time.perf_counter() - started
+            if total_elapsed > 0:
+                self.speed = session_bytes / total_elapsed
+            self.progress()
+        if self.total is not None and self.downloaded < self.total:
+            raise ConnectionError(f"соединение закрыто на {self.downloaded} из {self.total} байт")
+
+    def progress(self, final=False):
+        if self.on_progress is None:
+            return
+        now = time.perf_counter()
+        if final or now - self.last_progress >= self.progress_interval:
+            self.last_progress = now
+            self.on_progress(self.downloaded, self.total, self.speed)
+
+    # --- Загрузка целиком ---
+
+    def run(self):
+        """Скачать и проверить файл; вернуть путь. Ошибки — DownloadError"""
+        self.prepare()
+        while True:
+            try:
+                resp = self.request()
+                if resp is not None:
+                    try:
+                        with open(self.path, "ab") as f:
+                            self.read(resp, f)
+                            f.flush()
+                            os.fsync(f.fileno())
+                    finally:
+                        resp.close()
+                break
+            except (http_client.RequestException, http_client.StreamError, OSError) as e:
+                if self.resumes >= MAX_RESUMES:
+                    raise DownloadError(f"Загрузка прервана: {e}")
+                self.resumes += 1
+                print(f"⚠️ Обрыв загрузки ({e}), докачка {self.resumes}/{MAX_RESUMES} "
+                      f"с {self.downloaded} байт")
+                time.sleep(RESUME_DELAY)
+        self.progress(final=True)
+        self.verify()
+        return self.path
+
+    def verify(self):
+        digest = self.hasher.hexdigest()
+        if digest == self.sha256:
+            try:
+                os.remove(self.meta_path)
+            except OSError:
+                pass
+            return
+        # Испорченный файл не годится и для следующей докачки
+        resumed = self.resumed_from
+        self.discard()
+        if resumed:
+            raise IntegrityError("Контрольная сумма не совпала после докачки; "
+                                 "файл будет скачан заново")
+        raise IntegrityError(f"Контрольная сумма не совпала: {digest}, ожидалась {self.sha256}")
+
+    def discard(self):
+        for path in (self.path, self.meta_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def download(url, path, sha256, size=None, on_progress=None, cancel_event=None):
+    """Скачать с докачкой; если докачанный файл не сошёлся — один раз заново с нуля"""
+    downloader = Downloader(url, path, sha256, size, on_progress, cancel_event=cancel_event)
+    try:
+        return downloader.run()
+    except IntegrityError:
+        if not downloader.resumed_from:
+            raise
+    print("⚠️ Докачанный файл повреждён, загрузка с начала")
+    return Downloader(url, path, sha256, size, on_progress, cancel_event=cancel_event).run()
+
+
+def write_manifest(path, version, url, output):
+    """Манифест для опубликованного файла (запускается при сборке)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            digest.update(block)
+    manifest = {"version": version, "url": url, "sha256": digest.hexdigest(),
+                "size": os.path.getsize(path)}
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Манифест обновления для собранного exe")
+    parser.add_argument("file", help="опубликованный файл, например dist/app.exe")
+    parser.add_argument("--version", required=True)
+    parser.add_argument("--url", required=True, help="адрес, с которого клиенты скачают файл")
+    parser.add_argument("--output", default="update_manifest.json")
+    args = parser.parse_args()
+    manifest = write_manifest(args.file, args.version.strip(), args.url, args.output)
+    print(f"{args.output}: версия {manifest['version']}, {manifest['size']} байт, "
+          f"sha256 {manifest['sha256']}")
+
+
+if __name__ == "__main__":
+    main()
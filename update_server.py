@@ -0,0 +1,170 @@
+# Локальный сервер обновлений для проверки загрузки: Range, манифест, обрывы и медленная сеть
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SEND_BLOCK = 64 * 1024
+
+
+class UpdateServer(ThreadingHTTPServer):
+    """Раздаёт один файл как app.exe, его манифест и version.txt.
+
+    Поддерживает Range и If-Range по ETag (хеш файла). Для проверки
+    докачки умеет обрывать соединение после drop_after байт тела (первые
+    drops ответов) и ограничивать скорость rate байт в секунду.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, path, version="9.9.9", rate=None, drop_after=None, drops=1,
+                 ranges=True):
+        super().__init__(address, UpdateHandler)
+        self.file_path = path
+        self.version = version
+        self.rate = rate
+        self.drop_after = drop_after
+        self.drops_left = drops
+        self.ranges = ranges
+        self.lock = threading.Lock()
+        self.requests = []
+        self.reload()
+
+    def reload(self):
+        """Перечитать файл (например, после подмены в тесте)"""
+        with open(self.file_path, "rb") as f:
+            self.data = f.read()
+        self.sha256 = hashlib.sha256(self.data).hexdigest()
+        self.etag = f'"{self.sha256[:16]}"'
+
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def manifest(self):
+        return {"version": self.version, "url": self.base_url() + "/app.exe",
+                "sha256": self.sha256, "size": len(self.data)}
+
+    def take_drop(self):
+        """Нужно ли оборвать этот ответ"""
+        with self.lock:
+            if self.drop_after is None or self.drops_left <= 0:
+                return None
+            self.drops_left -= 1
+            return self.drop_after
+
+
+class UpdateHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get("Range")))
+        if self.path == "/version.txt":
+            self.send_body(200, server.version.encode("utf-8"), "text/plain; charset=utf-8")
+        elif self.path == "/update_manifest.json":
+            body = json.dumps(server.manifest()).encode("utf-8")
+            self.send_body(200, body, "application/json")
+        elif self.path == "/app.exe":
+            self.send_file()
+        else:
+            self.send_body(404, b"not found", "text/plain")
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_file(self):
+        server = self.server
+        data = server.data
+        start, status = 0, 200
+        range_header = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if server.ranges and range_header and (if_range is None or if_range == server.etag):
+            try:
+                start = int(range_header.split("=", 1)[1].split("-", 1)[0])
+            except (IndexError, ValueError):
+                start = 0
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            status = 206
+
+        body = data[start:]
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", server.etag)
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.end_headers()
+
+        drop_after = server.take_drop()
+        sent = 0
+        started = time.perf_counter()
+        while sent < len(body):
+            block = body[sent:sent + SEND_BLOCK]
+            if drop_after is not None and sent + len(block) > drop_after:
+                self.wfile.write(block[:drop_after - sent])
+                self.wfile.flush()
+                self.close_connection = True
+                self.connection.close()
+                return
+            self.wfile.write(block)
+            sent += len(block)
+            if server.rate:
+                # Ограничение скорости: ждём, пока отправленное не уложится в rate
+                delay = sent / server.rate - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+
+def make_test_file(path, size):
+    with open(path, "wb") as f:
+        f.write(os.urandom(size))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Локальный сервер обновлений для проверки загрузки")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--file", help="раздаваемый файл (по умолчанию — случайный)")
+    parser.add_argument("--size", type=int, default=32 * 1024 * 1024,
+                        help="размер случайного файла, байт")
+    parser.add_argument("--version", default="9.9.9")
+    parser.add_argument("--rate", type=int, default=None, help="скорость, байт в секунду")
+    parser.add_argument("--drop-after", type=int, default=None,
+                        help="оборвать ответ после стольких байт тела")
+    parser.add_argument("--drops", type=int, default=1, help="сколько ответов обрывать")
+    parser.add_argument("--no-range", action="store_true", help="не поддерживать Range")
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        path = os.path.abspath("update_test.bin")
+        make_test_file(path, args.size)
+    server = UpdateServer((args.host, args.port), path, args.version, args.rate,
+                          args.drop_after, args.drops, not args.no_range)
+    print(f"Сервер обновлений: {server.base_url()}/update_manifest.json")
+    print(f"Файл {path}: {len(server.data)} байт, sha256 {server.sha256}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,76 +1,79 @@
-import requests
 import os
 import sys
 import subprocess
-import time
 import threading
 import tkinter as tk
 from tkinter import messagebox, ttk
 
+import update_download
+
 APP_VERSION = "2.0.0"  # <<< измени на номер своей текущей версии
-VERSION_URL = "https://raw.githubusercontent.com/amberbeksky/ODP2/main/version.txt"
-APP_URL = "https://github.com/amberbeksky/ODP2/releases/latest/download/app.exe"
+# Манифест последней версии: version, url, sha256 и size файла. Сборка по тегу v*
+# публикует его в релиз рядом с app.exe, поэтому манифест и файл всегда из одного релиза
+MANIFEST_URL = "https://github.com/amberbeksky/ODP2/releases/latest/download/update_manifest.json"
 APP_PATH = sys.argv[0]  # путь к текущему exe
 
 
+def version_tuple(version):
+    return tuple(int(part) if part.isdigit() else 0 for part in version.split("."))
+
+
 def check_for_update():
+    """Манифест новой версии или None"""
     try:
-        resp = requests.get(VERSION_URL, timeout=5)
-        latest_version = resp.text.strip()
-        if latest_version > APP_VERSION:
-            return latest_version
+        manifest = update_download.fetch_manifest(MANIFEST_URL)
+        if version_tuple(manifest["version"]) > version_tuple(APP_VERSION):
+            return manifest
     except Exception as e:
         print("Ошибка проверки обновления:", e)
     return None
 
 
-def threaded_download(url, filepath, win, progress, percent_label, speed_label, eta_label):
-    try:
-        resp = requests.get(url, stream=True, timeout=30)
-        total = int(resp.headers.get("content-length", 0))
-
-        progress["maximum"] = total
-        downloaded = 0
-        start_time = time.time()
-
-        with open(filepath, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
-                    downloaded += len(chunk)
-
-                    def update_labels(d=downloaded, t=total, st=start_time):
-                        progress["value"] = d
-                        percent = (d / t) * 100 if t > 0 else 0
-                        percent_label.config(text=f"{percent:.1f}%")
-
-                        elapsed = time.time() - st
-                        speed = d / 1024 / elapsed if elapsed > 0 else 0
-                        speed_label.config(text=f"Скорость: {speed:.1f} КБ/с")
-
-                        if speed > 0:
-                            remaining_kb = (t - d) / 1024
-                            eta_sec = remaining_kb / speed
-                            mins, secs = divmod(int(eta_sec), 60)
-                            eta_label.config(text=f"Оставшееся время: {mins:02d}:{secs:02d}")
-                        else:
-                            eta_label.config(text="Оставшееся время: --:--")
-
-                    win.after(0, update_labels)
+def threaded_download(manifest, filepath, win, state, progress, percent_label, speed_label, eta_label):
+    def update_labels(done, total, speed):
+        if not win.winfo_exists():
+            return
+        progress["maximum"] = total or 1
+        progress["value"] = done
+        percent = (done / total) * 100 if total else 0
+        percent_label.config(text=f"{percent:.1f}%")
+        speed_label.config(text=f"Скорость: {speed / 1024:.1f} КБ/с")
+
+        if speed > 0 and total:
+            mins, secs = divmod(int((total - done) / speed), 60)
+            eta_label.config(text=f"Оставшееся время: {mins:02d}:{secs:02d}")
+        else:
+            eta_label.config(text="Оставшееся время: --:--")
+
+    def on_progress(done, total, speed):
+        # Загрузчик вызывает это не чаще 10 раз в секунду — очередь Tk не переполняется
+        try:
+            win.after(0, update_labels, done, total, speed)
+        except RuntimeError:
+            pass  # окно уже закрыто
 
+    try:
+        update_download.download(manifest["url"], filepath, manifest["sha256"], manifest["size"],
+                                 on_progress, cancel_event=state["cancel"])
+        state["ok"] = True
         win.after(0, win.destroy)
-
     except Exception as e:
-        win.after(0, lambda: messagebox.showerror("Ошибка", f"Не удалось скачать обновление: {e}"))
+        if state["cancel"].is_set():
+            return
+        def show_error(error=e):
+            messagebox.showerror("Ошибка", f"Не удалось скачать обновление: {error}", parent=win)
+            win.destroy()
+        win.after(0, show_error)
 
 
-def download_with_progress(url, filepath):
+def download_with_progress(manifest, filepath):
+    """Окно загрузки; True, если файл скачан и совпал с манифестом"""
     win = tk.Toplevel()
     win.title("Обновление программы")
     win.geometry("420x180")
     win.resizable(False, False)
 
-    tk.Label(win, text="Загружается новая версия...").pack(pady=10)
+    tk.Label(win, text=f"Загружается версия {manifest['version']}...").pack(pady=10)
 
     progress = ttk.Progressbar(win, length=380, mode="determinate")
     progress.pack(pady=5)
@@ -84,21 +87,32 @@ def download_with_progress(url, filepath):
     eta_label = tk.Label(win, text="Оставшееся время: --:--")
     eta_label.pack()
 
+    state = {"ok": False, "cancel": threading.Event()}
+
+    def cancel():
+        # Скачанная часть остаётся — следующая попытка продолжит с того же места
+        state["cancel"].set()
+        win.destroy()
+
+    win.protocol("WM_DELETE_WINDOW", cancel)
+
     thread = threading.Thread(
         target=threaded_download,
-        args=(url, filepath, win, progress, percent_label, speed_label, eta_label),
+        args=(manifest, filepath, win, state, progress, percent_label, speed_label, eta_label),
         daemon=True
     )
     thread.start()
 
     win.grab_set()
     win.wait_window()
+    return state["ok"]
 
 
-def download_and_replace():
+def download_and_replace(manifest):
     try:
         new_path = APP_PATH + ".new"
-        download_with_progress(APP_URL, new_path)
+        if not download_with_progress(manifest, new_path):
+            return
 
         backup = APP_PATH + ".old"
         if os.path.exists(backup):
@@ -114,6 +128,6 @@ def download_and_replace():
 
 
 def auto_update():
-    new_ver = check_for_update()
-    if new_ver:
-        download_and_replace()
+    manifest = check_for_update()
+    if manifest:
+        download_and_replace(manifest)
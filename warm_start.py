@@ -0,0 +1,69 @@
+# Снимок первой страницы таблицы клиентов: показ при запуске до обращения к базе
+import json
+import os
+from datetime import datetime
+
+# Меняется при изменении формата; снимок другой версии игнорируется
+SNAPSHOT_VERSION = 2
+ROW_LENGTH = 10
+
+
+class ClientSnapshot:
+    """Первая страница, ширины колонок и выделение на момент выхода.
+
+    Вместе со строками хранится счётчик изменений клиентов (client_changes,
+    его ведут триггеры на любую правку): при запуске снимок показывается
+    сразу, а затем счётчик сравнивается с базой — совпал, значит показанные
+    строки актуальны и перечитывать их не нужно.
+    Испорченный или устаревший по формату снимок просто не загружается.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def save(self, changes, order, rows, cursor, widths, selection):
+        data = {
+            "version": SNAPSHOT_VERSION,
+            "saved_at": datetime.now().isoformat(timespec="seconds"),
+            "changes": int(changes),
+            "order": list(order),
+            "rows": [list(row) for row in rows],
+            "cursor": list(cursor) if cursor is not None else None,
+            "widths": widths,
+            "selection": list(selection),
+        }
+        # Запись через временный файл: прерванный выход не оставит половину снимка
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Ошибка сохранения снимка таблицы: {e}")
+
+    def load(self):
+        """Снимок или None, если его нет или он не читается"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Снимок таблицы не прочитан: {e}")
+            return None
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            return None
+        try:
+            if any(len(row) != ROW_LENGTH for row in data["rows"]):
+                return None
+            data["order"] = (data["order"][0], bool(data["order"][1]))
+            data["cursor"] = tuple(data["cursor"]) if data["cursor"] else None
+            data["widths"] = {str(column): int(width) for column, width in data["widths"].items()}
+            data["selection"] = [str(client_id) for client_id in data["selection"]]
+            data["changes"] = int(data["changes"])
+        except (KeyError, TypeError, ValueError, IndexError, AttributeError):
+            return None
+        return data
+
+    def matches(self, snapshot, changes):
+        """Совпадает ли счётчик изменений снимка с текущим счётчиком базы"""
+        return snapshot is not None and snapshot["changes"] == changes